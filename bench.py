@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+"""
+オフラインのベンチマーク（ネットワークなし）
+合成ページ（既定 1 / 100 / 10000 行）で IPO・ゲオ両方の
+取得（ローカルの再生サーバー経由）・パース・差分・状態保存・メッセージ作成 を計測する。
+行の表現（dict / __slots__ の dataclass / 列ごとの配列）ごとのメモリ使用量と差分の速さ、
+あわせて ipo_bot.py の各コマンドの起動時の読み込み時間（-X importtime）も計測する。
+保存済みのベースラインより BENCH_TOLERANCE 倍以上遅い項目があれば終了コード 1 で失敗する。
+IPO 一覧のパースは置き換える前の find_all 版（tests/reference_ipo_parser.py、html.parser）とも比べ、
+1000行以上で BENCH_PARSE_SPEEDUP 倍以上速くなっていなければ失敗する
+
+使い方:
+    python bench.py                  # 計測してベースラインと比較
+    python bench.py --save           # 計測結果をベースラインとして保存
+    python bench.py --sizes 1,100    # 行数を指定
+    python bench.py --no-startup     # 起動時間の計測を省く
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+
+BENCH_BASELINE = os.environ.get('BENCH_BASELINE', 'bench_baseline.json')
+# ベースラインの何倍までを許容するか
+BENCH_TOLERANCE = float(os.environ.get('BENCH_TOLERANCE', '1.5'))
+# これより小さい差（秒）は計測の揺れとみなして失敗にしない
+BENCH_SLACK = float(os.environ.get('BENCH_SLACK', '0.005'))
+# IPO 一覧のパースが find_all 版より何倍以上速くあるべきか（1000行以上のとき。小さいページは揺れの方が大きい）
+BENCH_PARSE_SPEEDUP = float(os.environ.get('BENCH_PARSE_SPEEDUP', '1.2'))
+SIZES = (1, 100, 10000)
+REFERENCE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tests')
+
+
+def _repeat(n):
+    # 大きいケースは1回が長いので回数を減らし、小さいケースは揺れを抑えるため多めに回す
+    return 3 if n >= 10000 else 9
+
+
+def allocated(build):
+    """build() の戻り値が確保したメモリ（バイト）"""
+    import gc
+    import tracemalloc
+    gc.collect()
+    tracemalloc.start()
+    try:
+        obj = build()
+        size = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    del obj
+    return size
+
+
+def best_of(fn, repeat, setup=None):
+    """setup() の戻り値を fn に渡して repeat 回計測し、最短時間（秒）を返す"""
+    best = None
+    for _ in range(repeat):
+        arg = setup() if setup else None
+        started = time.perf_counter()
+        fn(arg) if setup else fn()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+class Suite:
+    def __init__(self, workdir):
+        self.workdir = workdir
+        # 状態ファイルはすべて作業ディレクトリに作る
+        os.environ['IPO_DEDUP_PATH'] = os.path.join(workdir, 'ipo_known.json')
+        os.environ['IPO_ARCHIVE_DB'] = os.path.join(workdir, 'ipo_archive.db')
+        os.environ['IPO_JOBS_DB'] = os.path.join(workdir, 'jobs.db')
+        os.environ['HTTP_CACHE_DIR'] = os.path.join(workdir, 'http_cache')
+        import metrics
+        # 行ごとのログは計測の邪魔になるので止める
+        metrics.VERBOSE = False
+        from replay import FixtureStore, start_server
+        self.fixtures = FixtureStore()
+        self.server, self.base = start_server(self.fixtures)
+        self.results = {}
+
+    def _path(self, name):
+        return os.path.join(self.workdir, name)
+
+    def record(self, case, n, seconds):
+        self.results[f'{case}@{n}'] = seconds
+        print(f"  {case:<12} {n:>6}行  {seconds * 1e3:9.3f}ms")
+
+    def record_memory(self, case, n, size):
+        self.results[f'mem.{case}@{n}'] = size
+        print(f"  {case:<12} {n:>6}行  {size / 1024:9.1f}KB")
+
+    # ── IPO ─────────────────────────────────────────────
+
+    def run_ipo(self, n):
+        from fetcher import CachedFetcher
+        from ipo_parser import extract_ipo_rows
+        from dedup_store import MemoryDedupStore, FileDedupStore
+        from line_dispatcher import split_text
+        from replay import synthetic_ipo_page
+        from ipo_monitor import IPOMonitor, IPOSnapshot
+        from ipo_archive import IPOArchive
+        from records import IPORecord, IPOBatch
+
+        repeat = _repeat(n)
+        url = f'https://www.ipokiso.com/company/bench{n}.html'
+        self.fixtures.put(url, synthetic_ipo_page(n))
+        local = f'{self.base}/www.ipokiso.com/company/bench{n}.html'
+
+        # 取得: ディスクキャッシュなし（毎回 200 で本文を受け取る）
+        fetcher = CachedFetcher(cache_dir='')
+        self.record('ipo.fetch', n, best_of(lambda: fetcher.fetch(local), repeat))
+        body = fetcher.fetch(local).content
+        fetcher.close()
+
+        self.record('ipo.parse', n, best_of(lambda: extract_ipo_rows(body, base_url=url), repeat))
+        # 置き換える前の find_all 版（当時と同じ html.parser）
+        if REFERENCE_DIR not in sys.path:
+            sys.path.insert(0, REFERENCE_DIR)
+        import reference_ipo_parser
+        self.record('ipo.parse_ref', n, best_of(
+            lambda: reference_ipo_parser.parse_ipo_page(body, 'html.parser'), repeat))
+        rows = extract_ipo_rows(body, base_url=url)
+
+        # 行の表現ごとのメモリ（同じ文字列から作る。dict は従来の形）
+        def as_dicts():
+            return [{'company_name': r.company_name, 'application_period': r.application_period,
+                     'listing_date': r.listing_date, 'offering_price': r.offering_price,
+                     'rating': r.rating.value, 'detail_url': r.detail_url} for r in rows]
+        self.record_memory('ipo.dict', n, allocated(as_dicts))
+        self.record_memory('ipo.record', n, allocated(
+            lambda: [IPORecord.parse(r.company_name, r.application_period, r.listing_date, r.offering_price,
+                                     r.rating, r.detail_url) for r in rows]))
+        self.record_memory('ipo.batch', n, allocated(lambda: IPOBatch.from_records(rows)))
+
+        # 差分: 受付中の判定（列ごとの形を作るところから）→ 通知済みかの照会
+        known = MemoryDedupStore()
+        now = datetime.now()
+
+        def diff():
+            current = {ipo.key: (ipo, ipo.end) for ipo in IPOSnapshot(rows).accepting(now)}
+            known.contains_many(current)
+            return current
+        self.record('ipo.diff', n, best_of(diff, repeat))
+        current = diff()
+
+        # アーカイブ: 空の DB に全行を取り込む
+        def fresh_archive():
+            path = self._path('bench_archive.db')
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+            return IPOArchive(path)
+        self.record('ipo.archive', n, best_of(lambda archive: archive.ingest(IPOSnapshot(rows)),
+                                              repeat, fresh_archive))
+
+        # 状態保存: 受付中の全件を通知済みとしてファイルに書く
+        expiry = {key: ed + timedelta(days=1) for key, (_, ed) in current.items()}
+
+        def fresh_store():
+            path = self._path('bench_known.json')
+            if os.path.exists(path):
+                os.remove(path)
+            return FileDedupStore(path)
+        self.record('ipo.save', n, best_of(lambda store: store.add_many(expiry), repeat, fresh_store))
+
+        monitor = IPOMonitor()
+
+        def build():
+            return [chunk for ipo, _ in current.values() for chunk in split_text(monitor.build_notification(ipo))]
+        self.record('ipo.message', n, best_of(build, repeat))
+
+    # ── ゲオ ────────────────────────────────────────────
+
+    def run_geo(self, n):
+        from fetcher import CachedFetcher
+        from geo_monitor import iter_products, detect_changes, build_digest
+        from geo_store import GeoStateStore
+        from records import Product, ProductBatch
+        from replay import synthetic_geo_page
+
+        repeat = _repeat(n)
+        url = f'https://mvno.geo-mobile.jp/bench{n}/'
+        self.fixtures.put(url, synthetic_geo_page(n, changed_every=100, sold_every=50))
+        local = f'{self.base}/mvno.geo-mobile.jp/bench{n}/'
+        old_html = synthetic_geo_page(n).decode('utf-8')
+
+        fetcher = CachedFetcher(cache_dir='')
+        self.record('geo.fetch', n, best_of(lambda: fetcher.fetch(local), repeat))
+        html = fetcher.fetch(local).text
+        fetcher.close()
+
+        # パース: セレクタのヒントなし（初回と同じ条件）
+        self.record('geo.parse', n, best_of(lambda: list(iter_products(html, {}, url)), repeat))
+        products = list(iter_products(html, {}, url))
+
+        # 前回の状態を作っておく
+        base_log = self._path(f'bench_geo_{n}.jsonl')
+        GeoStateStore(base_log).update('bench', iter_products(old_html, {}, url))
+        old = GeoStateStore(base_log).products('bench')
+
+        self.record_memory('geo.dict', n, allocated(
+            lambda: [{'name': p.name, 'price': p.price, 'in_stock': p.in_stock, 'url': p.url} for p in products]))
+        self.record_memory('geo.record', n, allocated(
+            lambda: [Product.parse(p.name, p.price, p.in_stock, p.url) for p in products]))
+        self.record_memory('geo.batch', n, allocated(lambda: ProductBatch.from_products(products)))
+
+        # 差分: 前回の状態と1件ずつ比べる（監視と同じ stream_changes）
+        self.record('geo.diff', n, best_of(lambda: detect_changes(old, products), repeat))
+        changes = detect_changes(old, products)
+
+        def loaded_store():
+            path = self._path('bench_geo_run.jsonl')
+            shutil.copyfile(base_log, path)
+            return GeoStateStore(path)
+        self.record('geo.save', n, best_of(lambda store: store.update('bench', products), repeat, loaded_store))
+
+        targets = [{'id': 'bench', 'url': url, 'label': 'ベンチ'}]
+        self.record('geo.message', n, best_of(
+            lambda: "\n\n".join(build_digest(targets, {'bench': changes})), repeat))
+
+    def close(self):
+        self.server.shutdown()
+
+
+def compare(results, baseline, tolerance=BENCH_TOLERANCE, slack=BENCH_SLACK):
+    """ベースラインより遅くなった項目のリストを返す"""
+    regressions = []
+    for key, seconds in sorted(results.items()):
+        base = baseline.get(key)
+        if base is None:
+            continue
+        ratio = seconds / base if base else float('inf')
+        status = 'OK'
+        if ratio > tolerance and seconds - base > slack:
+            status = 'REGRESSION'
+            regressions.append(key)
+        if key.startswith('mem.'):
+            print(f"  {key:<20} {seconds / 1024:9.1f}KB  基準 {base / 1024:9.1f}KB  x{ratio:5.2f}  {status}")
+            continue
+        print(f"  {key:<20} {seconds * 1e3:9.3f}ms  基準 {base * 1e3:9.3f}ms  x{ratio:5.2f}  {status}")
+    return regressions
+
+
+def slower_parses(results, speedup=BENCH_PARSE_SPEEDUP):
+    """find_all 版より speedup 倍以上速くなっていない IPO 一覧パースの行数のリスト"""
+    slow = []
+    for key, seconds in sorted(results.items()):
+        case, _, n = key.partition('@')
+        if case != 'ipo.parse' or int(n) < 1000:
+            continue
+        ref = results.get(f'ipo.parse_ref@{n}')
+        if ref is None:
+            continue
+        ratio = ref / seconds if seconds else float('inf')
+        status = 'OK' if ratio >= speedup else 'SLOW'
+        print(f"  ipo.parse@{n:<13} {seconds * 1e3:9.3f}ms  find_all版 {ref * 1e3:9.3f}ms  x{ratio:5.2f}  {status}")
+        if status == 'SLOW':
+            slow.append(key)
+    return slow
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='オフラインのベンチマーク')
+    parser.add_argument('--sizes', default=','.join(map(str, SIZES)))
+    parser.add_argument('--save', action='store_true', help='結果をベースラインとして保存する')
+    parser.add_argument('--baseline', default=BENCH_BASELINE)
+    parser.add_argument('--no-startup', action='store_true', help='起動時間の計測を省く')
+    args = parser.parse_args(argv)
+    baseline_path = os.path.abspath(args.baseline)
+
+    workdir = tempfile.mkdtemp(prefix='bench-')
+    suite = Suite(workdir)
+    try:
+        for n in (int(s) for s in args.sizes.split(',')):
+            print(f"[IPO] {n}行")
+            suite.run_ipo(n)
+            print(f"[ゲオ] {n}行")
+            suite.run_geo(n)
+        if not args.no_startup:
+            import ipo_bot
+            print("[起動時間] -X importtime")
+            for command, seconds in ipo_bot.startup().items():
+                suite.results[f"startup.{command.replace(' ', '-')}"] = seconds
+    finally:
+        suite.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"find_all 版との比較（{BENCH_PARSE_SPEEDUP:g}倍以上速いこと）")
+    slow = slower_parses(suite.results)
+    if slow:
+        print(f"パースが find_all 版より速くなっていません: {', '.join(slow)}"
+              "（lxml が入っているか確認してください）")
+        return 1
+
+    if args.save:
+        baseline = {}
+        if os.path.exists(baseline_path):
+            with open(baseline_path, 'r', encoding='utf-8') as f:
+                baseline = json.load(f)
+        baseline.update(suite.results)
+        with open(baseline_path, 'w', encoding='utf-8') as f:
+            json.dump(dict(sorted(baseline.items())), f, indent=2)
+        print(f"ベースラインを保存しました: {baseline_path}")
+        return 0
+    if not os.path.exists(baseline_path):
+        print(f"ベースライン {baseline_path} がありません。--save で作成してください")
+        return 0
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    print(f"ベースラインとの比較（許容 x{BENCH_TOLERANCE}）")
+    regressions = compare(suite.results, baseline)
+    if regressions:
+        print(f"性能が劣化しています: {', '.join(regressions)}")
+        return 1
+    print("劣化なし")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
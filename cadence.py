@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+ポーリング間隔の自動調整
+- IPO: 申し込みが始まる日・締め切られる日だけ短い間隔で取得し、それ以外の日は1日1回にする
+- ゲオ: 状態ストアに残る商品ごとの変化履歴から変化の頻度を見積もり、
+  よく変わる対象は頻繁に、何日も変わらない対象はまばらに取得する
+どちらもスケジューラーのトリガー（next_after(now) を持つ）として使う
+
+使い方:
+    python cadence.py simulate [--geo-log geo_state.jsonl] [--archive ipo_archive.db]
+"""
+
+import os
+import sys
+import random
+import sqlite3
+import argparse
+from datetime import datetime, time as dtime, timedelta
+from geo_store import GeoStateStore, STATE_LOG
+
+# IPO: 申し込み開始日・締切日の取得間隔（秒）と、その時間帯（時-時）
+IPO_FAST_INTERVAL = int(os.environ.get('IPO_FAST_INTERVAL', '1800'))
+IPO_ACTIVE_HOURS = tuple(int(h) for h in os.environ.get('IPO_ACTIVE_HOURS', '6-22').split('-'))
+# IPO: それ以外の日の取得間隔（秒）
+IPO_SLOW_INTERVAL = int(os.environ.get('IPO_SLOW_INTERVAL', '86400'))
+
+# ゲオ: 取得間隔の下限・上限（秒）と、履歴が足りないときの間隔
+GEO_MIN_INTERVAL = int(os.environ.get('GEO_MIN_INTERVAL', '900'))
+GEO_MAX_INTERVAL = int(os.environ.get('GEO_MAX_INTERVAL', '21600'))
+GEO_DEFAULT_INTERVAL = int(os.environ.get('GEO_DEFAULT_INTERVAL', '3600'))
+# ゲオ: 1時間に1回変わる対象の取得間隔（秒）。変化頻度 r の対象は この値 / √r の間隔になる
+GEO_BASE_INTERVAL = int(os.environ.get('GEO_BASE_INTERVAL', '1500'))
+# ゲオ: 変化の頻度を見積もる期間。これより観測期間が短いうちは既定の間隔で取得する
+GEO_LOOKBACK = timedelta(days=int(os.environ.get('GEO_CADENCE_LOOKBACK_DAYS', '7')))
+GEO_MIN_HISTORY = timedelta(days=1)
+# シミュレーション: 記録された変化時刻は取得時刻なので、実際の変化はその前のこの秒数のどこかで起きたとみなす
+GEO_RECORDED_INTERVAL = 3600
+
+
+# ── IPO ─────────────────────────────────────────────────
+
+def ipo_event_days(windows):
+    """申し込みが始まる日・締め切られる日の set"""
+    days = set()
+    for sd, ed in windows:
+        if sd and ed:
+            days.add(sd.date())
+            days.add(ed.date())
+    return days
+
+
+def next_ipo_poll(windows, now):
+    """windows（(開始, 終了) の並び）から now の次に取得すべき時刻を返す"""
+    fallback = now + timedelta(seconds=IPO_SLOW_INTERVAL)
+    first_hour, last_hour = IPO_ACTIVE_HOURS
+    fast = timedelta(seconds=IPO_FAST_INTERVAL)
+    for day in sorted(d for d in ipo_event_days(windows) if d >= now.date()):
+        begin = datetime.combine(day, dtime(first_hour))
+        end = datetime.combine(day, dtime(last_hour))
+        if now < begin:
+            return min(begin, fallback)
+        slot = begin + fast * ((now - begin) // fast + 1)
+        if slot <= end:
+            return min(slot, fallback)
+    return fallback
+
+
+class IPOCadence:
+    """windows_source() が返す申し込み期間に合わせて次回時刻を決めるトリガー"""
+
+    def __init__(self, windows_source):
+        self.windows_source = windows_source
+
+    def next_after(self, now):
+        return next_ipo_poll(self.windows_source(), now)
+
+    def __repr__(self):
+        return 'ipo-cadence'
+
+
+# ── ゲオ ─────────────────────────────────────────────────
+
+def product_change_times(row):
+    """商品の変化時刻。履歴の最初の1件は初回の記録なので変化に数えない"""
+    return [datetime.fromisoformat(h[0]) for h in (row.get('history') or [])[1:]]
+
+
+def change_rate(change_times, first_seen, now):
+    """1時間あたりの変化回数。観測期間が GEO_MIN_HISTORY に満たなければ None"""
+    if now - first_seen < GEO_MIN_HISTORY:
+        return None
+    since = max(first_seen, now - GEO_LOOKBACK)
+    hours = (now - since).total_seconds() / 3600
+    return sum(1 for t in change_times if since <= t <= now) / hours
+
+
+def target_rate(rows, now):
+    """対象内の全商品の変化頻度の合計（1回の取得で全商品をまとめて見るため）"""
+    times, first_seen = [], None
+    for row in rows.values():
+        history = row.get('history') or []
+        if not history:
+            continue
+        seen = datetime.fromisoformat(history[0][0])
+        first_seen = seen if first_seen is None else min(first_seen, seen)
+        times.extend(product_change_times(row))
+    if first_seen is None:
+        return None
+    return change_rate(times, first_seen, now)
+
+
+def geo_interval(rate):
+    """
+    変化頻度（回/時）から取得間隔（秒）を決める。
+    取得回数の合計を決めたとき、検知遅延の合計が最小になるのは間隔を 1/√r に比例させたとき
+    （1/r に比例させると変化の少ない対象の遅延が大きくなりすぎる）
+    """
+    if rate is None:
+        return GEO_DEFAULT_INTERVAL
+    if rate <= 0:
+        return GEO_MAX_INTERVAL
+    return min(GEO_MAX_INTERVAL, max(GEO_MIN_INTERVAL, GEO_BASE_INTERVAL / rate ** 0.5))
+
+
+class GeoCadence:
+    """状態ストアの変化履歴から次回時刻を決めるトリガー。対象ごとの間隔の最短に合わせる"""
+
+    def __init__(self, path=None, namespaces=None):
+        self.path = path or STATE_LOG
+        self.namespaces = namespaces
+
+    def intervals(self, now):
+        store = GeoStateStore(self.path)
+        namespaces = self.namespaces or store.namespaces()
+        return {ns: geo_interval(target_rate(store.products(ns), now)) for ns in namespaces}
+
+    def next_after(self, now):
+        intervals = self.intervals(now)
+        seconds = min(intervals.values()) if intervals else GEO_DEFAULT_INTERVAL
+        for ns, s in intervals.items():
+            print(f"[CADENCE] {ns}: {s / 60:.0f}分間隔")
+        return now + timedelta(seconds=seconds)
+
+    def __repr__(self):
+        return 'geo-cadence'
+
+
+# ── シミュレーション ─────────────────────────────────────────
+
+def _simulate(changes, start, end, next_poll):
+    """
+    changes（実際の変化時刻の昇順）を start から next_poll(now, detected) の間隔で取得したときの
+    (取得回数, 変化ごとの検知遅延[秒]) を返す。detected はそれまでに検知した時刻の並び
+    """
+    polls, latencies, detected = 0, [], []
+    i, t = 0, start
+    while t <= end or i < len(changes):
+        polls += 1
+        while i < len(changes) and changes[i] <= t:
+            latencies.append((t - changes[i]).total_seconds())
+            detected.append(t)
+            i += 1
+        t = next_poll(t, detected)
+    return polls, latencies
+
+
+def _report(label, polls, latencies):
+    if latencies:
+        mean = sum(latencies) / len(latencies) / 60
+        worst = max(latencies) / 60
+        print(f"  {label}: 取得 {polls}回 / 平均遅延 {mean:.0f}分 / 最大遅延 {worst:.0f}分")
+    else:
+        print(f"  {label}: 取得 {polls}回")
+
+
+def simulate_geo(path):
+    store = GeoStateStore(path)
+    rng = random.Random(0)
+    totals = {'毎時固定': [0, []], '自動調整': [0, []]}
+    for ns in store.namespaces():
+        rows = store.products(ns)
+        firsts = [datetime.fromisoformat(r['history'][0][0]) for r in rows.values() if r.get('history')]
+        if not firsts:
+            continue
+        start = min(firsts)
+        changes = sorted(t - timedelta(seconds=rng.uniform(0, GEO_RECORDED_INTERVAL))
+                         for row in rows.values() for t in product_change_times(row))
+        end = max(changes, default=start)
+        print(f"[ゲオ] {ns}: 商品 {len(rows)}件 / 変化 {len(changes)}件 ({start:%Y-%m-%d} ～ {end:%Y-%m-%d})")
+        results = {
+            '毎時固定': _simulate(changes, start, end, lambda t, _: t + timedelta(hours=1)),
+            '自動調整': _simulate(changes, start, end, lambda t, detected: t + timedelta(
+                seconds=geo_interval(change_rate(detected, start, t)))),
+        }
+        for label, (polls, latencies) in results.items():
+            _report(label, polls, latencies)
+            totals[label][0] += polls
+            totals[label][1].extend(latencies)
+    if len(store.namespaces()) > 1:
+        print("[ゲオ] 全対象")
+        for label, (polls, latencies) in totals.items():
+            _report(label, polls, latencies)
+
+
+def simulate_ipo(path):
+    conn = sqlite3.connect(path)
+    rows = conn.execute('SELECT application_start, application_end, first_seen FROM ipos '
+                        'WHERE application_start IS NOT NULL AND application_end IS NOT NULL').fetchall()
+    conn.close()
+    if not rows:
+        print("[IPO] アーカイブに申し込み期間のある行がありません")
+        return
+    known = sorted((datetime.fromisoformat(seen), (datetime.fromisoformat(sd), datetime.fromisoformat(ed)))
+                   for sd, ed, seen in rows)
+    start = known[0][0]
+    # 検知遅延は「申し込み開始 → 受付中として通知できるまで」で測る
+    openings = sorted(w[0] for _, w in known if w[0] > start)
+    end = max(w[1] for _, w in known)
+    print(f"[IPO] 申し込み開始 {len(openings)}件 ({start:%Y-%m-%d} ～ {end:%Y-%m-%d})")
+
+    def daily(t, _):
+        at = datetime.combine(t.date(), dtime(8))
+        return at if at > t else at + timedelta(days=1)
+
+    def adaptive(t, _):
+        # その時点で一覧に載っていた（アーカイブに現れていた）IPO だけを知っているものとする
+        return next_ipo_poll([w for seen, w in known if seen <= t], t)
+
+    _report('毎朝8時  ', *_simulate(openings, start, end, daily))
+    _report(f'{IPO_FAST_INTERVAL // 60}分固定', *_simulate(
+        openings, start, end, lambda t, _: t + timedelta(seconds=IPO_FAST_INTERVAL)))
+
+    def fixed_active_hours(t, _):
+        # 毎日、開始日・締切日と同じ時間帯だけ同じ間隔で取得する
+        return next_ipo_poll([(t, t + timedelta(days=1))], t)
+
+    _report(f'{IPO_FAST_INTERVAL // 60}分固定({IPO_ACTIVE_HOURS[0]}-{IPO_ACTIVE_HOURS[1]}時)',
+            *_simulate(openings, start, end, fixed_active_hours))
+    _report('自動調整', *_simulate(openings, start, end, adaptive))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='取得間隔の自動調整のシミュレーション')
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('simulate', help='記録済みの履歴を再生して取得回数と検知遅延を比べる')
+    p.add_argument('--geo-log', default=STATE_LOG)
+    p.add_argument('--archive', default=os.environ.get('IPO_ARCHIVE_DB', 'ipo_archive.db'))
+    args = parser.parse_args(argv)
+
+    if os.path.exists(args.geo_log):
+        simulate_geo(args.geo_log)
+    else:
+        print(f"[ゲオ] {args.geo_log} がありません")
+    if os.path.exists(args.archive):
+        simulate_ipo(args.archive)
+    else:
+        print(f"[IPO] {args.archive} がありません")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+申し込み期間（『12/25～12/28』など、年なしの月/日）の解析
+- 正規表現はモジュール読み込み時に1回だけコンパイル
+- (文字列, 基準日) ごとに結果を LRU キャッシュ
+- 年は「基準日から WINDOW_LEAD_DAYS 日後までに始まる、一番新しい年」を選ぶ。
+  申し込み期間が告知されるのは数週間前までなので、それより先の日付は過去（前年以前）の IPO とみなす。
+  12月に翌年1月の期間を、1月に前年12月の期間を読んでもずれない
+"""
+
+import re
+import sys
+import time
+from datetime import datetime, date, timedelta
+from functools import lru_cache
+import metrics
+
+MONTH_DAY_RE = re.compile(r'(\d{1,2})\s*/\s*(\d{1,2})')
+WINDOW_CACHE_SIZE = 4096
+# 基準日から何日先までの開始日を「これからの申し込み期間」とみなすか
+WINDOW_LEAD_DAYS = 60
+
+
+def _resolve_year(month, day, ref):
+    """month/day を、基準日 + WINDOW_LEAD_DAYS 日以前で一番新しい年の datetime で返す"""
+    latest = ref + timedelta(days=WINDOW_LEAD_DAYS)
+    # 2/29 はうるう年まで遡る
+    for year in range(ref.year + 1, ref.year - 8, -1):
+        try:
+            candidate = datetime(year, month, day)
+        except ValueError:
+            continue
+        if candidate.date() <= latest:
+            return candidate
+    raise ValueError(f"存在しない日付: {month}/{day}")
+
+
+@lru_cache(maxsize=WINDOW_CACHE_SIZE)
+def parse_window(raw, ref):
+    """
+    申し込み期間の文字列を (開始, 終了) の datetime にする。解析できなければ (None, None)。
+    ref は年を決めるための基準日（date）
+    """
+    if not raw:
+        return None, None
+    md = MONTH_DAY_RE.findall(raw)
+    if len(md) < 2:
+        if metrics.VERBOSE:
+            print(f"[DEBUG] 期間パース失敗: '{raw}'")
+        return None, None
+    try:
+        (sm, sd), (em, ed) = md[0], md[1]
+        start = _resolve_year(int(sm), int(sd), ref)
+        end = datetime(start.year, int(em), int(ed))
+        if end < start:
+            end = datetime(start.year + 1, int(em), int(ed))
+        return start, end
+    except ValueError as e:
+        if metrics.VERBOSE:
+            print(f"[DEBUG] 日付解析エラー: '{raw}' -> {e}")
+        return None, None
+
+
+def parse_month_day_after(text, start):
+    """上場日『12/25(木)』などを start（申し込み開始日）以降で一番近い日付の date にする"""
+    m = MONTH_DAY_RE.search(text or '')
+    if not m or start is None:
+        return None
+    month, day = int(m.group(1)), int(m.group(2))
+    year = start.year + 1 if month < start.month else start.year
+    try:
+        return date(year, month, day)
+    except ValueError:
+        return None
+
+
+# ── ベンチマーク ───────────────────────────────────────────
+
+def _bench(n):
+    periods = [f"{m}/{d}～{m}/{d + 3}" for m in range(1, 13) for d in range(1, 26)]
+    rows = [periods[i % len(periods)] for i in range(n)]
+    ref = date.today()
+    parse_window.cache_clear()
+    started = time.perf_counter()
+    for raw in rows:
+        parse_window(raw, ref)
+    cold = time.perf_counter() - started
+    started = time.perf_counter()
+    for raw in rows:
+        parse_window(raw, ref)
+    warm = time.perf_counter() - started
+    print(f"{n}行: 初回 {cold * 1e3:.2f}ms / キャッシュ済み {warm * 1e3:.2f}ms")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) >= 2 and sys.argv[1] == 'bench':
+        _bench(int(sys.argv[2]) if len(sys.argv) >= 3 else 100_000)
+    else:
+        print("使い方: python date_window.py bench [行数]")
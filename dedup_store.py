@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+IPO通知の重複防止ストア
+通知済みキー（企業名_申し込み期間）を有効期限付きで保持する。
+- memory: プロセス内だけ（再起動で消える）
+- file:   JSON ファイル（一時ファイル + os.replace でアトミックに書き換え）。
+          操作ごとにロックファイルを flock してから読み直すので、gunicorn の複数ワーカーや
+          cron 実行と同じファイルを共有しても、他のプロセスが記録したキーを消したり見落としたりしない
+- sqlite: SQLite ファイル
+"""
+
+import os
+import json
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:  # Windows ではプロセス間のロックなし（読み直しだけ行う）
+    fcntl = None
+
+IPO_DEDUP_BACKEND = os.environ.get('IPO_DEDUP_BACKEND', 'file')
+IPO_DEDUP_PATH = os.environ.get('IPO_DEDUP_PATH', '')
+
+DEFAULT_PATHS = {
+    'file': 'ipo_known.json',
+    'sqlite': 'ipo_known.db',
+}
+
+
+def _ts(value):
+    return value.timestamp() if isinstance(value, datetime) else value
+
+
+class MemoryDedupStore:
+    def __init__(self):
+        # キー → 有効期限（epoch秒。None は無期限）
+        self._items = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _locked(self):
+        """_items を読み書きする間のロック（file はここでファイルを読み直す）"""
+        with self._lock:
+            yield
+
+    def contains_many(self, keys):
+        """keys のうち既に記録済みのものを set で返す"""
+        with self._locked():
+            return {k for k in keys if k in self._items}
+
+    def __contains__(self, key):
+        return bool(self.contains_many([key]))
+
+    def __len__(self):
+        with self._locked():
+            return len(self._items)
+
+    def keys(self):
+        with self._locked():
+            return set(self._items)
+
+    def add_many(self, items):
+        """items: キー → 有効期限（datetime / epoch秒 / None）"""
+        if not items:
+            return
+        with self._locked():
+            for k, expires_at in items.items():
+                self._items[k] = _ts(expires_at)
+            self._flush()
+
+    def add(self, key, expires_at=None):
+        self.add_many({key: expires_at})
+
+    def purge(self, now=None):
+        """有効期限切れのキーを削除して返す"""
+        now = _ts(now or datetime.now())
+        with self._locked():
+            expired = [k for k, exp in self._items.items() if exp is not None and exp < now]
+            for k in expired:
+                del self._items[k]
+            if expired:
+                self._flush()
+        return expired
+
+    def _flush(self):
+        pass
+
+
+class FileDedupStore(MemoryDedupStore):
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        self.lock_path = f"{path}.lock"
+
+    def _read(self):
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"[{datetime.now()}] 通知済みファイルの読み込みエラー: {e}")
+            return self._items
+
+    @contextmanager
+    def _locked(self):
+        # 他のプロセス（別ワーカー・cron）が書いた分を取り込んでから読み書きする
+        with self._lock, open(self.lock_path, 'a') as lock:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                self._items = self._read()
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _flush(self):
+        tmp = f"{self.path}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self._items, f, ensure_ascii=False, indent=1, sort_keys=True)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+
+class SqliteDedupStore:
+    # IN 句1回あたりのキー数（SQLite の変数上限より十分小さく）
+    BATCH = 500
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS known_ipos (key TEXT PRIMARY KEY, expires_at REAL)'
+        )
+        self._conn.commit()
+
+    def contains_many(self, keys):
+        keys = list(keys)
+        found = set()
+        with self._lock:
+            for i in range(0, len(keys), self.BATCH):
+                chunk = keys[i:i + self.BATCH]
+                marks = ','.join('?' * len(chunk))
+                rows = self._conn.execute(f'SELECT key FROM known_ipos WHERE key IN ({marks})', chunk)
+                found.update(r[0] for r in rows)
+        return found
+
+    def __contains__(self, key):
+        return bool(self.contains_many([key]))
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM known_ipos').fetchone()[0]
+
+    def keys(self):
+        with self._lock:
+            return {r[0] for r in self._conn.execute('SELECT key FROM known_ipos')}
+
+    def add_many(self, items):
+        if not items:
+            return
+        with self._lock, self._conn:
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO known_ipos (key, expires_at) VALUES (?, ?)',
+                [(k, _ts(exp)) for k, exp in items.items()]
+            )
+
+    def add(self, key, expires_at=None):
+        self.add_many({key: expires_at})
+
+    def purge(self, now=None):
+        now = _ts(now or datetime.now())
+        with self._lock, self._conn:
+            expired = [r[0] for r in self._conn.execute(
+                'SELECT key FROM known_ipos WHERE expires_at IS NOT NULL AND expires_at < ?', (now,))]
+            self._conn.execute(
+                'DELETE FROM known_ipos WHERE expires_at IS NOT NULL AND expires_at < ?', (now,))
+        return expired
+
+
+def open_dedup_store(backend=None, path=None):
+    backend = backend or IPO_DEDUP_BACKEND
+    path = path or IPO_DEDUP_PATH or DEFAULT_PATHS.get(backend, '')
+    if backend == 'memory':
+        return MemoryDedupStore()
+    if backend == 'file':
+        return FileDedupStore(path)
+    if backend == 'sqlite':
+        return SqliteDedupStore(path)
+    raise ValueError(f"不明な重複防止ストア: {backend}")
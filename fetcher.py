@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+HTTP取得レイヤー
+- requests.Session を使い回して接続をキープアライブ
+- URLごとのレスポンスをディスクにキャッシュし、ETag / Last-Modified で条件付きGET
+- 304 のときは前回のパース結果をそのまま再利用する
+  （パース結果はパーサーの名前とバージョンと一緒に保存し、パーサーが変わっていれば使わない）
+"""
+
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+from datetime import datetime
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+import metrics
+import fingerprint
+
+HTTP_CACHE_DIR = os.environ.get('HTTP_CACHE_DIR', '.http_cache')
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+}
+
+
+def parser_identity(parse):
+    """
+    パース関数を表す文字列（モジュール名.関数名@バージョン）。
+    バージョンはパース関数のモジュールの PARSER_VERSION（無ければ空）
+    """
+    module = getattr(parse, '__module__', '') or ''
+    name = getattr(parse, '__qualname__', '') or type(parse).__qualname__
+    version = getattr(__import__(module), 'PARSER_VERSION', '') if module else ''
+    return f"{module}.{name}@{version}"
+
+
+CHARSET_RE = re.compile(r'charset\s*=\s*["\']?([\w.:-]+)', re.I)
+META_CHARSET_RE = re.compile(rb'<meta[^>]+charset\s*=\s*["\']?([\w.:-]+)', re.I)
+# Shift_JIS と名乗るページは機種依存文字を含むことが多いので cp932 で読む
+CHARSET_ALIASES = {'shift_jis': 'cp932', 'shift-jis': 'cp932', 'sjis': 'cp932', 'x-sjis': 'cp932',
+                   'windows-31j': 'cp932'}
+
+
+def decode_html(content, content_type=None):
+    """
+    本文の bytes を str にする。文字コードは Content-Type の charset → <meta> の charset →
+    UTF-8 として読めるか → charset_normalizer の推定 の順に決める
+    """
+    declared = [m.group(1) for m in (CHARSET_RE.search(content_type or ''),
+                                      META_CHARSET_RE.search(content[:4096])) if m]
+    for charset in declared:
+        charset = charset.decode('ascii', 'ignore') if isinstance(charset, bytes) else charset
+        try:
+            return content.decode(CHARSET_ALIASES.get(charset.lower(), charset))
+        except (LookupError, UnicodeDecodeError):
+            continue
+    try:
+        return content.decode('utf-8')
+    except UnicodeDecodeError:
+        pass
+    from charset_normalizer import from_bytes
+    best = from_bytes(content).best()
+    return str(best) if best is not None else content.decode('utf-8', errors='replace')
+
+
+class FetchResult:
+    def __init__(self, url, status, content, headers, not_modified=False):
+        self.url = url
+        self.status = status
+        self.content = content
+        self.headers = headers
+        # True のときは 304 を受けてキャッシュ済みの本文を返している
+        self.not_modified = not_modified
+
+    @property
+    def text(self):
+        """ヘッダー・<meta> の文字コードで読んだ本文"""
+        return decode_html(self.content, self.headers.get('Content-Type'))
+
+
+class CachedFetcher:
+    def __init__(self, cache_dir=None, headers=None, timeout=30, pool_size=4, source='http'):
+        # 計測のラベル（ipo / geo など）
+        self.source = source
+        self.cache_dir = cache_dir if cache_dir is not None else HTTP_CACHE_DIR
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers.update(headers or DEFAULT_HEADERS)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.stats = {
+            'requests': 0,
+            'not_modified': 0,
+            'bytes_downloaded': 0,
+            'bytes_saved': 0,
+            'parse_seconds_saved': 0.0,
+        }
+        # 詳細ページの並行取得など、複数スレッドから使われても集計がずれないように
+        self._stats_lock = threading.Lock()
+
+    def _count(self, key, amount=1):
+        with self._stats_lock:
+            self.stats[key] += amount
+        metrics.incr(f'http_{key}', amount, source=self.source)
+
+    # ── キャッシュファイル ──────────────────────────────────
+
+    def _cache_key(self, url):
+        return hashlib.sha1(url.encode('utf-8')).hexdigest()
+
+    def _paths(self, url):
+        key = self._cache_key(url)
+        return (os.path.join(self.cache_dir, f"{key}.json"),
+                os.path.join(self.cache_dir, f"{key}.body"))
+
+    def _load_meta(self, url):
+        """本文を読まずにメタ情報（ETag・パース結果・指紋など）だけを読む"""
+        if not self.cache_dir:
+            return None
+        try:
+            with open(self._paths(url)[0], 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _load_entry(self, url):
+        if not self.cache_dir:
+            return None
+        meta_path, body_path = self._paths(url)
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+            with open(body_path, 'rb') as f:
+                entry['content'] = f.read()
+            return entry
+        except (OSError, ValueError):
+            return None
+
+    def _write_atomic(self, path, data, mode):
+        tmp = f"{path}.tmp"
+        with open(tmp, mode, **({} if 'b' in mode else {'encoding': 'utf-8'})) as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def _save_entry(self, url, entry):
+        if not self.cache_dir:
+            return
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            meta_path, body_path = self._paths(url)
+            meta = {k: v for k, v in entry.items() if k != 'content'}
+            if 'content' in entry:
+                self._write_atomic(body_path, entry['content'], 'wb')
+            self._write_atomic(meta_path, json.dumps(meta, ensure_ascii=False), 'w')
+        except OSError as e:
+            print(f"[{datetime.now()}] HTTPキャッシュ書き込みエラー: {e}")
+
+    # ── 取得 ────────────────────────────────────────────
+
+    def fetch(self, url, timeout=None):
+        """条件付きGET。304 のときはキャッシュ済みの本文を返す"""
+        entry = self._load_entry(url)
+        headers = {}
+        if entry:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        with metrics.timer('fetch', source=self.source):
+            response = self.session.get(url, headers=headers, timeout=timeout or self.timeout)
+        self._count('requests')
+        if response.status_code == 304 and entry:
+            self._count('not_modified')
+            self._count('bytes_saved', len(entry['content']))
+            # 304 には Content-Type が付かないことが多いので、保存しておいたものを補う
+            headers = CaseInsensitiveDict(response.headers)
+            if entry.get('content_type') and 'Content-Type' not in headers:
+                headers['Content-Type'] = entry['content_type']
+            return FetchResult(url, 304, entry['content'], headers, not_modified=True)
+        response.raise_for_status()
+        self._count('bytes_downloaded', len(response.content))
+        self._save_entry(url, {
+            'url': url,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'content_type': response.headers.get('Content-Type'),
+            'fetched_at': datetime.now().isoformat(),
+            'content': response.content,
+        })
+        return FetchResult(url, response.status_code, response.content, response.headers)
+
+    def fetch_parsed(self, url, parse, timeout=None, region=None, dump=None, load=None, version=None):
+        """
+        取得してパースした結果を返す。
+        304 で前回のパース結果がキャッシュにあれば parse を呼ばずにそれを返す。
+        200 でも本文の指紋、または region=(タグ, class) で取り出した部分の指紋が
+        前回と同じなら、やはり前回のパース結果を返す。
+        parse の戻り値は JSON にシリアライズできる必要がある。
+        そうでない場合は dump（保存する形にする）と load（保存した形から戻す）を渡す。
+        version はパーサーを表す文字列（既定は parser_identity(parse)）。
+        保存時と違えば（パーサーの出力が変わっていれば）本文が同じでもパースし直す
+        """
+        version = version or parser_identity(parse)
+        previous = self._load_meta(url) or {}
+        if 'parsed' in previous and previous.get('parser') != version:
+            del previous['parsed']
+        cached = None
+        if 'parsed' in previous:
+            try:
+                cached = load(previous['parsed']) if load else previous['parsed']
+            except (KeyError, TypeError, ValueError):
+                # 保存形式が変わる前のキャッシュ → 使わずにパースし直す
+                del previous['parsed']
+        result = self.fetch(url, timeout=timeout)
+        if result.not_modified and 'parsed' in previous:
+            self._count('parse_seconds_saved', previous.get('parse_seconds', 0.0))
+            return cached
+        current = fingerprint.page_fingerprint(result.content, *(region or ()))
+        kind = fingerprint.match(previous.get('fingerprint'), current) if 'parsed' in previous else None
+        fingerprint.record(self.source, kind)
+        if kind:
+            self._count('parse_seconds_saved', previous.get('parse_seconds', 0.0))
+            parsed, stored, elapsed = cached, previous['parsed'], previous.get('parse_seconds', 0.0)
+        else:
+            started = time.perf_counter()
+            parsed = parse(result.content)
+            elapsed = time.perf_counter() - started
+            metrics.observe('parse', elapsed, source=self.source)
+            stored = dump(parsed) if dump else parsed
+        # fetch() が書いたばかりのメタ（ETag など）にパース結果と指紋を足す
+        entry = self._load_meta(url)
+        if entry is not None:
+            entry['parsed'] = stored
+            entry['parser'] = version
+            entry['parse_seconds'] = elapsed
+            entry['fingerprint'] = current
+            self._save_entry(url, entry)
+        return parsed
+
+    def cached_parsed(self, url, version, load=None):
+        """
+        保存済みのパース結果と、その本文を取得した時刻を返す（サイトには取りに行かない）。
+        無いか、保存時のパーサー（version）が違えば None
+        """
+        entry = self._load_meta(url)
+        if not entry or 'parsed' not in entry or entry.get('parser') != version:
+            return None
+        try:
+            parsed = load(entry['parsed']) if load else entry['parsed']
+            fetched_at = datetime.fromisoformat(entry['fetched_at'])
+        except (KeyError, TypeError, ValueError):
+            return None
+        return parsed, fetched_at
+
+    def close(self):
+        self.session.close()
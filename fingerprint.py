@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+ページの指紋（フィンガープリント）
+- body: 本文そのままのハッシュ（バイト単位で同じか）
+- region: 関係する部分（IPO の表・商品カード）だけを取り出して正規化したハッシュ。
+  広告・計測タグ・CSRF トークン・空白など関係ない部分が変わっても一致する
+どちらかが前回と一致すれば、パース・差分・状態の書き込みを省ける
+正規表現だけで取り出すので、HTML をパースするよりずっと軽い
+"""
+
+import re
+import hashlib
+import metrics
+
+_NOISE_RE = re.compile(r'<!--.*?-->|<(script|style|noscript)\b.*?</\1\s*>', re.S | re.I)
+_SPACE_RE = re.compile(r'\s+')
+_BETWEEN_TAGS_RE = re.compile(r'>\s+<')
+_CLASS_RE = re.compile(r'''\bclass\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>]+))''', re.I)
+_TAG_RE_CACHE = {}
+
+
+def _tag_re(tag):
+    pattern = _TAG_RE_CACHE.get(tag)
+    if pattern is None:
+        pattern = _TAG_RE_CACHE[tag] = re.compile(rf'<(/?)({tag})\b([^>]*)>', re.I)
+    return pattern
+
+
+def _has_class(attrs, cls):
+    m = _CLASS_RE.search(attrs)
+    return bool(m) and cls in (m.group(1) or m.group(2) or m.group(3) or '').split()
+
+
+def element_spans(text, tag, cls=None):
+    """一番外側の <tag>（cls 指定時はその class を持つもの）の (開始, 終了) 位置のリスト"""
+    spans = []
+    depth = 0
+    start = None
+    for m in _tag_re(tag).finditer(text):
+        closing = m.group(1) == '/'
+        if start is None:
+            if not closing and (cls is None or _has_class(m.group(3), cls)):
+                if m.group(3).rstrip().endswith('/'):
+                    # <tag .../> はそれだけで1つの要素
+                    spans.append((m.start(), m.end()))
+                else:
+                    start, depth = m.start(), 1
+            continue
+        if closing:
+            depth -= 1
+        elif not m.group(3).rstrip().endswith('/'):
+            depth += 1
+        if depth == 0:
+            spans.append((start, m.end()))
+            start = None
+    if start is not None:
+        spans.append((start, len(text)))
+    return spans
+
+
+def normalize(text):
+    """コメント・script・style を落とし、空白をまとめる"""
+    text = _NOISE_RE.sub('', text)
+    text = _BETWEEN_TAGS_RE.sub('><', text)
+    return _SPACE_RE.sub(' ', text).strip()
+
+
+def _sha1(data):
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    return hashlib.sha1(data).hexdigest()
+
+
+def page_fingerprint(content, tag=None, cls=None):
+    """
+    {'body': 本文のハッシュ, 'region': 関係部分のハッシュ} を返す。
+    tag を渡さない・該当する要素が無いときは region は None
+    """
+    fingerprint = {'body': _sha1(content), 'region': None}
+    if tag:
+        text = content.decode('utf-8', errors='replace') if isinstance(content, bytes) else content
+        spans = element_spans(text, tag, cls)
+        if spans:
+            fingerprint['region'] = _sha1('\n'.join(normalize(text[s:e]) for s, e in spans))
+    return fingerprint
+
+
+def match(previous, current):
+    """前回と一致した種類（'body' / 'region'）を返す。一致しなければ None"""
+    if not previous:
+        return None
+    if previous.get('body') == current['body']:
+        return 'body'
+    if current.get('region') and previous.get('region') == current['region']:
+        return 'region'
+    return None
+
+
+def record(source, kind):
+    """照合1回分を計測に記録する（kind は match() の戻り値）"""
+    metrics.incr('fingerprint_checks', source=source)
+    if kind:
+        metrics.incr('fingerprint_hits', source=source, kind=kind)
+
+
+def report_hit_rate(source):
+    checks = metrics.METRICS.total('fingerprint_checks', source=source)
+    if not checks:
+        return
+    hits = metrics.METRICS.total('fingerprint_hits', source=source)
+    metrics.log_event('fingerprint', source=source, hits=int(hits), checks=int(checks),
+                      hit_rate=f"{hits / checks:.0%}")
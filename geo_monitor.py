@@ -6,15 +6,39 @@
 
 import os
 import json
+import asyncio
 import re
-from bs4 import BeautifulSoup
-from linebot import LineBotApi
-from linebot.models import TextSendMessage
+import time
+from itertools import chain
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin, urlsplit
+import requests
 from datetime import datetime
-from playwright.sync_api import sync_playwright
+from fetcher import CachedFetcher
+from geo_store import GeoStateStore, product_id
+from records import Product
+from line_dispatcher import get_dispatcher
+import metrics
+import fingerprint
 
 URL = "https://mvno.geo-mobile.jp/uqmobile/smartphone/"
+# 旧形式の状態ファイル（状態は geo_store の JSONL ログに移行済み。残っていれば初回に取り込む）
 STATE_FILE = "geo_state.json"
+# 監視対象の一覧（無ければ URL の1件だけを監視する）
+TARGETS_FILE = os.environ.get("GEO_TARGETS_FILE", "geo_targets.json")
+# 同じホストへ同時に投げるリクエスト数の上限
+PER_HOST_CONCURRENCY = int(os.environ.get("GEO_PER_HOST_CONCURRENCY", "2"))
+# 試す取得バックエンドの順番（前回成功したものは状態に記録され、次回は先頭に来る）
+FETCH_BACKENDS = os.environ.get("GEO_FETCH_BACKENDS", "http,playwright").split(",")
+
+USER_AGENT = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+    "AppleWebKit/537.36 (KHTML, like Gecko) "
+    "Chrome/124.0.0.0 Safari/537.36"
+)
+ACCEPT_LANGUAGE = "ja,en-US;q=0.9,en;q=0.8"
+# ブラウザ取得時に画像・フォント・CSS・計測タグを読み込まない（0 で無効化）
+BLOCK_RESOURCES = os.environ.get("GEO_BLOCK_RESOURCES", "1") != "0"
 
 
 
@@ -22,16 +46,16 @@ STATE_FILE = "geo_state.json"
 
 def send_line(message: str):
     token = os.environ.get("LINE_CHANNEL_ACCESS_TOKEN")
-    user_id = os.environ.get("GEO_LINE_USER_ID")  # IPO BOTとは別の送り先
+    user_id = os.environ.get("GEO_LINE_USER_ID")  # IPO BOTとは別の送り先（カンマ区切りで複数可）
     if not token or not user_id:
         print("[WARN] LINE環境変数が未設定のため通知をスキップ")
         return
-    try:
-        api = LineBotApi(token)
-        api.push_message(user_id, TextSendMessage(text=message))
+    # 5000文字超の分割・再送・流量制御は共通の送信エンジンに任せる
+    user_ids = [u.strip() for u in user_id.split(",") if u.strip()]
+    if get_dispatcher().send(user_ids, message):
         print(f"[LINE] 送信完了: {message[:60]}...")
-    except Exception as e:
-        print(f"[ERROR] LINE送信失敗: {e}")
+    else:
+        print(f"[ERROR] LINE送信失敗: {message[:60]}...")
 
 
 # ── スクレイピング ────────────────────────────────────────
@@ -50,90 +74,117 @@ def is_out_of_stock(element) -> bool:
     return any(kw.lower() in text.lower() for kw in sold_out_keywords)
 
 
-def scrape_products() -> list[dict]:
+# 商品カードのセレクタ候補（優先順）。
+# 2つ目の要素は SoupStrainer 用の (タグ名, class)。前回勝ったパターンが分かっていれば
+# そのコンテナ部分だけをパースしてメモリと時間を節約する
+CARD_PATTERNS = [
+    ("li.p-item", ("li", "p-item")),            # よくあるパターン
+    ("div.item", ("div", "item")),
+    ("ul.products li", ("ul", "products")),
+    (".product-list li", (None, "product-list")),
+    (".item-list li", (None, "item-list")),
+    ("article.product", ("article", "product")),
+    (".smartphone-list .item", (None, "smartphone-list")),
+    (".product_list li", (None, "product_list")),
+]
+NAME_SELECTORS = [".p-item__name", ".item-name", ".product-name", "h2", "h3", "h4"]
+PRICE_SELECTORS = [".p-item__price", ".price", ".item-price", '[class*="price"]']
+
+
+def _strainer_for(card_css: str):
+    for css, (tag, cls) in CARD_PATTERNS:
+        if css == card_css:
+            from bs4 import SoupStrainer
+            return SoupStrainer(tag, class_=cls) if tag else SoupStrainer(class_=cls)
+    return None
+
+
+def _region_for(card_css: str | None):
+    """指紋に使う (タグ名, class)。タグ名が決まらないパターンや未確定なら (None, None)"""
+    for css, (tag, cls) in CARD_PATTERNS:
+        if css == card_css and tag:
+            return tag, cls
+    return None, None
+
+
+def _resolve_cards(html: str, cached_css: str | None):
+    """カード要素のリストと勝ったセレクタを返す。前回のセレクタを優先して試す"""
+    # bs4 は実際にパースするときだけ読み込む（指紋一致の実行では不要）
+    from bs4 import BeautifulSoup
+    if cached_css:
+        strainer = _strainer_for(cached_css)
+        if strainer is not None:
+            cards = BeautifulSoup(html, "html.parser", parse_only=strainer).select(cached_css)
+            if cards:
+                return cards, cached_css, None
+    # キャッシュが無い or 外れた → ページ全体をパースして優先順に探す
+    soup = BeautifulSoup(html, "html.parser")
+    for css, _ in CARD_PATTERNS:
+        cards = soup.select(css)
+        if cards:
+            return cards, css, soup
+    return [], None, soup
+
+
+def _resolve_selector(cards, selectors: list[str], cached: str | None):
     """
-    ゲオモバイルのスマホ一覧ページをスクレイピングして商品リストを返す。
-
-    返り値の例:
-    [
-        {
-            "name": "iPhone 15 128GB",
-            "price": "49,800円",
-            "in_stock": True,
-            "url": "https://..."
-        },
-        ...
-    ]
+    ページ全体で使うセレクタを1つ決める。前回のセレクタが全カードに当たればそれを使い、
+    そうでなければ過半数のカードに当たるもののうち優先順で先のもの（無ければ一番多く当たるもの）を選ぶ。
+    1枚のカードだけのフォールバックでは決め直さない（商品名が変わると商品IDも変わるため）
     """
-    with sync_playwright() as p:
-        browser = p.chromium.launch(headless=True)
-        context = browser.new_context(
-            user_agent=(
-                "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-                "AppleWebKit/537.36 (KHTML, like Gecko) "
-                "Chrome/124.0.0.0 Safari/537.36"
-            ),
-            locale="ja-JP",
-            extra_http_headers={
-                "Accept-Language": "ja,en-US;q=0.9,en;q=0.8",
-            }
-        )
-        page = context.new_page()
-        response = page.goto(URL, wait_until="networkidle", timeout=60000)
-
-        if response.status == 403:
-            print(f"[ERROR] 403 Forbidden: Playwrightでもアクセスを拒否されました")
-            browser.close()
-            return []
+    if cached in selectors and all(card.select_one(cached) is not None for card in cards):
+        return cached
+    best, best_hits = None, 0
+    for css in selectors:
+        hits = sum(card.select_one(css) is not None for card in cards)
+        if hits * 2 > len(cards):
+            return css
+        if hits > best_hits:
+            best, best_hits = css, hits
+    return best
+
+
+def _select_first(card, selectors: list[str], chosen: str | None):
+    """ページで決めたセレクタを使い、このカードに無いときだけ優先順にフォールバックする"""
+    if chosen:
+        el = card.select_one(chosen)
+        if el is not None:
+            return el
+    for css in selectors:
+        if css == chosen:
+            continue
+        el = card.select_one(css)
+        if el is not None:
+            return el
+    return None
 
-        html = page.content()
-        browser.close()
 
-    soup = BeautifulSoup(html, "html.parser")
-
-    products = []
-
-    # --- パターン1: li.p-item や div.item など一般的な商品カード ---
-    # 実際のクラス名はサイトに合わせて調整が必要
-    # デバッグ用に取得できたカード数を出力する
-    candidates = (
-        soup.select("li.p-item")          # よくあるパターン
-        or soup.select("div.item")
-        or soup.select("ul.products li")
-        or soup.select(".product-list li")
-        or soup.select(".item-list li")
-        or soup.select("article.product")
-        or soup.select(".smartphone-list .item")
-        or soup.select(".product_list li")
-    )
+def iter_products(html: str, hint: dict | None = None, url: str = URL):
+    """
+    一覧ページのHTMLから Product を1件ずつ返すジェネレータ。
+    hint にはページ単位で決めたセレクタ（card / name / price）が書き込まれ、次回の実行で再利用される。
+    """
+    hint = hint if hint is not None else {}
+    cards, card_css, soup = _resolve_cards(html, hint.get("card"))
 
-    print(f"[SCRAPE] 商品カード候補: {len(candidates)}件 (URL: {URL})")
+    print(f"[SCRAPE] 商品カード候補: {len(cards)}件 (URL: {url}, セレクタ: {card_css})")
 
-    if not candidates:
+    if not cards:
         # フォールバック: <a> タグで商品リンクを探す
         print("[SCRAPE] カード要素が見つからずフォールバック処理へ")
         _debug_dump(soup)
-        return []
+        return
+    hint["card"] = card_css
+    name_css = hint["name"] = _resolve_selector(cards, NAME_SELECTORS, hint.get("name"))
+    price_css = hint["price"] = _resolve_selector(cards, PRICE_SELECTORS, hint.get("price"))
 
-    for card in candidates:
+    for card in cards:
         # 商品名
-        name_el = (
-            card.select_one(".p-item__name")
-            or card.select_one(".item-name")
-            or card.select_one(".product-name")
-            or card.select_one("h2")
-            or card.select_one("h3")
-            or card.select_one("h4")
-        )
+        name_el = _select_first(card, NAME_SELECTORS, name_css)
         name = name_el.get_text(strip=True) if name_el else ""
 
         # 価格
-        price_el = (
-            card.select_one(".p-item__price")
-            or card.select_one(".price")
-            or card.select_one(".item-price")
-            or card.select_one('[class*="price"]')
-        )
+        price_el = _select_first(card, PRICE_SELECTORS, price_css)
         price = normalize_price(price_el.get_text(strip=True)) if price_el else ""
 
         # 在庫
@@ -144,24 +195,264 @@ def scrape_products() -> list[dict]:
         product_url = ""
         if link_el:
             href = link_el["href"]
-            product_url = href if href.startswith("http") else f"https://mvno.geo-mobile.jp{href}"
+            product_url = href if href.startswith("http") else urljoin(url, href)
 
         if not name:
             continue
 
-        products.append({
-            "name": name,
-            "price": price,
-            "in_stock": in_stock,
-            "url": product_url,
-        })
-        print(f"  [{'+' if in_stock else '-'}] {name} / {price}")
+        if metrics.VERBOSE:
+            print(f"  [{'+' if in_stock else '-'}] {name} / {price}")
+        yield Product.parse(name, price, in_stock, product_url)
+
+
+# ── 取得バックエンド ──────────────────────────────────────
+
+class HttpBackend:
+    """素の HTTP で取得する（セッション使い回し + 条件付きGET）。403 のときは None"""
+    name = "http"
+
+    def __init__(self):
+        self.fetcher = CachedFetcher(headers={
+            "User-Agent": USER_AGENT,
+            "Accept-Language": ACCEPT_LANGUAGE,
+        }, source="geo")
+
+    def fetch(self, url: str, wait_selector: str | None = None) -> str | None:
+        try:
+            result = self.fetcher.fetch(url)
+        except requests.HTTPError as e:
+            if e.response is not None and e.response.status_code == 403:
+                print(f"[ERROR] 403 Forbidden: HTTPでのアクセスを拒否されました")
+                return None
+            raise
+        # 文字コードはヘッダー・<meta> に従う（UTF-8 決め打ちだと商品名が化けて商品IDが変わる）
+        return result.text
+
+    def close(self):
+        self.fetcher.close()
+
+
+class PlaywrightBackend:
+    """
+    ヘッドレス Chromium で描画してから取得する。403 のときは None。
+    ブラウザとコンテキストは最初の fetch で起動し、close() まで使い回す。
+    画像・フォント・CSS・計測ビーコンなど HTML 以外のリクエストはルーティングで遮断する。
+    """
+    name = "playwright"
+    BLOCKED_RESOURCE_TYPES = {"image", "media", "font", "stylesheet", "beacon", "ping"}
+    BLOCKED_URL_KEYWORDS = (
+        "google-analytics", "googletagmanager", "doubleclick", "facebook.net",
+        "yahoo.co.jp/s/", "clarity.ms", "hotjar", "criteo",
+    )
+
+    def __init__(self, block_resources: bool = BLOCK_RESOURCES):
+        self.block_resources = block_resources
+        self._playwright = None
+        self._browser = None
+        self._context = None
+
+    def _ensure_context(self):
+        if self._context is not None:
+            return self._context
+        # ブラウザが必要になったときだけ読み込む
+        from playwright.sync_api import sync_playwright
+
+        self._playwright = sync_playwright().start()
+        self._browser = self._playwright.chromium.launch(headless=True)
+        self._context = self._browser.new_context(
+            user_agent=USER_AGENT,
+            locale="ja-JP",
+            extra_http_headers={
+                "Accept-Language": ACCEPT_LANGUAGE,
+            }
+        )
+        if self.block_resources:
+            self._context.route("**/*", self._route)
+        return self._context
+
+    def _route(self, route):
+        request = route.request
+        if (request.resource_type in self.BLOCKED_RESOURCE_TYPES
+                or any(kw in request.url for kw in self.BLOCKED_URL_KEYWORDS)):
+            route.abort()
+        else:
+            route.continue_()
+
+    def fetch(self, url: str, wait_selector: str | None = None) -> str | None:
+        """
+        wait_selector（前回勝った商品カードのセレクタ）が分かっていれば
+        DOM 構築後にその要素の出現だけを待ち、networkidle を待たない
+        """
+        page = self._ensure_context().new_page()
+        try:
+            if wait_selector:
+                response = page.goto(url, wait_until="domcontentloaded", timeout=60000)
+            else:
+                response = page.goto(url, wait_until="networkidle", timeout=60000)
+
+            if response.status == 403:
+                print(f"[ERROR] 403 Forbidden: Playwrightでもアクセスを拒否されました")
+                return None
+
+            if wait_selector:
+                try:
+                    page.wait_for_selector(wait_selector, timeout=15000)
+                except Exception:
+                    # セレクタが変わった可能性 → 従来どおり通信が落ち着くまで待つ
+                    page.wait_for_load_state("networkidle", timeout=60000)
+
+            return page.content()
+        finally:
+            page.close()
+
+    def close(self):
+        if self._context is not None:
+            self._context.close()
+        if self._browser is not None:
+            self._browser.close()
+        if self._playwright is not None:
+            self._playwright.stop()
+        self._playwright = self._browser = self._context = None
+
+
+BACKENDS = {
+    HttpBackend.name: HttpBackend,
+    PlaywrightBackend.name: PlaywrightBackend,
+}
+
+
+class BackendPool:
+    """
+    取得バックエンドを使い回すためのプール。
+    デーモン・バッチ実行では1つのプールを複数回の scrape_products に渡すと、
+    HTTP セッションやブラウザを起動し直さずに済む。
+    """
+    def __init__(self, backends: list | None = None):
+        # backends を渡すとそのインスタンスを使う（記録の再生などで差し替える用）
+        self._backends = {b.name: b for b in backends or []}
+
+    def get(self, name: str):
+        backend = self._backends.get(name)
+        if backend is None:
+            backend = self._backends[name] = BACKENDS[name]()
+        return backend
+
+    def close(self):
+        for backend in self._backends.values():
+            try:
+                backend.close()
+            except Exception as e:
+                print(f"[WARN] {backend.name} の終了処理でエラー: {e}")
+        self._backends.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class GeoRunner:
+    """
+    デーモン用。1つの BackendPool を専用スレッドで持ち続け、run() のたびに監視を1回行う。
+    Playwright の同期 API は起動したスレッドでしか使えないため、取得も close() も同じスレッドで行う
+    """
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="geo")
+        self._pool: BackendPool | None = None
+
+    def _run(self):
+        if self._pool is None:
+            self._pool = BackendPool()
+        main(self._pool)
+
+    def run(self):
+        self._executor.submit(self._run).result()
+
+    def _close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool = None
+
+    def close(self):
+        # 実行中の監視があれば、それが終わってから閉じる
+        self._executor.submit(self._close).result()
+        self._executor.shutdown()
+
 
-    return products
+def _backend_order(preferred: str | None, allowed: list[str] | None = None) -> list[str]:
+    names = [n.strip() for n in FETCH_BACKENDS if n.strip() in BACKENDS]
+    if allowed is not None:
+        names = [n for n in names if n in allowed]
+    if preferred in names:
+        names.remove(preferred)
+        names.insert(0, preferred)
+    return names
 
 
-def _debug_dump(soup: BeautifulSoup):
+def scrape_products(meta: dict | None = None, pool: BackendPool | None = None,
+                    url: str = URL, backends: list[str] | None = None):
+    """
+    ゲオモバイルのスマホ一覧ページをスクレイピングして商品を1件ずつ返すジェネレータ。
+    バックエンドを順に試し、403 や商品カード0件なら次のバックエンドにフォールバックする。
+    成功したバックエンド名は meta["backend"] に記録される。
+    ページ（または商品カードの部分）の指紋が前回と同じなら何も返さず meta["unchanged"] を立てる。
+    pool を渡さない場合は、この呼び出しの間だけ使うプールを作って最後に閉じる。
+    backends を渡すと、試すバックエンドをその中に限定する。
+
+    返り値の要素の例:
+        Product(name="iPhone 15 128GB", price="49,800円", in_stock=True, url="https://...", yen=49800)
+    """
+    meta = meta if meta is not None else {}
+    hint = meta.setdefault("selectors", {})
+    owns_pool = pool is None
+    pool = pool or BackendPool()
+    try:
+        for name in _backend_order(meta.get("backend"), backends):
+            backend = pool.get(name)
+            started = time.perf_counter()
+            try:
+                html = backend.fetch(url, wait_selector=hint.get("card"))
+            except Exception as e:
+                print(f"[ERROR] {name} での取得に失敗: {e}")
+                html = None
+            elapsed = time.perf_counter() - started
+            if html:
+                fp = fingerprint.page_fingerprint(html, *_region_for(hint.get("card")))
+                kind = fingerprint.match(meta.get("fingerprint"), fp)
+                fingerprint.record("geo", kind)
+                if kind:
+                    # 前回と同じページ → パースも差分も状態の書き込みも要らない
+                    metrics.observe("backend", elapsed, source="geo", backend=name)
+                    metrics.log_event("backend", url=url, backend=name, latency=f"{elapsed:.2f}s",
+                                      status=f"unchanged({kind})")
+                    meta["backend"] = name
+                    meta["unchanged"] = True
+                    return
+            products = iter_products(html, hint, url) if html else iter(())
+            first = next(products, None)
+            status = "ok" if first is not None else ("empty" if html else "failed")
+            metrics.observe("backend", elapsed, source="geo", backend=name)
+            metrics.log_event("backend", url=url, backend=name, latency=f"{elapsed:.2f}s", status=status)
+            if first is None:
+                continue
+            meta["backend"] = name
+            if fp["region"] is None:
+                # 初回などセレクタが未確定だったときは、パースで決まったカードの部分で取り直す
+                fp = fingerprint.page_fingerprint(html, *_region_for(hint.get("card")))
+            meta["fingerprint"] = fp
+            yield first
+            yield from products
+            return
+    finally:
+        if owns_pool:
+            pool.close()
+
+
+def _debug_dump(soup: "BeautifulSoup | None"):
     """スクレイピング失敗時にページ構造のヒントを出力"""
+    if soup is None:
+        return
     print("[DEBUG] ページ内の主要クラス一覧（最大30件）:")
     seen = set()
     for tag in soup.find_all(True, limit=300):
@@ -174,89 +465,256 @@ def _debug_dump(soup: BeautifulSoup):
 
 # ── 状態管理 ─────────────────────────────────────────────
 
-def load_state() -> dict:
-    if os.path.exists(STATE_FILE):
-        with open(STATE_FILE, "r", encoding="utf-8") as f:
+# 旧形式の状態ファイル内でセレクタのキャッシュなどを保持していた予約キー
+META_KEY = "__meta__"
+
+
+def _read_state_file(path: str) -> dict:
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
             return json.load(f)
     return {}
 
 
-def save_state(products: list[dict]):
-    state = {p["name"]: {"price": p["price"], "in_stock": p["in_stock"]} for p in products}
-    with open(STATE_FILE, "w", encoding="utf-8") as f:
-        json.dump(state, f, ensure_ascii=False, indent=2)
-    print(f"[STATE] {STATE_FILE} を更新しました ({len(state)}件)")
+def load_state(path: str = STATE_FILE) -> dict:
+    """旧形式の状態ファイル（商品名 → {price, in_stock}）を読む"""
+    state = _read_state_file(path)
+    state.pop(META_KEY, None)
+    return state
+
+
+def load_meta(path: str = STATE_FILE) -> dict:
+    return _read_state_file(path).get(META_KEY, {})
+
+
+def _migrate_legacy(store: GeoStateStore, target: dict):
+    """ストアにまだ無い対象は、旧形式の状態ファイルがあれば取り込む"""
+    path = target.get("state_file")
+    if store.has_namespace(target["id"]) or not path or not os.path.exists(path):
+        return
+    store.import_legacy(target["id"], load_state(path), load_meta(path))
+    print(f"[STATE] {path} を {store.path} に取り込みました")
 
 
 # ── 差分検出 & 通知 ───────────────────────────────────────
 
-def detect_changes(old: dict, new_products: list[dict]) -> list[str]:
-    """変化があった商品のメッセージリストを返す"""
+def _price_message(name: str, old_price: str, price: str, url: str) -> str:
+    return (
+        f"💰 価格変動\n"
+        f"  {name}\n"
+        f"  {old_price} → {price}\n"
+        f"  {url}"
+    )
+
+
+def _restock_message(name: str, price: str, url: str) -> str:
+    return (
+        f"✅ 再入荷\n"
+        f"  {name}\n"
+        f"  価格: {price}\n"
+        f"  {url}"
+    )
+
+
+def _changes_for(old_entry: dict | None, p: Product) -> list[str]:
+    if old_entry is None:
+        # 初回取得 or 新規商品 → 通知しない（初回登録のみ）
+        return []
     messages = []
 
-    for p in new_products:
-        name = p["name"]
-        old_entry = old.get(name)
+    # 価格変動（金額で比べるので「49,800円」と「49800円」のような表記の違いでは通知しない）
+    if p.price and p.price_differs(old_entry["price"]):
+        messages.append(_price_message(p.name, old_entry["price"], p.price, p.url))
 
-        if old_entry is None:
-            # 初回取得 or 新規商品 → 通知しない（初回登録のみ）
-            continue
+    # 在庫切れ → 再入荷
+    if not old_entry["in_stock"] and p.in_stock:
+        messages.append(_restock_message(p.name, p.price, p.url))
 
-        # 価格変動
-        if old_entry["price"] != p["price"] and p["price"]:
-            messages.append(
-                f"💰 価格変動\n"
-                f"  {name}\n"
-                f"  {old_entry['price']} → {p['price']}\n"
-                f"  {p['url']}"
-            )
-
-        # 在庫切れ → 再入荷
-        if not old_entry["in_stock"] and p["in_stock"]:
-            messages.append(
-                f"✅ 再入荷\n"
-                f"  {name}\n"
-                f"  価格: {p['price']}\n"
-                f"  {p['url']}"
-            )
-
-        # 在庫あり → 在庫切れ（必要なら通知。コメントアウトで無効化可）
-        # if old_entry["in_stock"] and not p["in_stock"]:
-        #     messages.append(f"❌ 在庫切れ: {name}")
+    # 在庫あり → 在庫切れ（必要なら通知。コメントアウトで無効化可）
+    # if old_entry["in_stock"] and not p.in_stock:
+    #     messages.append(f"❌ 在庫切れ: {p.name}")
 
     return messages
 
 
-# ── メイン ────────────────────────────────────────────────
+def detect_changes(old: dict, new_products) -> list[str]:
+    """
+    変化があった商品のメッセージリストを返す（new_products は Product のイテラブル）。
+    old は商品ID → 前回の行。check_target と同じく stream_changes で1件ずつ比べる
+    """
+    messages = []
+    for _ in stream_changes(old, new_products, messages):
+        pass
+    return messages
 
-def main():
-    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    print(f"[{now}] ゲオモバイル監視開始")
 
-    old_state = load_state()
+def stream_changes(old: dict, products, messages: list[str]):
+    """商品を流しながら差分メッセージを messages に溜める（store.update と1パスで併用する）"""
+    for p in products:
+        messages.extend(_changes_for(old.get(product_id(p)), p))
+        yield p
+
+
+# ── 監視対象 ─────────────────────────────────────────────
+
+def load_targets(path: str = TARGETS_FILE) -> list[dict]:
+    """
+    監視対象の一覧を読み込む。各要素は
+        {"id": "...", "url": "...", "label": "..."}
+    状態はストア内で対象ID ごとの名前空間に分けて保存する。
+    state_file に旧形式の状態ファイルを指定すると、初回にそれを取り込む。
+    """
+    if not os.path.exists(path):
+        return [{"id": "default", "url": URL, "label": "", "state_file": STATE_FILE}]
+    with open(path, "r", encoding="utf-8") as f:
+        targets = json.load(f)
+    for t in targets:
+        t.setdefault("label", t["id"])
+    return targets
+
+
+def check_target(target: dict, pool: BackendPool, store: GeoStateStore,
+                 backends: list[str] | None = None) -> list[str] | None:
+    """
+    1つの監視対象を取得して差分を検出し、変わった行だけをストアに追記する。
+    変化のメッセージリストを返す。商品を1件も取得できなかったときは None
+    """
+    ns = target["id"]
+    old_state = store.products(ns)
+    meta = dict(store.meta(ns))
     is_first_run = len(old_state) == 0
 
-    products = scrape_products()
-    if not products:
-        print("[WARN] 商品情報を取得できませんでした。スクレイピングの調整が必要です。")
-        return
+    products = scrape_products(meta, pool, target["url"], backends)
+    first = next(products, None)
+    if first is None:
+        if meta.pop("unchanged", False):
+            print(f"[INFO] {ns}: ページに変化がないので差分検出を省きました")
+            return []
+        return None
+    products = chain([first], products)
 
     if is_first_run:
-        print(f"[INFO] 初回実行: {len(products)}件を記録しました（通知なし）")
-        save_state(products)
-        return
+        with metrics.timer("diff", source="geo"):
+            count, _ = store.update(ns, products, meta)
+        metrics.incr("rows", count, source="geo")
+        print(f"[INFO] 初回実行: {ns} の {count}件を記録しました（通知なし）")
+        return []
 
-    changes = detect_changes(old_state, products)
+    # 差分検出と状態保存を商品ストリーム1パスで行う
+    changes = []
+    # 商品はストリームで流れてくるので、この計測にはパースも含まれる
+    with metrics.timer("diff", source="geo"):
+        count, written = store.update(ns, stream_changes(old_state, products, changes), meta)
+    metrics.incr("rows", count, source="geo")
+    metrics.incr("changes", len(changes), source="geo")
+    print(f"[STATE] {ns}: {count}件中 {written}行を追記しました")
+    return changes
+
+
+async def _run_http_phase(targets: list[dict], pool: BackendPool,
+                          store: GeoStateStore) -> dict[str, list[str] | None]:
+    """HTTP での取得をホストごとに同時実行数を絞ってスレッドで並行実行する"""
+    results: dict[str, list[str] | None] = {}
+    limits: dict[str, asyncio.Semaphore] = {}
+    pool.get(HttpBackend.name)  # スレッドから使う前に生成しておく
+
+    async def run_one(target):
+        host = urlsplit(target["url"]).netloc
+        sem = limits.setdefault(host, asyncio.Semaphore(PER_HOST_CONCURRENCY))
+        async with sem:
+            try:
+                results[target["id"]] = await asyncio.to_thread(
+                    check_target, target, pool, store, [HttpBackend.name])
+            except Exception as e:
+                print(f"[ERROR] {target['id']} の監視に失敗: {e}")
+                results[target["id"]] = None
+
+    await asyncio.gather(*(run_one(t) for t in targets))
+    return results
+
+
+def run_targets(targets: list[dict], pool: BackendPool, store: GeoStateStore) -> dict[str, list[str] | None]:
+    """
+    全対象を監視し、対象ID → 変化メッセージ（取得失敗は None）を返す。
+    まず HTTP で全対象を並行に取得し、全体の所要時間を一番遅いページ程度に抑える。
+    Playwright（同期API）はイベントループの外・起動したスレッドでしか使えないため、
+    HTTP で取れなかった対象と前回ブラウザが必要だった対象だけを後から順番に処理する。
+    """
+    for target in targets:
+        _migrate_legacy(store, target)
+    browser_first = {t["id"] for t in targets
+                     if store.meta(t["id"]).get("backend") == PlaywrightBackend.name}
+    results: dict[str, list[str] | None] = {}
+    if HttpBackend.name in _backend_order(None):
+        http_targets = [t for t in targets if t["id"] not in browser_first]
+        results.update(asyncio.run(_run_http_phase(http_targets, pool, store)))
+
+    for target in targets:
+        if results.get(target["id"]) is not None:
+            continue
+        # HTTP で失敗済みの対象は HTTP を除いたバックエンドで再試行する
+        tried_http = target["id"] in results
+        others = [n for n in _backend_order(None) if not (tried_http and n == HttpBackend.name)]
+        try:
+            results[target["id"]] = check_target(target, pool, store, others)
+        except Exception as e:
+            print(f"[ERROR] {target['id']} の監視に失敗: {e}")
+            results[target["id"]] = None
+    return results
+
+
+def build_digest(targets: list[dict], results: dict[str, list[str] | None]) -> list[str]:
+    """全対象の変化を1通分のメッセージ本文（セクションのリスト）にまとめる"""
+    sections = []
+    for target in targets:
+        changes = results.get(target["id"])
+        if not changes:
+            continue
+        if len(targets) > 1:
+            sections.append(f"【{target['label']}】\n" + "\n\n".join(changes))
+        else:
+            sections.extend(changes)
+    return sections
+
+
+# ── メイン ────────────────────────────────────────────────
 
+def main(pool: BackendPool | None = None):
+    """
+    全対象を1回監視する。pool を渡すとそのバックエンドを使い回し、閉じずに残す
+    （渡さなければこの実行の間だけのプールを作って最後に閉じる）
+    """
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    print(f"[{now}] ゲオモバイル監視開始")
+
+    targets = load_targets()
+    started = time.perf_counter()
+    store = GeoStateStore()
+    owned = pool is None
+    pool = pool or BackendPool()
+    try:
+        results = run_targets(targets, pool, store)
+    finally:
+        if owned:
+            pool.close()
+    store.compact_if_needed()
+    metrics.log_event("run", source="geo", targets=len(targets), elapsed=f"{time.perf_counter() - started:.2f}s")
+
+    for target in targets:
+        if results.get(target["id"]) is None:
+            print(f"[WARN] {target['id']}: 商品情報を取得できませんでした。スクレイピングの調整が必要です。")
+
+    changes = build_digest(targets, results)
     if changes:
         header = f"📱 ゲオモバイル 変更通知\n({now})\n\n"
         body = "\n\n".join(changes)
         send_line(header + body)
-        print(f"[INFO] {len(changes)}件の変化を通知しました")
+        print(f"[INFO] {sum(len(c or []) for c in results.values())}件の変化を通知しました")
     else:
         print("[INFO] 変化なし")
 
-    save_state(products)
+    fingerprint.report_hit_rate("geo")
+    metrics.report()
     print(f"[{now}] ゲオモバイル監視完了")
 
 
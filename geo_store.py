@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+ゲオモバイル監視の状態ストア（追記専用 JSONL）
+- 1行 = 1レコード。変化した商品・消えた商品・メタ情報だけを追記する
+- 起動時にログを再生して「対象ID（名前空間）→ 商品ID → 最新行」を組み立てる
+- 価格・在庫の履歴をタイムスタンプ付きで保持する
+- 行数が生きている商品数に比べて増えすぎたら書き直して圧縮する
+
+レコード形式:
+    {"op": "put",  "ns": 対象ID, "id": 商品ID, "name": ..., "price": ..., "in_stock": ..., "t": ...}
+    {"op": "del",  "ns": 対象ID, "id": 商品ID, "t": ...}
+    {"op": "meta", "ns": 対象ID, "meta": {...}}
+"""
+
+import os
+import sys
+import json
+import re
+import time
+import threading
+from datetime import datetime
+import metrics
+from records import Product
+
+STATE_LOG = os.environ.get("GEO_STATE_LOG", "geo_state.jsonl")
+# 商品ごとに残す履歴の件数
+HISTORY_LIMIT = int(os.environ.get("GEO_HISTORY_LIMIT", "50"))
+# ログ行数が「生きている行数 × COMPACT_RATIO + COMPACT_MIN_LINES」を超えたら圧縮する
+COMPACT_RATIO = 2
+COMPACT_MIN_LINES = 1000
+
+_SPACES_RE = re.compile(r"\s+")
+
+
+def product_key(name: str) -> str:
+    """商品名 → 商品の安定ID。表記ゆれ（空白の違い）で別商品扱いにならないよう正規化する"""
+    return _SPACES_RE.sub(" ", name).strip()
+
+
+def product_id(p: Product) -> str:
+    return product_key(p.name)
+
+
+def _now() -> str:
+    return datetime.now().isoformat(timespec="seconds")
+
+
+class GeoStateStore:
+    def __init__(self, path: str = STATE_LOG):
+        self.path = path
+        self._rows: dict[str, dict[str, dict]] = {}
+        self._meta: dict[str, dict] = {}
+        self._lines = 0
+        self._lock = threading.Lock()
+        self._load()
+
+    # ── 読み込み ──────────────────────────────────────────
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with metrics.timer("state_io", source="geo", op="load"), open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    self._replay(json.loads(line))
+                except ValueError:
+                    # 書き込み途中で落ちた最終行などは読み飛ばす
+                    print(f"[STATE] 壊れた行を読み飛ばしました: {line[:60]!r}")
+                    continue
+                self._lines += 1
+
+    def _replay(self, rec: dict):
+        op, ns = rec["op"], rec["ns"]
+        if op == "meta":
+            self._meta[ns] = rec["meta"]
+            return
+        rows = self._rows.setdefault(ns, {})
+        if op == "del":
+            rows.pop(rec["id"], None)
+            return
+        row = rows.get(rec["id"])
+        history = rec.get("history")
+        if history is None:
+            history = row["history"] if row else []
+            history.append([rec["t"], rec["price"], rec["in_stock"]])
+            del history[:-HISTORY_LIMIT]
+        rows[rec["id"]] = {
+            "name": rec["name"],
+            "price": rec["price"],
+            "in_stock": rec["in_stock"],
+            "t": rec["t"],
+            "history": history,
+        }
+
+    # ── 参照 ────────────────────────────────────────────
+
+    def namespaces(self) -> list[str]:
+        return list(self._rows)
+
+    def has_namespace(self, ns: str) -> bool:
+        return ns in self._rows or ns in self._meta
+
+    def products(self, ns: str) -> dict[str, dict]:
+        """商品ID → 最新行（"price" / "in_stock" / "history" など）。コピーせずそのまま返す"""
+        return self._rows.get(ns, {})
+
+    def meta(self, ns: str) -> dict:
+        return self._meta.get(ns, {})
+
+    # ── 書き込み ──────────────────────────────────────────
+
+    def _append(self, records: list[dict]):
+        if not records:
+            return
+        data = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records)
+        with self._lock:
+            with metrics.timer("state_io", source="geo", op="append"), open(self.path, "a", encoding="utf-8") as f:
+                f.write(data)
+            for r in records:
+                self._replay(r)
+            self._lines += len(records)
+
+    def update(self, ns: str, products, meta: dict | None = None) -> tuple[int, int]:
+        """
+        商品のイテラブルを消費しながら、前回から変わった行・消えた行・メタだけを追記する。
+        (今回の商品数, 書き込んだレコード数) を返す
+        """
+        rows = self.products(ns)
+        t = _now()
+        records = []
+        seen = set()
+        for p in products:
+            pid = product_id(p)
+            seen.add(pid)
+            row = rows.get(pid)
+            if row is not None and not p.price_differs(row["price"]) and row["in_stock"] == p.in_stock:
+                continue
+            records.append({"op": "put", "ns": ns, "id": pid, "name": p.name,
+                            "price": p.price, "in_stock": p.in_stock, "t": t})
+        for pid in rows.keys() - seen:
+            records.append({"op": "del", "ns": ns, "id": pid, "t": t})
+        if meta is not None and meta != self._meta.get(ns):
+            records.append({"op": "meta", "ns": ns, "meta": json.loads(json.dumps(meta))})
+        self._append(records)
+        return len(seen), len(records)
+
+    def import_legacy(self, ns: str, state: dict, meta: dict | None = None):
+        """旧形式（geo_state.json: 商品名 → {price, in_stock}）の状態を取り込む"""
+        products = (Product.parse(name, entry.get("price", ""), entry.get("in_stock", True))
+                    for name, entry in state.items())
+        self.update(ns, products, meta)
+
+    def live_rows(self) -> int:
+        return sum(len(rows) for rows in self._rows.values()) + len(self._meta)
+
+    def compact_if_needed(self) -> bool:
+        if self._lines <= self.live_rows() * COMPACT_RATIO + COMPACT_MIN_LINES:
+            return False
+        self.compact()
+        return True
+
+    def compact(self):
+        """生きている行（履歴込み）だけでログを書き直す"""
+        with self._lock, metrics.timer("state_io", source="geo", op="compact"):
+            tmp = f"{self.path}.tmp"
+            lines = 0
+            with open(tmp, "w", encoding="utf-8") as f:
+                for ns, meta in self._meta.items():
+                    f.write(json.dumps({"op": "meta", "ns": ns, "meta": meta}, ensure_ascii=False) + "\n")
+                    lines += 1
+                for ns, rows in self._rows.items():
+                    for pid, row in rows.items():
+                        f.write(json.dumps({"op": "put", "ns": ns, "id": pid, **row}, ensure_ascii=False) + "\n")
+                        lines += 1
+            os.replace(tmp, self.path)
+            self._lines = lines
+        print(f"[STATE] {self.path} を圧縮しました ({lines}行)")
+
+
+# ── ベンチマーク ───────────────────────────────────────────
+
+def _bench(n: int):
+    """n件の商品で 読み込み / 差分 / 保存 の所要時間を測る"""
+    import tempfile
+    path = os.path.join(tempfile.mkdtemp(), "bench_state.jsonl")
+    products = [Product.parse(f"端末{i}", f"{10000 + i:,}円") for i in range(n)]
+
+    store = GeoStateStore(path)
+    started = time.perf_counter()
+    store.update("bench", products)
+    print(f"初回保存 {n}件: {time.perf_counter() - started:.3f}s")
+
+    # 1% だけ価格を変える
+    for i in range(0, n, 100):
+        products[i] = Product.parse(products[i].name, "1円")
+    started = time.perf_counter()
+    store = GeoStateStore(path)
+    print(f"読み込み: {time.perf_counter() - started:.3f}s")
+    started = time.perf_counter()
+    old = store.products("bench")
+    changed = [p for p in products if p.price_differs(old[product_id(p)]["price"])]
+    print(f"差分: {time.perf_counter() - started:.3f}s ({len(changed)}件変化)")
+    started = time.perf_counter()
+    _, written = store.update("bench", products)
+    print(f"保存: {time.perf_counter() - started:.3f}s ({written}行追記)")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] == "bench":
+        _bench(int(sys.argv[2]) if len(sys.argv) >= 3 else 100_000)
+    else:
+        print("使い方: python geo_store.py bench [件数]")
@@ -1,22 +1,11 @@
 #!/usr/bin/env python3
 """
 GitHub Actions用 IPOチェックスクリプト
-毎朝8時に実行される
+毎朝8時15分に実行される（毎時00分のゲオ監視と重ならないようにずらしている）
+（python ipo_bot.py ipo check と同じ。Flask などの Web 用の依存は読み込まない）
 """
 
-import os
-from app import IPOMonitor
-
-def main():
-    print(f"[{os.environ.get('TZ', 'UTC')}] GitHub Actions IPOチェック開始")
-    
-    # 環境変数から設定を読み込み
-    monitor = IPOMonitor()
-    
-    # 毎日朝8時のチェックを実行
-    monitor.daily_morning_check()
-    
-    print(f"[{os.environ.get('TZ', 'UTC')}] GitHub Actions IPOチェック完了")
+from ipo_monitor import main
 
 if __name__ == '__main__':
     main()
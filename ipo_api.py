@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+IPO一覧の読み取り専用API用キャッシュ
+スナップショットが更新されるたびに索引と JSON を作り直し、
+リクエスト時は作成済みのバイト列と ETag を返すだけにする
+"""
+
+import json
+import bisect
+import hashlib
+import threading
+from date_window import parse_month_day_after
+
+# クエリ結果（JSON バイト列）を覚えておく件数
+QUERY_MEMO_SIZE = 256
+
+
+class IPOIndex:
+    """1つのスナップショットから作る不変の索引"""
+
+    def __init__(self, snapshot=None):
+        self.fetched_at = snapshot.fetched_at if snapshot else None
+        self.rows = []
+        self.windows = []
+        self.by_rating = {}
+        self.by_listing = []  # (上場日, 行番号) を日付順に
+        if snapshot is None:
+            return
+        for pos, (ipo, (sd, ed)) in enumerate(snapshot.iter_windows()):
+            listing = parse_month_day_after(ipo.listing_date, sd)
+            self.rows.append({
+                **ipo.to_dict(),
+                'application_start': sd.date().isoformat() if sd else None,
+                'application_end': ed.date().isoformat() if ed else None,
+                'listing_on': listing.isoformat() if listing else None,
+            })
+            self.windows.append((sd, ed))
+            self.by_rating.setdefault(ipo.rating.value, []).append(pos)
+            if listing:
+                self.by_listing.append((listing, pos))
+        self.by_listing.sort()
+
+    def positions(self, rating=None, listed_from=None, listed_to=None, current_at=None):
+        positions = None
+        if rating:
+            positions = set(self.by_rating.get(rating.upper(), ()))
+        if listed_from or listed_to:
+            lo = bisect.bisect_left(self.by_listing, (listed_from,)) if listed_from else 0
+            hi = bisect.bisect_right(self.by_listing, (listed_to, len(self.rows))) if listed_to else len(self.by_listing)
+            in_range = {pos for _, pos in self.by_listing[lo:hi]}
+            positions = in_range if positions is None else positions & in_range
+        if current_at is not None:
+            current = {pos for pos, (sd, ed) in enumerate(self.windows)
+                       if sd and ed and sd <= current_at <= ed}
+            positions = current if positions is None else positions & current
+        if positions is None:
+            return range(len(self.rows))
+        return sorted(positions)
+
+
+class IPOCache:
+    def __init__(self):
+        self._index = IPOIndex()
+        self._memo = {}
+        self._lock = threading.Lock()
+
+    @property
+    def fetched_at(self):
+        """今の索引の元になったスナップショットの取得時刻（まだ無ければ None）"""
+        return self._index.fetched_at
+
+    def update(self, snapshot):
+        """スナップショット更新時に呼ばれる。索引を作り直し、JSON のメモを捨てる"""
+        index = IPOIndex(snapshot)
+        with self._lock:
+            self._index = index
+            self._memo = {}
+
+    def render(self, rating=None, listed_from=None, listed_to=None, current_at=None):
+        """(JSON バイト列, ETag) を返す。同じ結果になる問い合わせは作成済みのものを返す"""
+        with self._lock:
+            index, memo = self._index, self._memo
+        positions = tuple(index.positions(rating, listed_from, listed_to, current_at))
+        # 「今受付中か」は時刻で変わるので、時刻ではなく該当行の組で覚える
+        cached = memo.get(positions)
+        if cached is not None:
+            return cached
+        body = json.dumps({
+            'fetched_at': index.fetched_at.isoformat() if index.fetched_at else None,
+            'count': len(positions),
+            'ipos': [index.rows[pos] for pos in positions],
+        }, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        etag = hashlib.sha1(body).hexdigest()
+        if len(memo) >= QUERY_MEMO_SIZE:
+            memo.clear()
+        memo[positions] = (body, etag)
+        return body, etag
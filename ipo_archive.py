@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+IPO履歴アーカイブ（SQLite）
+スナップショットごとの行を (企業名, 申し込み期間) をキーに upsert する。
+内容が変わった行だけを書き込み、評価の変化は rating_history に残す。
+
+使い方:
+    python ipo_archive.py upcoming [--from YYYY-MM-DD]
+    python ipo_archive.py count --rating S --from 2026-07-01 --to 2026-09-30
+    python ipo_archive.py history 企業名
+"""
+
+import os
+import sys
+import sqlite3
+import argparse
+import threading
+from datetime import datetime, date
+from date_window import parse_month_day_after
+from records import NO_DATE
+
+IPO_ARCHIVE_DB = os.environ.get('IPO_ARCHIVE_DB', 'ipo_archive.db')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS ipos (
+    company_name TEXT NOT NULL,
+    application_period TEXT NOT NULL,
+    application_start TEXT,
+    application_end TEXT,
+    listing_date TEXT,
+    listing_on TEXT,
+    offering_price TEXT,
+    rating TEXT,
+    first_seen TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    PRIMARY KEY (company_name, application_period)
+);
+CREATE INDEX IF NOT EXISTS ipos_listing_on ON ipos (listing_on);
+CREATE INDEX IF NOT EXISTS ipos_rating_start ON ipos (rating, application_start);
+CREATE INDEX IF NOT EXISTS ipos_window ON ipos (application_start, application_end);
+
+CREATE TABLE IF NOT EXISTS rating_history (
+    company_name TEXT NOT NULL,
+    application_period TEXT NOT NULL,
+    rating TEXT,
+    observed_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS rating_history_company ON rating_history (company_name, observed_at);
+
+CREATE TRIGGER IF NOT EXISTS ipos_rating_insert AFTER INSERT ON ipos BEGIN
+    INSERT INTO rating_history VALUES (NEW.company_name, NEW.application_period, NEW.rating, NEW.updated_at);
+END;
+CREATE TRIGGER IF NOT EXISTS ipos_rating_update AFTER UPDATE OF rating ON ipos
+WHEN NEW.rating IS NOT OLD.rating BEGIN
+    INSERT INTO rating_history VALUES (NEW.company_name, NEW.application_period, NEW.rating, NEW.updated_at);
+END;
+'''
+
+# 値が1つでも変わったときだけ更新する upsert
+UPSERT = '''
+INSERT INTO ipos (company_name, application_period, application_start, application_end,
+                  listing_date, listing_on, offering_price, rating, first_seen, updated_at)
+VALUES (:company_name, :application_period, :application_start, :application_end,
+        :listing_date, :listing_on, :offering_price, :rating, :now, :now)
+ON CONFLICT (company_name, application_period) DO UPDATE SET
+    application_start = excluded.application_start,
+    application_end = excluded.application_end,
+    listing_date = excluded.listing_date,
+    listing_on = excluded.listing_on,
+    offering_price = excluded.offering_price,
+    rating = excluded.rating,
+    updated_at = excluded.updated_at
+WHERE application_start IS NOT excluded.application_start
+   OR application_end IS NOT excluded.application_end
+   OR listing_date IS NOT excluded.listing_date
+   OR offering_price IS NOT excluded.offering_price
+   OR rating IS NOT excluded.rating
+'''
+
+
+class IPOArchive:
+    def __init__(self, path=None):
+        self.path = path or IPO_ARCHIVE_DB
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript(SCHEMA)
+
+    def ingest(self, snapshot):
+        """スナップショットの行を取り込み、書き込んだ（新規・変更）行数を返す"""
+        now = snapshot.fetched_at.isoformat(timespec='seconds')
+        # 行ごとの dict を経由せず、列ごとの形（IPOBatch）からそのまま組み立てる
+        batch = snapshot.batch
+        text = batch.text
+        params = []
+        for i, (start, end) in enumerate(zip(batch.starts, batch.ends)):
+            sd = date.fromordinal(start) if start != NO_DATE else None
+            listing = parse_month_day_after(text['listing_date'][i], sd)
+            params.append({
+                'company_name': text['company_name'][i],
+                'application_period': text['application_period'][i],
+                'application_start': sd.isoformat() if sd else None,
+                'application_end': date.fromordinal(end).isoformat() if end != NO_DATE else None,
+                'listing_date': text['listing_date'][i],
+                'listing_on': listing.isoformat() if listing else None,
+                'offering_price': text['offering_price'][i],
+                'rating': str(batch.rating(i)),
+                'now': now,
+            })
+        with self._lock, self._conn:
+            # rowcount はトリガー（rating_history）の書き込みを含まない
+            written = self._conn.executemany(UPSERT, params).rowcount
+        if written:
+            print(f"[{datetime.now()}] アーカイブを更新: {written}件")
+        return written
+
+    # ── 問い合わせ ────────────────────────────────────────
+
+    def _query(self, sql, args=()):
+        with self._lock:
+            return [dict(r) for r in self._conn.execute(sql, args)]
+
+    def upcoming_listings(self, since=None, limit=50):
+        since = (since or date.today()).isoformat()
+        return self._query(
+            'SELECT * FROM ipos WHERE listing_on >= ? ORDER BY listing_on LIMIT ?', (since, limit))
+
+    def opened_between(self, start, end, rating=None):
+        """申し込み開始日が [start, end] の IPO（rating で絞り込み可）"""
+        sql = 'SELECT * FROM ipos WHERE application_start BETWEEN ? AND ?'
+        args = [start.isoformat(), end.isoformat()]
+        if rating:
+            sql += ' AND rating = ?'
+            args.append(rating.upper())
+        return self._query(sql + ' ORDER BY application_start', args)
+
+    def count_opened(self, start, end, rating=None):
+        sql = 'SELECT COUNT(*) AS n FROM ipos WHERE application_start BETWEEN ? AND ?'
+        args = [start.isoformat(), end.isoformat()]
+        if rating:
+            sql += ' AND rating = ?'
+            args.append(rating.upper())
+        return self._query(sql, args)[0]['n']
+
+    def rating_history(self, company_name):
+        return self._query(
+            'SELECT * FROM rating_history WHERE company_name = ? ORDER BY observed_at', (company_name,))
+
+    def close(self):
+        self._conn.close()
+
+
+# ── CLI ─────────────────────────────────────────────────
+
+def _date_arg(value):
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='IPO履歴アーカイブの検索')
+    parser.add_argument('--db', default=None, help='アーカイブのパス（既定: IPO_ARCHIVE_DB）')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('upcoming', help='これから上場する IPO')
+    p.add_argument('--from', dest='since', type=_date_arg)
+    p.add_argument('--limit', type=int, default=50)
+
+    p = sub.add_parser('count', help='期間内に申し込みが始まった IPO の件数')
+    p.add_argument('--from', dest='start', type=_date_arg, required=True)
+    p.add_argument('--to', dest='end', type=_date_arg, required=True)
+    p.add_argument('--rating')
+
+    p = sub.add_parser('history', help='企業の評価の履歴')
+    p.add_argument('company_name')
+
+    args = parser.parse_args(argv)
+    archive = IPOArchive(args.db)
+    if args.command == 'upcoming':
+        for r in archive.upcoming_listings(args.since, args.limit):
+            print(f"{r['listing_on']}  {r['company_name']}  評価:{r['rating']}  公募:{r['offering_price']}")
+    elif args.command == 'count':
+        print(archive.count_opened(args.start, args.end, args.rating))
+    elif args.command == 'history':
+        for r in archive.rating_history(args.company_name):
+            print(f"{r['observed_at']}  {r['application_period']}  評価:{r['rating']}")
+    archive.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
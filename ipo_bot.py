@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+IPO監視BOT / ゲオモバイル監視のまとめたコマンド
+サブコマンドが使うモジュールだけを読み込む（cron 実行で Flask や Playwright を読み込まない）
+
+使い方:
+    python ipo_bot.py ipo check              # IPO の朝のチェックを1回（GitHub Actions 用）
+    python ipo_bot.py geo check              # ゲオ監視を1回（GitHub Actions 用）
+    python ipo_bot.py serve                  # スケジューラーと Web サーバー（Railway 用）
+    python ipo_bot.py ipo archive ...        # 履歴アーカイブの検索（ipo_archive.py と同じ）
+    python ipo_bot.py geo cadence ...        # 取得間隔のシミュレーション（cadence.py と同じ）
+    python ipo_bot.py replay ... / bench ... # 記録の再生・ベンチマーク
+    python ipo_bot.py startup                # 各コマンドの起動時の読み込み時間（-X importtime）
+"""
+
+import os
+import sys
+
+# コマンド → (モジュール, 関数, 残りの引数を渡すか, 説明)
+COMMANDS = {
+    ('ipo', 'check'): ('ipo_monitor', 'main', False, 'IPO の朝のチェックを1回実行する'),
+    ('ipo', 'archive'): ('ipo_archive', 'main', True, '履歴アーカイブを検索する'),
+    ('geo', 'check'): ('geo_monitor', 'main', False, 'ゲオ監視を1回実行する'),
+    ('geo', 'cadence'): ('cadence', 'main', True, '取得間隔の自動調整をシミュレーションする'),
+    ('serve',): ('app', 'serve', False, 'スケジューラーと Web サーバーを起動する'),
+    ('replay',): ('replay', 'main', True, '取得結果の記録と再生'),
+    ('bench',): ('bench', 'main', True, 'オフラインのベンチマーク'),
+}
+# 起動時間を計測するコマンド（bench.py でベースラインと比べる）
+STARTUP_COMMANDS = ('ipo check', 'geo check', 'serve')
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def resolve(words):
+    """
+    引数の先頭からコマンドを探し、(呼び出す関数, 残りの引数) を返す。
+    モジュールはここで初めて読み込む
+    """
+    if isinstance(words, str):
+        words = words.split()
+    for key, (module, func, takes_args, _) in sorted(COMMANDS.items(), key=lambda kv: -len(kv[0])):
+        if tuple(words[:len(key)]) == key:
+            rest = list(words[len(key):])
+            target = getattr(__import__(module), func)
+            if takes_args:
+                return (lambda: target(rest)), rest
+            if rest:
+                raise SystemExit(f"{' '.join(key)} は引数を取りません: {' '.join(rest)}")
+            return target, rest
+    raise SystemExit(usage())
+
+
+def usage():
+    lines = ['使い方: python ipo_bot.py <コマンド>']
+    for key, (_, _, takes_args, help_text) in COMMANDS.items():
+        lines.append(f"  {' '.join(key) + (' ...' if takes_args else ''):<16} {help_text}")
+    lines.append(f"  {'startup':<16} 各コマンドの起動時の読み込み時間を表示する")
+    return '\n'.join(lines)
+
+
+def import_profile(command):
+    """
+    command を解決するまで（モジュールの読み込みだけ）を別プロセスの -X importtime で計測し、
+    (合計秒, [(累積秒, パッケージ名)] 重い順) を返す。
+    合計はトップレベルの読み込みの和、内訳はこのリポジトリ以外のパッケージ
+    """
+    import subprocess
+    script = f"import ipo_bot; ipo_bot.resolve({command!r})"
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', script],
+                          cwd=HERE, capture_output=True, text=True, check=True)
+    total = 0.0
+    packages = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        _, cumulative, name = line.split('|')
+        if not cumulative.strip().isdigit():
+            continue
+        seconds = int(cumulative) / 1e6
+        if not name.startswith('  '):
+            total += seconds
+        name = name.strip()
+        if '.' not in name and not name.startswith('_') and not os.path.exists(os.path.join(HERE, f'{name}.py')):
+            packages.append((seconds, name))
+    packages.sort(reverse=True)
+    return total, packages
+
+
+def startup(repeat=5):
+    """コマンドごとに読み込み時間を repeat 回計測し、最短を表示して {コマンド: 秒} を返す"""
+    results = {}
+    for command in STARTUP_COMMANDS:
+        best = None
+        for _ in range(repeat):
+            total, modules = import_profile(command)
+            if best is None or total < best[0]:
+                best = (total, modules)
+        results[command] = best[0]
+        heavy = ', '.join(f"{name} {seconds * 1e3:.0f}ms" for seconds, name in best[1][:5])
+        print(f"  {command:<10} {best[0] * 1e3:8.1f}ms  ({heavy})")
+    return results
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] in ('-h', '--help'):
+        print(usage())
+        return 0
+    if argv == ['startup']:
+        startup()
+        return 0
+    func, _ = resolve(argv)
+    return func()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
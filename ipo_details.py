@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+IPO詳細ページの取得
+一覧の各企業リンクをたどり、主幹事・公開株数・当選本数を行に補う
+- スレッドプールで並行に取得し、ホストごとの同時接続数は IPO_DETAIL_PER_HOST までに絞る
+- 取得は CachedFetcher 経由（URL ごとのディスクキャッシュ + ETag / Last-Modified の条件付きGET）。
+  前回から変わっていないページは 304 になり、本文もパースもやり直さない
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import urlsplit
+from ipo_parser import extract_detail_fields
+
+IPO_DETAIL_WORKERS = int(os.environ.get('IPO_DETAIL_WORKERS', '4'))
+IPO_DETAIL_PER_HOST = int(os.environ.get('IPO_DETAIL_PER_HOST', '2'))
+
+
+class DetailCrawler:
+    def __init__(self, fetcher, max_workers=None, per_host=None):
+        self.fetcher = fetcher
+        self.per_host = per_host or IPO_DETAIL_PER_HOST
+        self._executor = ThreadPoolExecutor(max_workers=max_workers or IPO_DETAIL_WORKERS,
+                                            thread_name_prefix='detail')
+        self._limits = {}
+        self._limits_lock = threading.Lock()
+
+    def _host_limit(self, url):
+        host = urlsplit(url).netloc
+        with self._limits_lock:
+            sem = self._limits.get(host)
+            if sem is None:
+                sem = self._limits[host] = threading.BoundedSemaphore(self.per_host)
+            return sem
+
+    def _fetch(self, url):
+        with self._host_limit(url):
+            return self.fetcher.fetch_parsed(url, extract_detail_fields)
+
+    def fetch_all(self, urls):
+        """URL → 詳細情報の dict。取得に失敗した URL は含めない"""
+        urls = list(dict.fromkeys(u for u in urls if u))
+        before = dict(self.fetcher.stats)
+        futures = {url: self._executor.submit(self._fetch, url) for url in urls}
+        details = {}
+        for url, future in futures.items():
+            try:
+                details[url] = future.result()
+            except Exception as e:
+                print(f"[{datetime.now()}] 詳細ページ取得エラー: {url} -> {e}")
+        if urls:
+            not_modified = self.fetcher.stats['not_modified'] - before['not_modified']
+            print(f"[{datetime.now()}] 詳細ページ {len(details)}/{len(urls)}件を取得（未更新 {not_modified}件）")
+        return details
+
+    def enrich(self, rows):
+        """detail_url を持つ IPORecord に詳細情報を足した新しい行のリストを返す"""
+        details = self.fetch_all(row.detail_url for row in rows)
+        return [row.with_details(details.get(row.detail_url)) for row in rows]
+
+    def close(self):
+        self._executor.shutdown(wait=False)
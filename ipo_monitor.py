@@ -0,0 +1,382 @@
+#!/usr/bin/env python3
+"""
+IPO監視の本体（サイトの取得・申し込み期間の判定・LINE通知）
+Web（app.py）にも cron 実行（python ipo_bot.py ipo check）にも使う。
+Flask やスケジューラーは読み込まない
+"""
+
+import os
+import threading
+from datetime import datetime, date, timedelta
+from fetcher import CachedFetcher
+from dedup_store import open_dedup_store
+from line_dispatcher import get_dispatcher
+from records import IPOBatch
+from ipo_sources import build_sources, merge_sources, SourceAggregator, SourceResult, SourceUnavailable
+from ipo_details import DetailCrawler
+import metrics
+import fingerprint
+
+# LINE Bot設定（環境変数 or GitHub Secrets から読み込む）
+# LINE_USER_ID はカンマ区切りで複数指定でき、その場合は multicast で送る
+LINE_USER_ID = os.environ.get('LINE_USER_ID', '')
+# スナップショットの鮮度（秒）。この時間内の再チェックはサイトを再取得しない
+IPO_SNAPSHOT_TTL = int(os.environ.get('IPO_SNAPSHOT_TTL', '300'))
+# 通知済みキーは申し込み終了日からこの日数だけ保持してから消す
+IPO_DEDUP_GRACE_DAYS = int(os.environ.get('IPO_DEDUP_GRACE_DAYS', '1'))
+# 申し込みが終わっていない IPO の詳細ページ（主幹事・公開株数・当選本数）も取得する（0 で無効）
+IPO_DETAILS = os.environ.get('IPO_DETAILS', '1') != '0'
+
+class IPOSnapshot:
+    """1回の取得結果（IPORecord の行 + 申し込み期間）をまとめて保持する"""
+    def __init__(self, rows, windows=None, fetched_at=None, sources=None):
+        self.rows = rows
+        # 情報源ごとの取得結果（ipo_sources.SourceReport）
+        self.sources = sources
+        self._windows = windows
+        self.fetched_at = fetched_at or datetime.now()
+        self._batch = None
+
+    @property
+    def windows(self):
+        """rows と同じ並びの (start, end)。パース失敗時は (None, None)"""
+        if self._windows is None:
+            self._windows = [(ipo.start, ipo.end) for ipo in self.rows]
+        return self._windows
+
+    @property
+    def batch(self):
+        """列ごとの形（アーカイブへの一括書き込みに使う）。初回に1回だけ作る"""
+        if self._batch is None:
+            self._batch = IPOBatch.from_records(self.rows)
+        return self._batch
+
+    def age(self, now=None):
+        return ((now or datetime.now()) - self.fetched_at).total_seconds()
+
+    def is_fresh(self, ttl, now=None):
+        return self.age(now) <= ttl
+
+    def iter_windows(self):
+        return zip(self.rows, self.windows)
+
+    def accepting(self, now=None):
+        now = now or datetime.now()
+        return [ipo for ipo in self.rows if ipo.start and ipo.end and ipo.start <= now <= ipo.end]
+
+class IPOMonitor:
+    def __init__(self):
+        # LINE送信はプロセス内で共有する送信エンジン経由（まとめ送り・再送・流量制御）
+        self.line = get_dispatcher()
+        # IPO 一覧の情報源（IPO_SOURCES）。通知のリンクには先頭のサイトを使う
+        self.sources = build_sources()
+        self.aggregator = SourceAggregator(self.sources)
+        self.url = self.sources[0].url
+        self.headers = {
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+        }
+        self.fetcher = CachedFetcher(headers=self.headers, source='ipo')
+        self.details = DetailCrawler(self.fetcher)
+        # 通知済みの IPO（再起動しても残るよう IPO_DEDUP_BACKEND のストアに保存）
+        self.known_ipos = open_dedup_store()
+        self.last_check = None
+        self.snapshot_ttl = IPO_SNAPSHOT_TTL
+        self._snapshot = None
+        self._snapshot_lock = threading.Lock()
+        self._check_lock = threading.Lock()
+        # スナップショット更新時に呼ぶ関数（API 用キャッシュの更新など）
+        self.snapshot_listeners = []
+
+    def scrape_ipo_data(self):
+        """
+        全情報源を並行に取得して統合した SourceReport を返す。
+        1つも取得できなければ SourceUnavailable（「IPOなし」と区別する）
+        """
+        print(f"[{datetime.now()}] IPOサイトからデータを取得中...（{', '.join(s.name for s in self.sources)}）")
+        report = self.aggregator.collect(self.fetcher)
+        for result in report.results:
+            if result.ok:
+                print(f"[{datetime.now()}] {result.name}: {len(result.rows)}件（{result.seconds:.1f}秒）")
+            else:
+                print(f"[{datetime.now()}] {result.name}: 取得できませんでした（{result.error}）")
+        for d in report.disagreements:
+            values = ' / '.join(f"{name}={value}" for name, value in d['values'].items())
+            print(f"[{datetime.now()}] 情報源の食い違い: {d['company_name']} {d['field']}: {values}")
+        if not report.healthy:
+            raise SourceUnavailable('; '.join(f"{r.name}: {r.error}" for r in report.results))
+        print(f"[{datetime.now()}] {len(report.rows)}件のIPO情報を取得しました")
+        return report
+
+    def refresh_snapshot(self):
+        # 期間はパース時に解析済み（IPORecord.start / end）
+        report = self.scrape_ipo_data()
+        ipo_list = self.enrich_details(report.rows)
+        metrics.incr('rows', len(ipo_list), source='ipo')
+        previous = self._snapshot
+        snapshot = IPOSnapshot(ipo_list, sources=report)
+        self._snapshot = snapshot
+        if previous is not None and previous.rows == ipo_list:
+            # 内容が前回と同じなら API 用キャッシュやアーカイブを作り直さない
+            metrics.incr('snapshot_unchanged', source='ipo')
+            return snapshot
+        for listener in self.snapshot_listeners:
+            try:
+                listener(snapshot)
+            except Exception as e:
+                print(f"[{datetime.now()}] スナップショット通知エラー: {e}")
+        return snapshot
+
+    def enrich_details(self, ipo_list):
+        """申し込みが終わっていない IPO に詳細ページの情報を足す。失敗しても一覧の情報だけで続ける"""
+        if not IPO_DETAILS:
+            return ipo_list
+        today = date.today()
+        targets = [i for i, ipo in enumerate(ipo_list) if ipo.end is None or ipo.end.date() >= today]
+        try:
+            with metrics.timer('enrich', source='ipo'):
+                enriched = self.details.enrich([ipo_list[i] for i in targets])
+        except Exception as e:
+            print(f"[{datetime.now()}] 詳細ページ取得中にエラー: {e}")
+            return ipo_list
+        ipo_list = list(ipo_list)
+        for i, row in zip(targets, enriched):
+            ipo_list[i] = row
+        return ipo_list
+
+    def get_snapshot(self, max_age=None):
+        """鮮度内ならキャッシュ済みスナップショットを返し、古ければ1回だけ取得し直す"""
+        ttl = self.snapshot_ttl if max_age is None else max_age
+        with self._snapshot_lock:
+            snapshot = self._snapshot
+            if snapshot is not None and snapshot.is_fresh(ttl):
+                return snapshot
+            return self.refresh_snapshot()
+
+    @property
+    def last_snapshot(self):
+        """このプロセスで取得済みのスナップショット（未取得なら None）"""
+        return self._snapshot
+
+    def cached_windows(self):
+        """取得済みスナップショットの申し込み期間（未取得なら空）。サイトには取りに行かない"""
+        snapshot = self._snapshot
+        return snapshot.windows if snapshot else []
+
+    def cached_snapshot(self):
+        """
+        HTTP キャッシュに残っている前回のパース結果から作るスナップショット（サイトには取りに行かない）。
+        詳細ページの項目は付かない。どの情報源のキャッシュも無ければ None
+        """
+        results, fetched = [], []
+        for source in self.sources:
+            cached = source.cached(self.fetcher)
+            if cached and cached[0]:
+                results.append(SourceResult(source.name, cached[0], 'ok'))
+                fetched.append(cached[1])
+        if not results:
+            return None
+        rows, _ = merge_sources(results)
+        return IPOSnapshot(rows, fetched_at=min(fetched))
+
+    def source_status(self):
+        """情報源ごとの鮮度と、取得済みスナップショットでのサイト間の食い違い。サイトには取りに行かない"""
+        snapshot = self._snapshot
+        report = snapshot.sources if snapshot else None
+        return {**self.aggregator.status(), 'disagreements': report.disagreements if report else []}
+
+    def _recipients(self):
+        # 環境変数からLINE設定を読み込み（GitHub Actions用）
+        user_ids = os.environ.get('LINE_USER_ID', LINE_USER_ID)
+        return [u.strip() for u in user_ids.split(',') if u.strip()]
+
+    def build_notification(self, ipo_info):
+        # 詳細ページから取れた項目だけ足す
+        extra = ''
+        if ipo_info.lead_underwriter:
+            extra += f"\n🏦 主幹事: {ipo_info.lead_underwriter}"
+        if ipo_info.shares_offered:
+            extra += f"\n📦 公開株数: {ipo_info.shares_offered}"
+        if ipo_info.lottery_allocation:
+            extra += f"\n🎯 当選本数: {ipo_info.lottery_allocation}"
+        return f"""📈 IPO申し込み期間中のお知らせ 📈
+
+🏢 企業名: {ipo_info.company_name}
+📅 申し込み期間: {ipo_info.application_period}
+📊 上場日: {ipo_info.listing_date}
+💰 公募価格: {ipo_info.offering_price}
+⭐ 総合評価: {ipo_info.rating}{extra}
+
+🔗 詳細: {ipo_info.detail_url or self.url}
+
+今すぐ申し込みを検討してください！"""
+
+    def send_daily_summary(self, snapshot, batch=None):
+        """
+        サマリーを送り、そのテキストを返す（作れなかったときは None）。
+        batch（LineBatch）を渡すとそこに積むだけで、後続の通知とまとめて送る。
+        そのときの送信結果は送った後に batch.failed で確かめる
+        """
+        try:
+            current_ipos = snapshot.accepting()
+            if current_ipos:
+                message = f"""🌅 おはようございます！
+
+📊 本日のIPO申し込み状況
+
+現在申し込み期間中のIPO: {len(current_ipos)}件
+
+"""
+                for i, ipo in enumerate(current_ipos[:5], 1):
+                    message += f"{i}. {ipo.company_name}\n"
+                    message += f"   期間: {ipo.application_period}\n"
+                    message += f"   価格: {ipo.offering_price}\n"
+                    message += f"   評価: {ipo.rating}\n\n"
+                if len(current_ipos) > 5:
+                    message += f"... 他 {len(current_ipos) - 5}件\n\n"
+                message += f"🔗 詳細: {self.url}"
+            else:
+                message = f"""🌅 おはようございます！
+
+📊 本日のIPO申し込み状況
+
+現在申し込み期間中のIPOはありません。
+
+🔗 詳細: {self.url}"""
+            message += self._source_warning(snapshot)
+            if batch is not None:
+                batch.enqueue(self._recipients(), message)
+                return message
+            self._log_summary(self.line.send(self._recipients(), message))
+            return message
+        except Exception as e:
+            print(f"[{datetime.now()}] サマリー通知送信エラー: {e}")
+            return None
+
+    def _log_summary(self, ok):
+        if ok:
+            print(f"[{datetime.now()}] 毎日サマリー通知を送信")
+        else:
+            print(f"[{datetime.now()}] サマリー通知送信エラー: LINE への送信に失敗しました")
+
+    def _source_warning(self, snapshot):
+        """取得できなかった情報源があればサマリーの末尾に足す一文"""
+        failed = snapshot.sources.failed if snapshot.sources else []
+        if not failed:
+            return ''
+        return "\n\n⚠️ 取得できなかった情報源: " + ', '.join(f"{r.name}（{r.error}）" for r in failed)
+
+    def send_source_alert(self, error):
+        """どの情報源も取得できなかったことを知らせる（「IPOなし」のサマリーの代わりに送る）"""
+        try:
+            message = f"""⚠️ IPO情報を取得できませんでした
+
+どの情報源からも一覧を取得できなかったため、本日のIPO申し込み状況を確認できていません。
+
+{error}"""
+            self.line.send(self._recipients(), message)
+            print(f"[{datetime.now()}] 取得失敗の通知を送信")
+        except Exception as e:
+            print(f"[{datetime.now()}] 取得失敗の通知送信エラー: {e}")
+
+    def run_check(self, snapshot=None, batch=None):
+        """
+        チェック本体。例外はそのまま投げ、結果の要約を返す。
+        batch（LineBatch）を渡すと、そこに積まれている分（朝のサマリーなど）と一緒に送る
+        """
+        # スケジューラーと手動チェックが同時に走っても通知済みストアを取り合わないよう直列化
+        with self._check_lock:
+            print(f"[{datetime.now()}] IPO情報をチェック中...")
+            if snapshot is None:
+                snapshot = self.get_snapshot()
+            now = datetime.now()
+            current_ipos = {}
+            with metrics.timer('diff', source='ipo'):
+                if metrics.VERBOSE:
+                    for ipo in snapshot.rows:
+                        print(f"[DEBUG] {ipo.company_name} 期間='{ipo.application_period}' -> 開始={ipo.start} 終了={ipo.end} 判定={ipo.is_open(now)}")
+                for ipo in snapshot.accepting(now):
+                    current_ipos[ipo.key] = (ipo, ipo.end)
+                # 通知済みかどうかはまとめて1回で引く
+                with metrics.timer('state_io', source='ipo', op='load'):
+                    known = self.known_ipos.contains_many(current_ipos)
+            # 新規分は送信キューに積み、最後に1回でまとめて送る（1回の push に最大5通）
+            queued = {}
+            batch = batch or self.line.batch()
+            recipients = self._recipients()
+            for unique_key, (ipo, ed) in current_ipos.items():
+                if unique_key not in known:
+                    text = self.build_notification(ipo)
+                    batch.enqueue(recipients, text)
+                    queued[unique_key] = (ipo, ed, text)
+            # 失敗はこのバッチの分だけ返る（同時に動くゲオ監視などの送信結果は混ざらない）
+            failed = batch.flush()
+            notified = {}
+            for unique_key, (ipo, ed, text) in queued.items():
+                if text in failed:
+                    print(f"[{datetime.now()}] LINE通知送信エラー: {ipo.company_name}")
+                    continue
+                print(f"[{datetime.now()}] LINE通知を送信: {ipo.company_name}")
+                notified[unique_key] = ed + timedelta(days=IPO_DEDUP_GRACE_DAYS)
+            with metrics.timer('state_io', source='ipo', op='save'):
+                self.known_ipos.add_many(notified)
+                expired_keys = self.known_ipos.purge(now)
+            for expired in expired_keys:
+                print(f"[{datetime.now()}] 申し込み期間終了: {expired}")
+            metrics.incr('notified', len(notified), source='ipo')
+            print(f"[{datetime.now()}] 現在申し込み期間中のIPO: {len(current_ipos)}件")
+            self.last_check = datetime.now()
+            return {
+                'accepting': len(current_ipos),
+                'notified': [queued[k][0].company_name for k in notified],
+                'fetched_at': snapshot.fetched_at.isoformat(),
+            }
+
+    def check_and_notify(self, snapshot=None, batch=None):
+        try:
+            return self.run_check(snapshot, batch)
+        except Exception as e:
+            print(f"[{datetime.now()}] チェック処理中にエラー: {e}")
+            return None
+
+    def daily_morning_check(self):
+        print(f"[{datetime.now()}] === 毎日朝8時のIPOチェック開始 ===")
+        try:
+            # 朝のチェックは必ず最新を1回だけ取得し、サマリーと個別通知で共有する
+            try:
+                snapshot = self.get_snapshot(max_age=0)
+            except SourceUnavailable as e:
+                print(f"[{datetime.now()}] IPO情報を取得できませんでした: {e}")
+                self.send_source_alert(e)
+                return
+            # サマリーは個別通知と同じ push にまとめて送る。
+            # チェックが途中で失敗しても、サマリーは with を抜けるときに送られる
+            with self.line.batch() as batch:
+                summary = self.send_daily_summary(snapshot, batch)
+                self.check_and_notify(snapshot, batch)
+            # 送信は with を抜けるまでに済んでいる
+            if summary is not None:
+                self._log_summary(summary not in batch.failed)
+            fingerprint.report_hit_rate('ipo')
+            print(f"[{datetime.now()}] === 毎日朝8時のIPOチェック完了 ===")
+        except Exception as e:
+            print(f"[{datetime.now()}] 毎日チェック中にエラー: {e}")
+
+def main():
+    """朝のチェックを1回だけ実行する（GitHub Actions などの cron 実行用）"""
+    from ipo_archive import IPOArchive
+    print(f"[{os.environ.get('TZ', 'UTC')}] IPOチェック開始")
+    monitor = IPOMonitor()
+    # Web 版と同じく取得結果を履歴アーカイブに取り込む（DB は ipo_known.json と一緒にコミットし直す）
+    archive = IPOArchive()
+    monitor.snapshot_listeners.append(archive.ingest)
+    try:
+        monitor.daily_morning_check()
+    finally:
+        # 閉じると WAL がチェックポイントされ、DB ファイル1つにまとまる
+        archive.close()
+    # 段階ごとの所要時間とカウンターを出力
+    metrics.report()
+    print(f"[{os.environ.get('TZ', 'UTC')}] IPOチェック完了")
+
+if __name__ == '__main__':
+    main()
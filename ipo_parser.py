@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+ipokiso.com の一覧ページ用テーブル抽出エンジン
+各 <table> を1回だけ走査して「企業名テーブル」「詳細テーブル」を判定し、行を取り出す
+企業ごとの詳細ページからは主幹事・公開株数・当選本数を取り出す
+"""
+
+import os
+import re
+from urllib.parse import urljoin
+from functools import lru_cache
+from records import IPORecord
+
+# bs4 は最初にパースするときに読み込む（304 や指紋一致でパースしない実行では読み込まない）
+BeautifulSoup = SoupStrainer = Tag = None
+
+# 抽出結果（行の項目・値・申し込み期間の年の決め方）が変わる変更をしたら上げる。
+# HTTP キャッシュに残っている古いパース結果はバージョンが違えば使われない
+PARSER_VERSION = 1
+PERIOD_RE = re.compile(r'\d{1,2}/\d{1,2}')
+RATING_IMAGES = (('s03', 'S'), ('a03', 'A'), ('b03', 'B'), ('c03', 'C'), ('d03', 'D'))
+# 詳細ページの見出しに含まれる語 → 行に追加するキー（先に見つかった値を使う）
+DETAIL_FIELDS = (
+    ('lead_underwriter', ('主幹事',)),
+    ('shares_offered', ('公開株数', '公募株数')),
+    ('lottery_allocation', ('当選本数', '抽選')),
+)
+
+
+def _load_bs4():
+    global BeautifulSoup, SoupStrainer, Tag
+    if BeautifulSoup is None:
+        from bs4 import BeautifulSoup, SoupStrainer, Tag
+
+
+@lru_cache(maxsize=None)
+def html_parser():
+    # lxml が入っていれば高速な方を使う（IPO_HTML_PARSER で明示指定も可）
+    forced = os.environ.get('IPO_HTML_PARSER')
+    if forced:
+        return forced
+    try:
+        import lxml  # noqa: F401
+        return 'lxml'
+    except ImportError:
+        return 'html.parser'
+
+
+class _Row:
+    """1つの <tr> と、その中のセル・テキストを保持する"""
+    __slots__ = ('tr', 'cells', 'has_link', '_texts')
+
+    def __init__(self, tr):
+        self.tr = tr
+        self.cells = []
+        self.has_link = False
+        self._texts = None
+
+    @property
+    def texts(self):
+        if self._texts is None:
+            self._texts = [c.get_text(strip=True) for c in self.cells]
+        return self._texts
+
+    def has_th(self):
+        return any(c.name == 'th' for c in self.cells)
+
+    def tds(self):
+        return [c for c in self.cells if c.name == 'td']
+
+
+class _Table:
+    """テーブル1つ分の走査結果。kind は 'company' / 'detail' / None"""
+    __slots__ = ('rows', 'ths', 'kind')
+
+    def __init__(self, table):
+        self.rows = []
+        self.ths = []
+        self._walk(table, ())
+        self.kind = self._classify()
+
+    def _walk(self, node, open_rows):
+        # 木を1回だけ辿り、行・セル・<th>・リンク有無をまとめて集める
+        # （入れ子の <tr> では外側の行にも内側のセルが含まれる点は find_all と同じ）
+        for child in node.contents:
+            if not isinstance(child, Tag):
+                continue
+            name = child.name
+            if name == 'tr':
+                row = _Row(child)
+                self.rows.append(row)
+                self._walk(child, open_rows + (row,))
+                continue
+            if name == 'td' or name == 'th':
+                for row in open_rows:
+                    row.cells.append(child)
+                if name == 'th':
+                    self.ths.append(child)
+            elif name == 'a':
+                for row in open_rows:
+                    row.has_link = True
+            self._walk(child, open_rows)
+
+    def _classify(self):
+        rows = self.rows
+        ths = self.ths
+        if len(ths) == 1 and '企業名' in ths[0].get_text(strip=True):
+            return 'company'
+        if not rows:
+            return None
+        if all(len(r.cells) == 1 for r in rows) and any(r.has_link for r in rows):
+            return 'company'
+        header_text = ''.join(rows[0].texts)
+        if '申し込み期間' in header_text or '申込期間' in header_text:
+            return 'detail'
+        return None
+
+    def company_links(self):
+        """(企業名, 詳細ページの href) のリスト。リンクが無ければ href は ''"""
+        links = []
+        for r in self.rows:
+            if not r.cells:
+                continue
+            cell = r.cells[0]
+            a = cell.find('a')
+            text = a.get_text(strip=True) if a else r.texts[0]
+            if text and text != '企業名':
+                links.append((text, (a.get('href') or '') if a else ''))
+        return links
+
+    def details(self):
+        header_pos = None
+        for pos, r in enumerate(self.rows):
+            if r.has_th() or '申し込み期間' in r.tr.get_text():
+                header_pos = pos
+                break
+        if header_pos is None:
+            return []
+        headers = self.rows[header_pos].texts
+
+        def col(name, alt=None):
+            for i, h in enumerate(headers):
+                if name in h or (alt and alt in h):
+                    return i
+            return -1
+        idx_period = col('申し込み期間', '申込期間')
+        idx_listing = col('上場日')
+        idx_offering = col('公募価格')
+        idx_rating = col('総合評価')
+        details = []
+        for r in self.rows[header_pos + 1:]:
+            cells = r.tds()
+            if not cells:
+                continue
+
+            def get(i):
+                return cells[i].get_text(strip=True) if 0 <= i < len(cells) else ''
+            rating = get(idx_rating)
+            if not rating and 0 <= idx_rating < len(cells):
+                img = cells[idx_rating].find('img')
+                if img and img.get('src'):
+                    src = img.get('src')
+                    rating = next((label for key, label in RATING_IMAGES if key in src), '')
+            details.append({
+                'application_period': get(idx_period),
+                'listing_date': get(idx_listing),
+                'offering_price': get(idx_offering),
+                'rating': rating
+            })
+        return details
+
+
+def extract_ipo_rows(content, parser=None, base_url=None, ref=None):
+    """
+    一覧ページのHTMLから IPORecord のリストを返す。base_url があれば詳細ページの URL を絶対URLにする。
+    申し込み期間の年は ref（既定は今日）を基準に決める（date_window.parse_window）
+    """
+    _load_bs4()
+    soup = BeautifulSoup(content, parser or html_parser(), parse_only=SoupStrainer('table'))
+    tables = [_Table(t) for t in soup.find_all('table')]
+    ipo_list = []
+    i = 0
+    while i < len(tables):
+        if tables[i].kind == 'company' and i + 1 < len(tables) and tables[i + 1].kind == 'detail':
+            links = tables[i].company_links()
+            details = tables[i + 1].details()
+            for (name, href), d in zip(links, details):
+                if PERIOD_RE.search(d['application_period']):
+                    ipo_list.append(IPORecord.parse(
+                        name, d['application_period'], d['listing_date'], d['offering_price'], d['rating'],
+                        urljoin(base_url, href) if href and base_url else href, ref))
+            i += 2
+        else:
+            i += 1
+    return ipo_list
+
+
+def _label_pairs(soup):
+    """『見出し → 値』の組を順に返す（<th> の次の <td>、<dt> の次の <dd>）"""
+    for tr in soup.find_all('tr'):
+        cells = tr.find_all(['th', 'td'], recursive=False)
+        for head, value in zip(cells, cells[1:]):
+            if head.name == 'th' and value.name == 'td':
+                yield head.get_text(strip=True), value.get_text(' ', strip=True)
+    for dt in soup.find_all('dt'):
+        dd = dt.find_next_sibling('dd')
+        if dd is not None:
+            yield dt.get_text(strip=True), dd.get_text(' ', strip=True)
+
+
+def extract_detail_fields(content, parser=None):
+    """企業の詳細ページから DETAIL_FIELDS の値を dict で返す（見つからないキーは含めない）"""
+    _load_bs4()
+    soup = BeautifulSoup(content, parser or html_parser(), parse_only=SoupStrainer(['table', 'dl']))
+    found = {}
+    for label, value in _label_pairs(soup):
+        for key, words in DETAIL_FIELDS:
+            if key not in found and value and any(w in label for w in words):
+                found[key] = value
+    return found
@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+"""
+IPO一覧の情報源（サイト）ごとのアダプターと、複数サイトの並行取得・統合
+- IPOSource: 1サイト分の取得とパース。name / url / timeout と fetch(fetcher) を持つ
+- SourceAggregator: IPO_SOURCES のサイトを並行に取得し、サイトごとの制限時間で打ち切る。
+  正常に返ったサイトが IPO_SOURCE_QUORUM 個そろったら、残りは IPO_SOURCE_GRACE 秒だけ待つ
+  （全体の待ち時間は一番遅いサイトではなく、正常な quorum 個のうち最後に返ったサイトで決まる）
+- merge_sources: 正規化した企業名 + 申し込み期間で行をまとめる。先に並んだサイトの値を優先し、
+  空の項目だけ他のサイトで補う。サイト間で値が食い違った項目は disagreements に残す
+- 行が0件のサイトも失敗として扱う（表の形が変わって何も取れないときに「IPOなし」としない）
+"""
+
+import os
+import re
+import abc
+import time
+import threading
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from dataclasses import replace
+from datetime import datetime
+from ipo_parser import extract_ipo_rows, PARSER_VERSION
+from records import IPOBatch, DETAIL_KEYS
+import metrics
+
+# 使う情報源（カンマ区切り。先に書いたサイトの値を優先する）
+IPO_SOURCES = os.environ.get('IPO_SOURCES', 'ipokiso')
+# サイトごとの制限時間（秒）
+IPO_SOURCE_TIMEOUT = float(os.environ.get('IPO_SOURCE_TIMEOUT', '20'))
+# この数のサイトが正常に返ったら、残りのサイトは IPO_SOURCE_GRACE 秒だけ待って打ち切る
+IPO_SOURCE_QUORUM = int(os.environ.get('IPO_SOURCE_QUORUM', '1'))
+IPO_SOURCE_GRACE = float(os.environ.get('IPO_SOURCE_GRACE', '2'))
+
+MONTH_DAY_RE = re.compile(r'(\d{1,2})/(\d{1,2})')
+# 企業名の比較で無視する表記
+COMPANY_SUFFIXES = ('株式会社', '(株)')
+# 空なら他のサイトの値で補う項目
+FILL_FIELDS = ('listing_date', 'offering_price', 'rating', 'detail_url') + DETAIL_KEYS
+
+
+class SourceUnavailable(RuntimeError):
+    """どの情報源からも IPO 一覧を取得できなかった"""
+
+
+# ── アダプター ──────────────────────────────────────────
+
+class IPOSource(abc.ABC):
+    """情報源1つ分。fetch は IPORecord のリストを返し、失敗時は例外を投げる"""
+    name = ''
+    url = ''
+
+    def __init__(self, timeout=None):
+        self.timeout = timeout or IPO_SOURCE_TIMEOUT
+
+    @abc.abstractmethod
+    def fetch(self, fetcher):
+        """fetcher（CachedFetcher）で一覧を取得してパースした IPORecord のリストを返す"""
+
+    def cached(self, fetcher):
+        """前回のパース結果 (行, 取得時刻) をキャッシュから返す（取りに行かない）。無ければ None"""
+        return None
+
+
+class IpokisoSource(IPOSource):
+    name = 'ipokiso'
+    url = 'https://www.ipokiso.com/company/index.html'
+
+    def parse(self, content):
+        return extract_ipo_rows(content, base_url=self.url)
+
+    version = f'{name}@{PARSER_VERSION}'
+
+    @staticmethod
+    def _load(columns):
+        return IPOBatch.from_columns(columns).records()
+
+    def fetch(self, fetcher):
+        # 304（未更新）や、表の部分の指紋が前回と同じときは前回のパース結果がそのまま返る
+        # パース結果は列ごとの形でキャッシュに保存する
+        return fetcher.fetch_parsed(
+            self.url, self.parse, timeout=self.timeout, region=('table', None), version=self.version,
+            dump=lambda rows: IPOBatch.from_records(rows).to_columns(), load=self._load)
+
+    def cached(self, fetcher):
+        return fetcher.cached_parsed(self.url, self.version, load=self._load)
+
+
+# 名前 → アダプター（IPO_SOURCES で指定する名前）
+SOURCES = {
+    IpokisoSource.name: IpokisoSource,
+}
+
+
+def build_sources(names=None):
+    names = IPO_SOURCES if names is None else names
+    if isinstance(names, str):
+        names = [n.strip() for n in names.split(',') if n.strip()]
+    sources = []
+    for name in names:
+        if name not in SOURCES:
+            raise ValueError(f"不明な IPO 情報源: {name}")
+        sources.append(SOURCES[name]())
+    if not sources:
+        raise ValueError("IPO_SOURCES に情報源が1つもありません")
+    return sources
+
+
+# ── 取得結果 ────────────────────────────────────────────
+
+class SourceResult:
+    """1回の取得でのサイト1つ分の結果。status は ok / empty / error / timeout"""
+    __slots__ = ('name', 'rows', 'status', 'error', 'seconds', 'finished_at')
+
+    def __init__(self, name, rows, status, error=None, seconds=0.0):
+        self.name = name
+        self.rows = rows
+        self.status = status
+        self.error = error
+        self.seconds = seconds
+        self.finished_at = datetime.now()
+
+    @property
+    def ok(self):
+        return self.status == 'ok'
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'status': self.status,
+            'rows': len(self.rows),
+            'seconds': round(self.seconds, 3),
+            'error': self.error,
+            'finished_at': self.finished_at.isoformat(timespec='seconds'),
+        }
+
+
+class SourceReport:
+    """1回の並行取得の結果（サイトごとの結果・統合した行・食い違い）"""
+
+    def __init__(self, results, rows, disagreements):
+        self.results = results
+        self.rows = rows
+        self.disagreements = disagreements
+
+    @property
+    def healthy(self):
+        return [r for r in self.results if r.ok]
+
+    @property
+    def failed(self):
+        return [r for r in self.results if not r.ok]
+
+    def to_dict(self):
+        return {
+            'sources': [r.to_dict() for r in self.results],
+            'rows': len(self.rows),
+            'disagreements': self.disagreements,
+        }
+
+
+# ── 統合 ────────────────────────────────────────────────
+
+def _nfkc(text):
+    return unicodedata.normalize('NFKC', text or '')
+
+
+def normalize_company(name):
+    """全角・半角、空白、『株式会社』『(株)』の有無の違いを無視した企業名"""
+    name = _nfkc(name)
+    for suffix in COMPANY_SUFFIXES:
+        name = name.replace(suffix, '')
+    return ''.join(name.split()).lower()
+
+
+def _month_days(text):
+    return tuple(int(n) for pair in MONTH_DAY_RE.findall(_nfkc(text)) for n in pair) or None
+
+
+def merge_key(ipo):
+    """サイトをまたいで同じ IPO とみなすキー（正規化した企業名, 申し込み期間）"""
+    if ipo.start and ipo.end:
+        period = (ipo.start.toordinal(), ipo.end.toordinal())
+    else:
+        period = _month_days(ipo.application_period)
+    return normalize_company(ipo.company_name), period
+
+
+# 食い違いを調べる項目 → 比べる値（None は「そのサイトには値が無い」）
+COMPARE_FIELDS = (
+    ('listing_date', lambda ipo: _month_days(ipo.listing_date)),
+    ('offering_price', lambda ipo: ipo.price),
+    ('rating', lambda ipo: ipo.rating.value or None),
+)
+
+
+def _fill(base, other):
+    """base の空の項目を other の値で補う（公募価格は数値の price も一緒に補う）"""
+    changes = {f: getattr(other, f) for f in FILL_FIELDS if not getattr(base, f) and getattr(other, f)}
+    if 'offering_price' in changes:
+        changes['price'] = other.price
+    return replace(base, **changes) if changes else base
+
+
+def merge_sources(results):
+    """
+    正常に返ったサイトの行を (行のリスト, 食い違いのリスト) にまとめる。
+    行の順序は先のサイトの並び順で、他のサイトにしか無い行はその後ろに続く
+    """
+    healthy = [r for r in results if r.ok]
+    if len(healthy) == 1:
+        return healthy[0].rows, []
+    merged = {}
+    by_key = {}  # キー → {サイト名: 行}
+    for result in healthy:
+        for ipo in result.rows:
+            key = merge_key(ipo)
+            seen = by_key.setdefault(key, {})
+            if result.name in seen:
+                continue
+            seen[result.name] = ipo
+            base = merged.get(key)
+            merged[key] = ipo if base is None else _fill(base, ipo)
+    disagreements = []
+    for key, seen in by_key.items():
+        if len(seen) < 2:
+            continue
+        for field, value_of in COMPARE_FIELDS:
+            values = {name: value_of(ipo) for name, ipo in seen.items()}
+            if len({v for v in values.values() if v is not None}) > 1:
+                disagreements.append({
+                    'company_name': merged[key].company_name,
+                    'application_period': merged[key].application_period,
+                    'field': field,
+                    'values': {name: str(getattr(ipo, field)) for name, ipo in seen.items()},
+                })
+    return list(merged.values()), disagreements
+
+
+# ── 並行取得 ────────────────────────────────────────────
+
+class SourceAggregator:
+    def __init__(self, sources, quorum=None, grace=None):
+        self.sources = list(sources)
+        self.quorum = max(1, min(quorum or IPO_SOURCE_QUORUM, len(self.sources)))
+        self.grace = IPO_SOURCE_GRACE if grace is None else grace
+        # 打ち切ったサイトの取得はスレッドに残るので、サイト数より少し多めに持つ
+        self._executor = ThreadPoolExecutor(max_workers=len(self.sources) * 2, thread_name_prefix='source')
+        self._lock = threading.Lock()
+        self._status = {}  # サイト名 → 直近の結果と最後に成功した時刻
+
+    def _run(self, source, fetcher):
+        started = time.perf_counter()
+        try:
+            rows = source.fetch(fetcher)
+            status, error = ('ok', None) if rows else ('empty', '行が0件（ページの形が変わった可能性）')
+        except Exception as e:
+            rows, status, error = [], 'error', f"{type(e).__name__}: {e}"
+        seconds = time.perf_counter() - started
+        metrics.observe('source_fetch', seconds, source='ipo', site=source.name)
+        return SourceResult(source.name, rows, status, error, seconds)
+
+    def collect(self, fetcher):
+        """全サイトを並行に取得して SourceReport を返す。fetcher は各サイトで共有する"""
+        started = time.monotonic()
+        futures = {self._executor.submit(self._run, s, fetcher): s for s in self.sources}
+        pending = set(futures)
+        results = {}
+        quorum_at = None
+        while pending:
+            now = time.monotonic()
+            if quorum_at is not None and now >= quorum_at + self.grace:
+                break
+            for future in [f for f in pending if now >= started + futures[f].timeout]:
+                pending.discard(future)
+            if not pending:
+                break
+            limit = min(started + futures[f].timeout for f in pending)
+            if quorum_at is not None:
+                limit = min(limit, quorum_at + self.grace)
+            done, pending = wait(pending, timeout=max(0.0, limit - now), return_when=FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                results[result.name] = result
+            if quorum_at is None and sum(r.ok for r in results.values()) >= self.quorum:
+                quorum_at = time.monotonic()
+        elapsed = time.monotonic() - started
+        ordered = []
+        for source in self.sources:
+            result = results.get(source.name)
+            if result is None:
+                # 返ってこなかったサイトの取得は待たずに置いていく（終わった結果は使わない）
+                reason = (f"正常なサイトが{self.quorum}件そろったため打ち切り" if quorum_at is not None
+                          else f"{source.timeout:g}秒以内に応答なし")
+                result = SourceResult(source.name, [], 'timeout', reason, elapsed)
+            ordered.append(result)
+        rows, disagreements = merge_sources(ordered)
+        report = SourceReport(ordered, rows, disagreements)
+        self._record(report)
+        return report
+
+    def _record(self, report):
+        with self._lock:
+            for result in report.results:
+                entry = self._status.setdefault(result.name, {'last_success': None})
+                entry['last'] = result
+                if result.ok:
+                    entry['last_success'] = result.finished_at
+        for result in report.failed:
+            metrics.incr('source_errors', source='ipo', site=result.name, status=result.status)
+        if report.disagreements:
+            metrics.incr('source_disagreements', len(report.disagreements), source='ipo')
+
+    def status(self, now=None):
+        """サイトごとの鮮度（直近の結果と、最後に成功してからの秒数）"""
+        now = now or datetime.now()
+        with self._lock:
+            status = dict(self._status)
+        sources = []
+        for source in self.sources:
+            entry = status.get(source.name)
+            last = entry['last'].to_dict() if entry else None
+            success = entry['last_success'] if entry else None
+            sources.append({
+                'name': source.name,
+                'url': source.url,
+                'timeout': source.timeout,
+                'last': last,
+                'last_success': success.isoformat(timespec='seconds') if success else None,
+                'age_seconds': round((now - success).total_seconds()) if success else None,
+            })
+        return {'quorum': self.quorum, 'grace': self.grace, 'sources': sources}
+
+    def close(self):
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+バックグラウンドジョブ管理
+- submit() はジョブを登録してすぐに ID を返し、処理はワーカースレッドで実行する
+- 同じ種類のジョブが実行中・待機中なら新しく作らず、そのジョブの ID を返す（single-flight）
+- ジョブの状態は SQLite に置くので、gunicorn の複数ワーカー間でも共有・重複排除される
+- ジョブには登録したプロセス（ホスト名・pid）と、そのプロセスが定期的に更新するハートビートを残す。
+  同じホストで登録元のプロセスが終了していれば、ハートビートの期限を待たずにすぐ引き継ぐ
+"""
+
+import os
+import json
+import uuid
+import time
+import socket
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+IPO_JOBS_DB = os.environ.get('IPO_JOBS_DB', 'jobs.db')
+# 実行中・待機中のジョブのハートビートを更新する間隔
+JOB_HEARTBEAT_SECONDS = float(os.environ.get('JOB_HEARTBEAT_SECONDS', '30'))
+# これより長くハートビートが途切れたジョブはワーカーが落ちたとみなして相乗りせず、失敗として閉じる
+JOB_STALE_SECONDS = int(os.environ.get('JOB_STALE_SECONDS', '120'))
+# 完了済みジョブを残しておく時間
+JOB_RETENTION_SECONDS = int(os.environ.get('JOB_RETENTION_SECONDS', '86400'))
+
+
+# 後から足した列（古い jobs.db には ALTER TABLE で追加する）
+OWNER_COLUMNS = (('owner_host', 'TEXT'), ('owner_pid', 'INTEGER'), ('heartbeat_at', 'REAL'))
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # 別ユーザーのプロセスとして生きている
+        return True
+    return True
+
+
+class JobQueue:
+    def __init__(self, path=None, max_workers=1, heartbeat=None):
+        self.path = path or IPO_JOBS_DB
+        self.heartbeat = JOB_HEARTBEAT_SECONDS if heartbeat is None else heartbeat
+        self.host = socket.gethostname()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self._local = threading.local()
+        self._beating = None
+        self._beat_lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute('''CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                status TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL,
+                result TEXT,
+                error TEXT
+            )''')
+            conn.execute('CREATE INDEX IF NOT EXISTS jobs_kind_status ON jobs (kind, status)')
+            existing = {row['name'] for row in conn.execute('PRAGMA table_info(jobs)')}
+            for name, kind in OWNER_COLUMNS:
+                if name not in existing:
+                    conn.execute(f'ALTER TABLE jobs ADD COLUMN {name} {kind}')
+
+    def _connect(self):
+        # スレッドごとに接続を持つ（sqlite3 の接続はスレッドをまたげない）
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def _update(self, job_id, **fields):
+        cols = ', '.join(f'{k} = ?' for k in fields)
+        self._connect().execute(f'UPDATE jobs SET {cols} WHERE id = ?', (*fields.values(), job_id))
+
+    def _abandoned(self, row, now):
+        """登録したプロセスがもういない、またはハートビートが途切れたジョブなら理由を返す"""
+        if row['owner_host'] == self.host and row['owner_pid'] and not _pid_alive(row['owner_pid']):
+            return f"stale: owner pid {row['owner_pid']} exited"
+        last = row['heartbeat_at'] or row['created_at']
+        if last < now - JOB_STALE_SECONDS:
+            return 'stale: no heartbeat'
+        return None
+
+    def submit(self, kind, fn, *args, **kwargs):
+        """(job_id, coalesced) を返す。coalesced=True なら既存の実行中ジョブに相乗りした"""
+        conn = self._connect()
+        now = time.time()
+        # BEGIN IMMEDIATE で書き込みロックを取り、他のワーカーとの二重登録を防ぐ
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            active = None
+            for row in conn.execute(
+                    "SELECT id, created_at, owner_host, owner_pid, heartbeat_at FROM jobs "
+                    "WHERE kind = ? AND status IN ('queued', 'running') ORDER BY created_at DESC",
+                    (kind,)).fetchall():
+                reason = self._abandoned(row, now)
+                if reason:
+                    conn.execute("UPDATE jobs SET status = 'failed', error = ?, finished_at = ? WHERE id = ?",
+                                 (reason, now, row['id']))
+                elif active is None:
+                    active = row['id']
+            if active:
+                conn.execute('COMMIT')
+                return active, True
+            job_id = uuid.uuid4().hex
+            conn.execute("INSERT INTO jobs (id, kind, status, created_at, owner_host, owner_pid, heartbeat_at) "
+                         "VALUES (?, ?, 'queued', ?, ?, ?, ?)",
+                         (job_id, kind, now, self.host, os.getpid(), now))
+            conn.execute('DELETE FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?',
+                         (now - JOB_RETENTION_SECONDS,))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        self._start_heartbeat()
+        self._executor.submit(self._run, job_id, fn, args, kwargs)
+        return job_id, False
+
+    def _start_heartbeat(self):
+        # fork 後（gunicorn のワーカー）は親のスレッドが無いので、プロセスごとに起動する
+        with self._beat_lock:
+            if self._beating == os.getpid():
+                return
+            self._beating = os.getpid()
+        threading.Thread(target=self._beat, daemon=True, name='job-heartbeat').start()
+
+    def _beat(self):
+        pid = os.getpid()
+        while True:
+            time.sleep(self.heartbeat)
+            try:
+                self._connect().execute(
+                    "UPDATE jobs SET heartbeat_at = ? WHERE owner_host = ? AND owner_pid = ? "
+                    "AND status IN ('queued', 'running')", (time.time(), self.host, pid))
+            except sqlite3.Error as e:
+                print(f"[{datetime.now()}] ジョブのハートビート更新エラー: {e}")
+
+    def _run(self, job_id, fn, args, kwargs):
+        self._update(job_id, status='running', started_at=time.time())
+        try:
+            result = fn(*args, **kwargs)
+            self._update(job_id, status='succeeded', finished_at=time.time(),
+                         result=json.dumps(result, ensure_ascii=False, default=str))
+        except Exception as e:
+            print(f"[{datetime.now()}] ジョブ {job_id} でエラー: {e}")
+            self._update(job_id, status='failed', finished_at=time.time(), error=str(e))
+
+    def get(self, job_id):
+        row = self._connect().execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        for key in ('created_at', 'started_at', 'finished_at'):
+            if job[key] is not None:
+                job[key] = datetime.fromtimestamp(job[key]).isoformat()
+        return job
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+LINE通知の送信エンジン（IPO BOT / ゲオモバイル監視で共通）
+- LineBotApi は1つだけ作り、HTTP セッション（キープアライブ）を使い回す
+- 送り先ごとにメッセージをまとめ、1回の push に最大5件詰める
+  （まとめるのは呼び出し側ごとの batch() の中だけ。別の処理が積んだ分を送ったり失敗を受け取ったりしない）
+- 5000文字を超えるテキストは改行位置で分割する
+- 同じ内容を複数ユーザーへ送るときは multicast を使う
+- トークンバケットで送信ペースを抑え、429 / 5xx / 通信エラーは指数バックオフで再送する
+- LINE SDK は送信エンジンを最初に作るときに読み込む（何も送らない実行では読み込まない）
+"""
+
+import os
+import time
+import uuid
+import threading
+from datetime import datetime
+import requests
+import metrics
+
+# テストではローカルのモックサーバーを指せるようにする
+LINE_API_ENDPOINT = os.environ.get('LINE_API_ENDPOINT', 'https://api.line.me')
+LINE_TEXT_LIMIT = 5000
+MAX_MESSAGES_PER_PUSH = 5
+MAX_MULTICAST_RECIPIENTS = 500
+# 1秒あたりの送信リクエスト数の上限とバースト
+LINE_RATE_PER_SEC = float(os.environ.get('LINE_RATE_PER_SEC', '5'))
+LINE_RATE_BURST = int(os.environ.get('LINE_RATE_BURST', '5'))
+LINE_MAX_RETRIES = int(os.environ.get('LINE_MAX_RETRIES', '4'))
+LINE_BACKOFF_BASE = float(os.environ.get('LINE_BACKOFF_BASE', '1.0'))
+
+
+_session_http_client = None
+
+
+def session_http_client():
+    """requests.Session を使い回す LINE SDK 用 HTTP クライアントのクラス（初回に SDK を読み込んで作る）"""
+    global _session_http_client
+    if _session_http_client is not None:
+        return _session_http_client
+    from linebot.http_client import RequestsHttpClient, RequestsHttpResponse
+
+    class SessionHttpClient(RequestsHttpClient):
+        def __init__(self, timeout=RequestsHttpClient.DEFAULT_TIMEOUT):
+            super().__init__(timeout)
+            self.session = requests.Session()
+
+        def get(self, url, headers=None, params=None, stream=False, timeout=None):
+            return RequestsHttpResponse(self.session.get(
+                url, headers=headers, params=params, stream=stream, timeout=timeout or self.timeout))
+
+        def post(self, url, headers=None, data=None, timeout=None):
+            return RequestsHttpResponse(self.session.post(
+                url, headers=headers, data=data, timeout=timeout or self.timeout))
+
+        def delete(self, url, headers=None, data=None, timeout=None):
+            return RequestsHttpResponse(self.session.delete(
+                url, headers=headers, data=data, timeout=timeout or self.timeout))
+
+        def put(self, url, headers=None, data=None, timeout=None):
+            return RequestsHttpResponse(self.session.put(
+                url, headers=headers, data=data, timeout=timeout or self.timeout))
+
+    _session_http_client = SessionHttpClient
+    return _session_http_client
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.clock = clock
+        self.sleep = sleep
+        self.updated = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """トークンが1つ貯まるまで待ってから消費する"""
+        with self._lock:
+            while True:
+                now = self.clock()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                self.sleep((1 - self.tokens) / self.rate)
+
+
+def split_text(text, limit=LINE_TEXT_LIMIT):
+    """limit 文字以内に分割する。できるだけ改行の位置で切る"""
+    chunks = []
+    while len(text) > limit:
+        cut = text.rfind('\n', 0, limit)
+        if cut <= 0:
+            cut = limit
+        chunks.append(text[:cut])
+        text = text[cut:].lstrip('\n')
+    if text:
+        chunks.append(text)
+    return chunks
+
+
+def _is_api_error(e):
+    from linebot.exceptions import LineBotApiError
+    return isinstance(e, LineBotApiError)
+
+
+def _is_retryable(e):
+    if _is_api_error(e):
+        return e.status_code == 429 or e.status_code >= 500
+    return isinstance(e, requests.RequestException)
+
+
+class LineDispatcher:
+    def __init__(self, token=None, endpoint=None, rate=LINE_RATE_PER_SEC, burst=LINE_RATE_BURST,
+                 max_retries=LINE_MAX_RETRIES, backoff=LINE_BACKOFF_BASE, sleep=time.sleep):
+        from linebot import LineBotApi
+        token = token if token is not None else os.environ.get('LINE_CHANNEL_ACCESS_TOKEN', '')
+        self.api = LineBotApi(token, endpoint=endpoint or LINE_API_ENDPOINT, http_client=session_http_client())
+        self.bucket = TokenBucket(rate, burst, sleep=sleep)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.sleep = sleep
+        # LineBotApi はリトライキーをインスタンスのヘッダーに書き込むため、呼び出しは直列にする
+        self._api_lock = threading.Lock()
+        self.stats = {'requests': 0, 'retries': 0, 'failures': 0, 'messages': 0}
+
+    def _count(self, key, amount=1):
+        self.stats[key] += amount
+        metrics.incr(f'line_{key}', amount)
+
+    # ── キュー ──────────────────────────────────────────
+
+    def batch(self):
+        """呼び出し側専用の送信キュー（with で使うと、抜けるときに送り残しを送る）"""
+        return LineBatch(self)
+
+    def send(self, to, text):
+        """1通だけすぐに送る"""
+        with self.batch() as batch:
+            batch.enqueue(to, text)
+            return not batch.flush()
+
+    def deliver_pending(self, pending):
+        """
+        送り先（user_id のタプル）→ テキストのリスト を送り先ごとにまとめて送る。
+        送れなかったテキストの set を返す（空なら全部成功）
+        """
+        from linebot.models import TextSendMessage
+        failed = set()
+        for recipients, texts in pending.items():
+            # (元テキスト, 分割後のチャンク) の並び。1回の push に5件ずつ詰める
+            parts = [(t, chunk) for t in texts for chunk in split_text(t)]
+            for i in range(0, len(parts), MAX_MESSAGES_PER_PUSH):
+                batch = parts[i:i + MAX_MESSAGES_PER_PUSH]
+                messages = [TextSendMessage(text=chunk) for _, chunk in batch]
+                if not self._deliver(recipients, messages):
+                    failed.update(t for t, _ in batch)
+        return failed
+
+    # ── 送信 ────────────────────────────────────────────
+
+    def _deliver(self, recipients, messages):
+        if len(recipients) == 1:
+            return self._call(self.api.push_message, recipients[0], messages)
+        ok = True
+        for i in range(0, len(recipients), MAX_MULTICAST_RECIPIENTS):
+            ok = self._call(self.api.multicast, list(recipients[i:i + MAX_MULTICAST_RECIPIENTS]), messages) and ok
+        return ok
+
+    def _call(self, method, to, messages):
+        # 同じリトライキーで再送すれば、LINE 側で二重配信にならない
+        retry_key = str(uuid.uuid4())
+        for attempt in range(self.max_retries + 1):
+            self.bucket.acquire()
+            self._count('requests')
+            try:
+                with self._api_lock:
+                    try:
+                        with metrics.timer('line_send'):
+                            method(to, messages, retry_key=retry_key)
+                    finally:
+                        self.api.headers.pop('X-Line-Retry-Key', None)
+                self._count('messages', len(messages))
+                return True
+            except Exception as e:
+                if _is_api_error(e) and e.status_code == 409:
+                    # リトライキーが受理済み = 前回の送信が実は届いている
+                    self._count('messages', len(messages))
+                    return True
+                if attempt >= self.max_retries or not _is_retryable(e):
+                    self._count('failures')
+                    print(f"[{datetime.now()}] LINE送信失敗: {e}")
+                    return False
+                delay = self.backoff * (2 ** attempt)
+                retry_after = getattr(e, 'headers', None) and e.headers.get('Retry-After')
+                if retry_after and str(retry_after).isdigit():
+                    delay = max(delay, int(retry_after))
+                self._count('retries')
+                print(f"[{datetime.now()}] LINE送信を再試行 ({attempt + 1}/{self.max_retries}) {delay:.1f}秒後: {e}")
+                self.sleep(delay)
+        return False
+
+
+class LineBatch:
+    """
+    1つの処理が積んだメッセージだけを持つキュー。flush() はこのバッチの分だけを送り、
+    その送信結果だけを返す（送信エンジンは共有しても、キューと失敗は呼び出し側ごとに分かれる）
+    """
+
+    def __init__(self, dispatcher):
+        self.dispatcher = dispatcher
+        self._pending = {}
+        # このバッチでこれまでに送れなかったテキスト（with を抜けるときの送信分も含む）
+        self.failed = set()
+
+    def enqueue(self, to, text):
+        """to は user_id 1つ、または user_id のリスト"""
+        recipients = (to,) if isinstance(to, str) else tuple(dict.fromkeys(to))
+        recipients = tuple(r for r in recipients if r)
+        if not recipients or not text:
+            return
+        self._pending.setdefault(recipients, []).append(text)
+
+    def flush(self):
+        pending, self._pending = self._pending, {}
+        failed = self.dispatcher.deliver_pending(pending) if pending else set()
+        self.failed |= failed
+        return failed
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        # 途中で例外になっても積んだ分はここで送る（後で別の送信に混ざって遅れて届かないように）
+        if self._pending:
+            self.flush()
+        return False
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_dispatcher():
+    """プロセス内で共有する送信エンジン（API クライアントは1つだけ）"""
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = LineDispatcher()
+        return _dispatcher
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+計測レイヤー（タイマー・カウンター・構造化ログ）
+- with timer('fetch', source='ipo'): ... で処理段階ごとの所要時間を集計（回数・合計・最大）
+- incr('rows', n, source='geo') でカウンターを加算
+- METRICS_LOG_FORMAT=json なら計測イベントを1行1つの JSON で出力する（既定の text は [METRIC] 行）
+- render_prometheus() は Prometheus のテキスト形式を返す（Flask の /metrics から使う）
+- VERBOSE（LOG_VERBOSE=0 で無効）が偽のときは行ごとのログを組み立てない
+"""
+
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+METRICS_LOG_FORMAT = os.environ.get('METRICS_LOG_FORMAT', 'text')
+# IPO 1件・商品1件ごとのログを出すか
+VERBOSE = os.environ.get('LOG_VERBOSE', '1') != '0'
+METRICS_PREFIX = 'ipobot'
+
+
+def _key(labels):
+    return tuple(sorted(labels.items()))
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}  # (名前, ラベル) → 値
+        self.timers = {}    # ラベル（stage を含む） → [回数, 合計秒, 最大秒]
+
+    def incr(self, name, amount=1, **labels):
+        key = (name, _key(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, stage, seconds, **labels):
+        key = _key({'stage': stage, **labels})
+        with self._lock:
+            entry = self.timers.get(key)
+            if entry is None:
+                entry = self.timers[key] = [0, 0.0, 0.0]
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] = max(entry[2], seconds)
+        if METRICS_LOG_FORMAT == 'json':
+            log_event('timer', stage=stage, seconds=round(seconds, 6), **labels)
+
+    @contextmanager
+    def timer(self, stage, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - started, **labels)
+
+    def total(self, name, **labels):
+        """name のカウンターのうち、labels をすべて含むものの合計"""
+        want = set(labels.items())
+        with self._lock:
+            return sum(v for (n, key), v in self.counters.items() if n == name and want <= set(key))
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.timers.clear()
+
+    def render_prometheus(self):
+        with self._lock:
+            counters = sorted(self.counters.items())
+            timers = sorted(self.timers.items())
+        lines = []
+        typed = set()
+        for (name, labels), value in counters:
+            metric = f'{METRICS_PREFIX}_{name}_total'
+            if metric not in typed:
+                typed.add(metric)
+                lines.append(f'# TYPE {metric} counter')
+            lines.append(f'{metric}{_labels(labels)} {value}')
+        if timers:
+            metric = f'{METRICS_PREFIX}_stage_seconds'
+            lines.append(f'# TYPE {metric} summary')
+            for labels, (count, total, _) in timers:
+                lines.append(f'{metric}_count{_labels(labels)} {count}')
+                lines.append(f'{metric}_sum{_labels(labels)} {total:.6f}')
+            lines.append(f'# TYPE {metric}_max gauge')
+            for labels, (_, _, worst) in timers:
+                lines.append(f'{metric}_max{_labels(labels)} {worst:.6f}')
+        return '\n'.join(lines) + '\n'
+
+    def report(self):
+        """段階ごとの所要時間とカウンターを1回だけまとめて出力する（バッチ実行の最後に使う）"""
+        with self._lock:
+            timers = sorted(self.timers.items())
+            counters = sorted(self.counters.items())
+        for labels, (count, total, worst) in timers:
+            log_event('stage', **dict(labels), count=count, seconds=round(total, 4), max=round(worst, 4))
+        for (name, labels), value in counters:
+            log_event('counter', name=name, value=value, **dict(labels))
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    body = ','.join('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+                    for k, v in labels)
+    return '{' + body + '}'
+
+
+def log_event(event, **fields):
+    """計測イベントを1行で出力する。json モードなら JSON、text モードなら [METRIC] key=value"""
+    if METRICS_LOG_FORMAT == 'json':
+        print(json.dumps({'ts': datetime.now().isoformat(timespec='milliseconds'), 'event': event, **fields},
+                         ensure_ascii=False, default=str))
+    else:
+        print(f"[METRIC] {event} " + ' '.join(f'{k}={v}' for k, v in fields.items()))
+
+
+METRICS = Metrics()
+incr = METRICS.incr
+observe = METRICS.observe
+timer = METRICS.timer
+render_prometheus = METRICS.render_prometheus
+report = METRICS.report
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+取得した行の型付きの表現（IPO の行・ゲオの商品）
+- IPORecord / Product: __slots__ 付きの不変 dataclass。パース時に1回だけ作り、以降はコピーせずに共有する
+- 価格は数値（円）、申し込み期間は datetime、評価は Rating でも持つ（表示用の元の文字列も残す）
+- IPOBatch / ProductBatch: 同じ行を列ごとの配列で持つまとめ。アーカイブへの一括書き込み・キャッシュ保存に使う
+  （差分は geo_monitor が商品を流しながら1件ずつ比べる）
+"""
+
+import re
+from array import array
+from dataclasses import dataclass, replace
+from operator import attrgetter
+from datetime import datetime, date
+from enum import StrEnum
+from date_window import parse_window
+
+YEN_RE = re.compile(r'\d[\d,]*')
+# 詳細ページから足す項目（ipo_parser.DETAIL_FIELDS のキー）
+DETAIL_KEYS = ('lead_underwriter', 'shares_offered', 'lottery_allocation')
+# 配列の中で「価格なし」「日付なし」を表す値
+NO_PRICE = -1
+NO_DATE = 0
+
+
+class Rating(StrEnum):
+    """総合評価。文字列としてもそのまま表示・比較・JSON 化できる"""
+    S = 'S'
+    A = 'A'
+    B = 'B'
+    C = 'C'
+    D = 'D'
+    NONE = ''
+
+    @classmethod
+    def parse(cls, text):
+        try:
+            return cls((text or '').strip().upper())
+        except ValueError:
+            return cls.NONE
+
+
+_RATINGS = tuple(Rating)
+_RATING_CODES = {r: i for i, r in enumerate(_RATINGS)}
+
+
+def parse_yen(text):
+    """『49,800円』『1,200～1,300円』などの最初の金額を int にする。数字が無ければ None"""
+    m = YEN_RE.search(text or '')
+    return int(m.group().replace(',', '')) if m else None
+
+
+# ── IPO ────────────────────────────────────────────────
+
+@dataclass(frozen=True, slots=True)
+class IPORecord:
+    company_name: str
+    application_period: str
+    listing_date: str = ''
+    offering_price: str = ''
+    rating: Rating = Rating.NONE
+    detail_url: str | None = None
+    # 以下はパース済みの値（price は公募価格の円。未定なら None）
+    price: int | None = None
+    start: datetime | None = None
+    end: datetime | None = None
+    # 詳細ページから取れたときだけ入る
+    lead_underwriter: str = ''
+    shares_offered: str = ''
+    lottery_allocation: str = ''
+
+    @classmethod
+    def parse(cls, company_name, application_period, listing_date='', offering_price='', rating='',
+              detail_url=None, ref=None):
+        """一覧の文字列から作る。期間の年は ref（既定は今日）を基準に date_window が決める"""
+        start, end = parse_window(application_period, ref or date.today())
+        return cls(company_name, application_period, listing_date, offering_price, Rating.parse(rating),
+                   detail_url, parse_yen(offering_price), start, end)
+
+    @property
+    def key(self):
+        """通知済みかどうかを覚えるためのキー"""
+        return f"{self.company_name}_{self.application_period}"
+
+    @property
+    def window(self):
+        return self.start, self.end
+
+    def is_open(self, at):
+        return bool(self.start and self.end and self.start <= at <= self.end)
+
+    def with_details(self, details):
+        return replace(self, **{k: v for k, v in details.items() if k in DETAIL_KEYS}) if details else self
+
+    def to_dict(self):
+        """API で返す形（元の文字列だけ。詳細ページの項目は取れたものだけ）"""
+        row = {
+            'company_name': self.company_name,
+            'application_period': self.application_period,
+            'listing_date': self.listing_date,
+            'offering_price': self.offering_price,
+            'rating': str(self.rating),
+            'detail_url': self.detail_url,
+        }
+        for key in DETAIL_KEYS:
+            value = getattr(self, key)
+            if value:
+                row[key] = value
+        return row
+
+
+def _ordinal(dt):
+    return dt.toordinal() if dt else NO_DATE
+
+
+def _from_ordinal(n):
+    return datetime.fromordinal(n) if n != NO_DATE else None
+
+
+class IPOBatch:
+    """
+    IPORecord の並びを列ごとに持つ。価格は整数、申し込み期間は日付の序数の配列
+    （期間は日付単位なので序数に落としても情報は減らない）
+    """
+    __slots__ = ('text', 'ratings', 'prices', 'starts', 'ends')
+    TEXT_COLUMNS = ('company_name', 'application_period', 'listing_date', 'offering_price',
+                    'detail_url') + DETAIL_KEYS
+
+    def __init__(self, text, ratings, prices, starts, ends):
+        self.text = text          # 列名 → 文字列のリスト
+        self.ratings = ratings    # bytearray（Rating の番号）
+        self.prices = prices      # array('q')
+        self.starts = starts      # array('l')
+        self.ends = ends          # array('l')
+
+    @classmethod
+    def from_records(cls, records):
+        records = list(records)
+        # 列ごとに1回ずつ走査する（行ごとに全列を getattr するより速い）
+        text = {name: list(map(attrgetter(name), records)) for name in cls.TEXT_COLUMNS}
+        ratings = bytearray(map(_RATING_CODES.__getitem__, map(attrgetter('rating'), records)))
+        prices = array('q', [NO_PRICE if p is None else p for p in map(attrgetter('price'), records)])
+        starts = array('l', map(_ordinal, map(attrgetter('start'), records)))
+        ends = array('l', map(_ordinal, map(attrgetter('end'), records)))
+        return cls(text, ratings, prices, starts, ends)
+
+    def __len__(self):
+        return len(self.prices)
+
+    def record(self, i):
+        price = self.prices[i]
+        return IPORecord(
+            rating=_RATINGS[self.ratings[i]],
+            price=None if price == NO_PRICE else price,
+            start=_from_ordinal(self.starts[i]),
+            end=_from_ordinal(self.ends[i]),
+            **{name: column[i] for name, column in self.text.items()})
+
+    def records(self):
+        return [self.record(i) for i in range(len(self))]
+
+    def rating(self, i):
+        return _RATINGS[self.ratings[i]]
+
+    def to_columns(self):
+        """JSON にできる列の dict（HTTP キャッシュのパース結果として保存する）"""
+        return {
+            **self.text,
+            'rating': [_RATINGS[code].value for code in self.ratings],
+            'price': self.prices.tolist(),
+            'start': self.starts.tolist(),
+            'end': self.ends.tolist(),
+        }
+
+    @classmethod
+    def from_columns(cls, columns):
+        return cls({name: columns[name] for name in cls.TEXT_COLUMNS},
+                   bytearray(_RATING_CODES[Rating.parse(r)] for r in columns['rating']),
+                   array('q', columns['price']), array('l', columns['start']), array('l', columns['end']))
+
+
+# ── ゲオの商品 ──────────────────────────────────────────
+
+@dataclass(frozen=True, slots=True)
+class Product:
+    name: str
+    price: str = ''       # 表示用（"49,800円"）
+    in_stock: bool = True
+    url: str = ''
+    yen: int | None = None
+
+    @classmethod
+    def parse(cls, name, price='', in_stock=True, url=''):
+        return cls(name, price, in_stock, url, parse_yen(price))
+
+    def price_differs(self, old_price):
+        """前回の表示価格と違うか。両方数値にできれば金額で、できなければ文字列で比べる"""
+        return _price_differs(self.yen, self.price, old_price)
+
+
+def _price_differs(yen, price, old_price):
+    if price == old_price:
+        return False
+    old_yen = parse_yen(old_price)
+    if yen is not None and old_yen is not None:
+        return yen != old_yen
+    return price != old_price
+
+
+class ProductBatch:
+    """Product の並びを列ごとに持つ。価格は整数の配列、在庫は bytearray"""
+    __slots__ = ('names', 'prices', 'yen', 'in_stock', 'urls')
+
+    def __init__(self, names, prices, yen, in_stock, urls):
+        self.names = names
+        self.prices = prices
+        self.yen = yen
+        self.in_stock = in_stock
+        self.urls = urls
+
+    @classmethod
+    def from_products(cls, products):
+        names, prices, urls = [], [], []
+        yen, in_stock = array('q'), bytearray()
+        for p in products:
+            names.append(p.name)
+            prices.append(p.price)
+            urls.append(p.url)
+            yen.append(NO_PRICE if p.yen is None else p.yen)
+            in_stock.append(p.in_stock)
+        return cls(names, prices, yen, in_stock, urls)
+
+    def __len__(self):
+        return len(self.names)
+
+    def product(self, i):
+        yen = self.yen[i]
+        return Product(self.names[i], self.prices[i], bool(self.in_stock[i]), self.urls[i],
+                       None if yen == NO_PRICE else yen)
+
+    def __iter__(self):
+        return (self.product(i) for i in range(len(self)))
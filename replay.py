@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""
+取得結果の記録と再生（ネットワークなしで両方の監視を動かす）
+- record: 実サイトを取得して本文とヘッダーを fixtures/ に保存する
+- serve: 記録をローカルの HTTP サーバーで返す（ETag / Last-Modified が一致すれば 304）
+- ReplayFetcher: CachedFetcher の代わりに記録を直接返す（サーバーを立てずに差し込む）
+- synthetic_ipo_page / synthetic_geo_page: 任意の行数の合成ページ（ベンチマーク用）
+
+使い方:
+    python replay.py record [--details 20]   # IPO一覧・詳細ページとゲオの監視対象を記録
+    python replay.py serve [--port 8765]      # http://127.0.0.1:8765/<ホスト>/<パス> で返す
+    python replay.py run ipo|geo              # 記録を差し込んで監視を1回実行（LINE は送らず表示だけ）
+"""
+
+import os
+import sys
+import json
+import hashlib
+import argparse
+import tempfile
+import threading
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+import requests
+from fetcher import CachedFetcher, FetchResult, DEFAULT_HEADERS
+from line_dispatcher import LineBatch
+
+FIXTURES_DIR = os.environ.get('FIXTURES_DIR', 'fixtures')
+MANIFEST = 'index.json'
+# 記録する IPO 一覧ページ（ipo_sources.IpokisoSource.url と同じ）
+IPO_INDEX_URL = 'https://www.ipokiso.com/company/index.html'
+# 再生時に返すヘッダー
+REPLAY_HEADERS = ('Content-Type', 'ETag', 'Last-Modified')
+
+
+class FixtureStore:
+    """URL → (ステータス・ヘッダー, 本文)。path が None ならメモリ上だけで持つ"""
+
+    def __init__(self, path=None):
+        self.path = path
+        self.entries = {}
+        # 再生サーバーが受けたリクエスト（パス, ヘッダー）。条件付きGETの確認用
+        self.requests = []
+        manifest = os.path.join(path, MANIFEST) if path else None
+        if manifest and os.path.exists(manifest):
+            with open(manifest, 'r', encoding='utf-8') as f:
+                for url, meta in json.load(f).items():
+                    with open(os.path.join(path, meta['file']), 'rb') as body:
+                        self.entries[url] = (meta, body.read())
+
+    def put(self, url, content, status=200, headers=None, etag=True):
+        """etag=False なら ETag を補わない（検証子を返さないサイトを再現する）"""
+        meta = {
+            'file': hashlib.sha1(url.encode('utf-8')).hexdigest() + '.body',
+            'status': status,
+            'headers': {k: v for k, v in (headers or {}).items() if k in REPLAY_HEADERS},
+            'recorded_at': datetime.now().isoformat(timespec='seconds'),
+        }
+        if etag:
+            meta['headers'].setdefault('ETag', '"%s"' % hashlib.sha1(content).hexdigest())
+        self.entries[url] = (meta, content)
+
+    def get(self, url):
+        return self.entries.get(url)
+
+    def save(self):
+        os.makedirs(self.path, exist_ok=True)
+        for meta, content in self.entries.values():
+            with open(os.path.join(self.path, meta['file']), 'wb') as f:
+                f.write(content)
+        with open(os.path.join(self.path, MANIFEST), 'w', encoding='utf-8') as f:
+            json.dump({url: meta for url, (meta, _) in self.entries.items()}, f, ensure_ascii=False, indent=2)
+
+    def find_by_path(self, path):
+        """ホストが分からないとき（ルート相対リンク）はパスだけで探す"""
+        for url, entry in self.entries.items():
+            parts = urlsplit(url)
+            if (parts.path + ('?' + parts.query if parts.query else '')) == path:
+                return entry
+        return None
+
+
+# ── 記録 ────────────────────────────────────────────────
+
+def record_urls(store, urls):
+    session = requests.Session()
+    session.headers.update(DEFAULT_HEADERS)
+    for url in urls:
+        try:
+            response = session.get(url, timeout=30)
+            response.raise_for_status()
+        except Exception as e:
+            print(f"[{datetime.now()}] 記録失敗: {url} -> {e}")
+            continue
+        store.put(url, response.content, response.status_code, response.headers)
+        print(f"[{datetime.now()}] 記録: {url} ({len(response.content)} bytes)")
+    session.close()
+
+
+def record(store, details=20):
+    from ipo_parser import extract_ipo_rows
+    from geo_monitor import load_targets
+    record_urls(store, [IPO_INDEX_URL])
+    entry = store.get(IPO_INDEX_URL)
+    if entry:
+        rows = extract_ipo_rows(entry[1], base_url=IPO_INDEX_URL)
+        record_urls(store, [r.detail_url for r in rows if r.detail_url][:details])
+    record_urls(store, [t['url'] for t in load_targets()])
+    store.save()
+
+
+# ── 再生 ────────────────────────────────────────────────
+
+def local_url(url, base):
+    """記録済み URL を再生サーバー上の URL にする（/<ホスト>/<パス>）"""
+    parts = urlsplit(url)
+    return f"{base}/{parts.netloc}{parts.path}" + (f"?{parts.query}" if parts.query else '')
+
+
+def _handler(store):
+    class ReplayHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            store.requests.append((self.path, dict(self.headers)))
+            host, _, rest = self.path.lstrip('/').partition('/')
+            entry = None
+            for scheme in ('https', 'http'):
+                entry = entry or store.get(f"{scheme}://{host}/{rest}")
+            entry = entry or store.find_by_path(self.path)
+            if entry is None:
+                self.send_response(404)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            meta, content = entry
+            headers = meta['headers']
+            # If-None-Match があれば If-Modified-Since より優先する（RFC 7232 6節）
+            if self.headers.get('If-None-Match'):
+                not_modified = self.headers.get('If-None-Match') == headers.get('ETag')
+            else:
+                not_modified = bool(self.headers.get('If-Modified-Since')
+                                    and self.headers.get('If-Modified-Since') == headers.get('Last-Modified'))
+            self.send_response(304 if not_modified else meta['status'])
+            for k, v in headers.items():
+                self.send_header(k, v)
+            body = b'' if not_modified else content
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return ReplayHandler
+
+
+def start_server(store, port=0):
+    """再生サーバーを別スレッドで起動して (サーバー, ベースURL) を返す"""
+    server = ThreadingHTTPServer(('127.0.0.1', port), _handler(store))
+    threading.Thread(target=server.serve_forever, daemon=True, name='replay').start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+class ReplayFetcher(CachedFetcher):
+    """記録を直接返す CachedFetcher（HTTP もディスクキャッシュも使わない）"""
+
+    def __init__(self, store, source='replay'):
+        super().__init__(cache_dir='', source=source)
+        self.store = store
+
+    def fetch(self, url, timeout=None):
+        entry = self.store.get(url)
+        if entry is None:
+            raise requests.HTTPError(f"記録がありません: {url}")
+        meta, content = entry
+        self._count('requests')
+        self._count('bytes_downloaded', len(content))
+        return FetchResult(url, meta['status'], content, meta['headers'])
+
+
+class PrintDispatcher:
+    """LINE に送らず内容を表示するだけの送信エンジン（再生実行用）"""
+
+    def batch(self):
+        return LineBatch(self)
+
+    def deliver_pending(self, pending):
+        for texts in pending.values():
+            for text in texts:
+                print(f"----- LINE -----\n{text}")
+        return set()
+
+    def send(self, to, text):
+        with self.batch() as batch:
+            batch.enqueue(to, text)
+            return not batch.flush()
+
+
+def run_ipo(store, workdir):
+    # 通知済みストアやアーカイブは作業ディレクトリに作り、本番の状態には触れない
+    os.environ.setdefault('IPO_DEDUP_PATH', os.path.join(workdir, 'ipo_known.json'))
+    os.environ.setdefault('IPO_ARCHIVE_DB', os.path.join(workdir, 'ipo_archive.db'))
+    os.environ.setdefault('IPO_JOBS_DB', os.path.join(workdir, 'jobs.db'))
+    from ipo_monitor import IPOMonitor
+    monitor = IPOMonitor()
+    monitor.fetcher = monitor.details.fetcher = ReplayFetcher(store, source='ipo')
+    monitor.line = PrintDispatcher()
+    os.environ.setdefault('LINE_USER_ID', 'replay')
+    monitor.daily_morning_check()
+
+
+def run_geo(store, workdir):
+    import geo_monitor
+    from geo_store import GeoStateStore
+    backend = geo_monitor.HttpBackend()
+    backend.fetcher = ReplayFetcher(store, source='geo')
+    targets = geo_monitor.load_targets()
+    state = GeoStateStore(os.path.join(workdir, 'geo_state.jsonl'))
+    with geo_monitor.BackendPool(backends=[backend]) as pool:
+        results = geo_monitor.run_targets(targets, pool, state)
+    for section in geo_monitor.build_digest(targets, results):
+        print(f"----- LINE -----\n{section}")
+
+
+# ── 合成ページ ───────────────────────────────────────────
+
+def synthetic_ipo_page(n, today=None, link_prefix='/company/2026/'):
+    """ipokiso の一覧と同じ形（企業名テーブル + 詳細テーブル）で n 行のページを作る"""
+    today = today or datetime.now()
+    names, details = [], []
+    for i in range(n):
+        # 3行に1行は受付中、残りは過去・未来の期間
+        start = today + timedelta(days=(i % 3 - 1) * 7 - 1)
+        end = start + timedelta(days=4)
+        listing = end + timedelta(days=6)
+        names.append(f'<tr><td><a href="{link_prefix}c{i}.html">合成企業{i}</a></td></tr>')
+        details.append(
+            f'<tr><td>{start.month}/{start.day}～{end.month}/{end.day}</td>'
+            f'<td>{listing.month}/{listing.day}</td><td>{1000 + i:,}円</td>'
+            f'<td><img src="/img/{"sabcd"[i % 5]}03.gif"></td></tr>')
+    return (f'<html><body><table><tr><th>企業名</th></tr>{"".join(names)}</table>'
+            '<table><tr><th>申し込み期間</th><th>上場日</th><th>公募価格</th><th>総合評価</th></tr>'
+            f'{"".join(details)}</table></body></html>').encode('utf-8')
+
+
+def synthetic_geo_page(n, price=49800, changed_every=0, sold_every=0):
+    """li.p-item の商品カードを n 件並べたページ。changed_every 件ごとに価格を変える"""
+    cards = []
+    for i in range(n):
+        p = price + i + (1000 if changed_every and i % changed_every == 0 else 0)
+        sold = '<em>売り切れ</em>' if sold_every and i % sold_every == 0 else ''
+        cards.append(f'<li class="p-item"><a href="/p/{i}"><h3 class="p-item__name">端末{i}</h3></a>'
+                     f'<span class="p-item__price">{p:,}円(税込)</span>{sold}</li>')
+    return (f'<html><body><ul class="list">{"".join(cards)}</ul></body></html>').encode('utf-8')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='取得結果の記録と再生')
+    parser.add_argument('--fixtures', default=FIXTURES_DIR)
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('record', help='実サイトを取得して記録する')
+    p.add_argument('--details', type=int, default=20, help='記録する詳細ページの最大数')
+    p = sub.add_parser('serve', help='記録をローカルの HTTP サーバーで返す')
+    p.add_argument('--port', type=int, default=8765)
+    p = sub.add_parser('run', help='記録を差し込んで監視を1回実行する')
+    p.add_argument('monitor', choices=['ipo', 'geo'])
+    p.add_argument('--workdir', default=None, help='状態ファイルを置く場所（既定: 一時ディレクトリ）')
+    args = parser.parse_args(argv)
+
+    if args.command == 'record':
+        record(FixtureStore(args.fixtures), args.details)
+        return
+    store = FixtureStore(args.fixtures)
+    if not store.entries:
+        print(f"{args.fixtures} に記録がありません。先に python replay.py record を実行してください")
+        return 1
+    if args.command == 'serve':
+        server, base = start_server(store, args.port)
+        for url in store.entries:
+            print(local_url(url, base))
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            server.shutdown()
+    elif args.command == 'run':
+        workdir = args.workdir or tempfile.mkdtemp(prefix='replay-')
+        (run_ipo if args.monitor == 'ipo' else run_geo)(store, workdir)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
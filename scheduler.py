@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+イベント駆動のジョブスケジューラー（asyncio）
+- 次の実行時刻までちょうど眠り、ポーリングしない
+- ジョブはスレッドプールで並行実行し、遅いジョブが他のジョブを止めない
+- 同じジョブが前回分の実行中なら今回分はスキップする（重複実行防止）
+- cron 形式・一定間隔のトリガーに、ランダムな揺らぎ（jitter）を足せる
+"""
+
+import random
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+
+def _parse_cron_field(field, low, high):
+    """cron の1項目（*, 5, 1-5, */15, 5/15, 1-30/10, 1,3,5 など）を値の set にする"""
+    values = set()
+    for part in field.split(','):
+        step = None
+        if '/' in part:
+            part, step_text = part.split('/', 1)
+            step = int(step_text)
+            if step < 1:
+                raise ValueError(f"cron の間隔は1以上で指定してください: {field}")
+        if part == '*':
+            start, end = low, high
+        elif '-' in part:
+            start, end = (int(x) for x in part.split('-', 1))
+        else:
+            start = int(part)
+            # 『5/15』は 5 から上限まで15おき（5,20,35,50）
+            end = start if step is None else high
+        if start < low or end > high or start > end:
+            raise ValueError(f"cron の値が範囲外です: {field}")
+        values.update(range(start, end + 1, step or 1))
+    return values
+
+
+class CronTrigger:
+    """『分 時 日 月 曜日』の5項目。曜日は 0=日曜 ～ 6=土曜（7 も日曜）"""
+
+    def __init__(self, expr):
+        fields = expr.split()
+        if len(fields) != 5:
+            raise ValueError(f"cron 式は5項目で指定してください: {expr}")
+        self.expr = expr
+        self.minutes = _parse_cron_field(fields[0], 0, 59)
+        self.hours = _parse_cron_field(fields[1], 0, 23)
+        self.days = _parse_cron_field(fields[2], 1, 31)
+        self.months = _parse_cron_field(fields[3], 1, 12)
+        self.weekdays = {d % 7 for d in _parse_cron_field(fields[4], 0, 7)}
+        # 日と曜日の両方が指定されていればどちらかに合えばよい（cron と同じ）
+        self._any_day = fields[2] == '*'
+        self._any_weekday = fields[4] == '*'
+
+    def _day_matches(self, d):
+        day_ok = d.day in self.days
+        weekday_ok = (d.isoweekday() % 7) in self.weekdays
+        if self._any_day or self._any_weekday:
+            return day_ok and weekday_ok
+        return day_ok or weekday_ok
+
+    def next_after(self, now):
+        t = now.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        # 最大4年先まで（2/29 のような指定にも対応）
+        for _ in range(366 * 4):
+            if t.month in self.months and self._day_matches(t):
+                for hour in sorted(h for h in self.hours if h >= t.hour):
+                    first_minute = t.minute if hour == t.hour else 0
+                    minutes = [m for m in sorted(self.minutes) if m >= first_minute]
+                    if minutes:
+                        return t.replace(hour=hour, minute=minutes[0])
+            t = (t + timedelta(days=1)).replace(hour=0, minute=0)
+        raise ValueError(f"cron 式に一致する日時がありません: {self.expr}")
+
+    def __repr__(self):
+        return f"cron({self.expr})"
+
+
+class IntervalTrigger:
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+    def next_after(self, now):
+        return now + timedelta(seconds=self.seconds)
+
+    def __repr__(self):
+        return f"every({self.seconds}s)"
+
+
+class Job:
+    def __init__(self, name, func, trigger, jitter=0):
+        self.name = name
+        self.func = func
+        self.trigger = trigger
+        self.jitter = jitter
+        self.next_run = None
+        self.running = False
+
+    def schedule_next(self, now):
+        self.next_run = self.trigger.next_after(now)
+        if self.jitter:
+            self.next_run += timedelta(seconds=random.uniform(0, self.jitter))
+
+
+class AsyncScheduler:
+    def __init__(self, max_workers=4):
+        self.jobs = {}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='sched')
+        self._loop = None
+        self._wakeup = None
+        self._stopped = False
+
+    def add_job(self, name, func, trigger, jitter=0, run_immediately=False):
+        job = Job(name, func, trigger, jitter)
+        now = datetime.now()
+        if run_immediately:
+            job.next_run = now
+        else:
+            job.schedule_next(now)
+        self.jobs[name] = job
+        print(f"[{now}] ジョブ登録: {name} {trigger!r} 次回={job.next_run}")
+        self._notify()
+        return job
+
+    def reschedule(self, name):
+        """トリガーの前提（申し込み期間など）が変わったときに、次回時刻を今から計算し直す"""
+        job = self.jobs.get(name)
+        if job is None:
+            return
+        job.schedule_next(datetime.now())
+        print(f"[{datetime.now()}] ジョブ {name} の次回を変更: {job.next_run}")
+        self._notify()
+
+    def _notify(self):
+        # 別スレッドからの登録・停止でもループを起こして次回時刻を計算し直させる
+        if self._loop is not None and self._wakeup is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def stop(self):
+        self._stopped = True
+        self._notify()
+
+    async def _execute(self, job):
+        job.running = True
+        started = datetime.now()
+        try:
+            await self._loop.run_in_executor(self._executor, job.func)
+        except Exception as e:
+            print(f"[{datetime.now()}] ジョブ {job.name} でエラー: {e}")
+        finally:
+            job.running = False
+            elapsed = (datetime.now() - started).total_seconds()
+            print(f"[{datetime.now()}] ジョブ {job.name} 完了 ({elapsed:.1f}秒)")
+
+    async def run(self):
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        tasks = set()
+        while not self._stopped:
+            now = datetime.now()
+            for job in self.jobs.values():
+                if job.next_run is None or job.next_run > now:
+                    continue
+                if job.running:
+                    print(f"[{now}] ジョブ {job.name} は前回分が実行中のためスキップ")
+                else:
+                    task = asyncio.create_task(self._execute(job))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+                job.schedule_next(now)
+            upcoming = [j.next_run for j in self.jobs.values() if j.next_run is not None]
+            delay = max(0.0, (min(upcoming) - datetime.now()).total_seconds()) if upcoming else None
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def start_in_thread(self):
+        """専用スレッドでイベントループを回す（Flask と同じプロセスで動かす用）"""
+        thread = threading.Thread(target=lambda: asyncio.run(self.run()), daemon=True, name='scheduler')
+        thread.start()
+        return thread
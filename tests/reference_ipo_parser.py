@@ -0,0 +1,118 @@
+"""
+IPO 一覧の抽出の参照実装（ipo_parser の1回走査版に置き換える前の find_all 版をそのまま残したもの）。
+tests/test_ipo_parser.py で、保存したページに対して ipo_parser.extract_ipo_rows と同じ結果になるかを比べる
+"""
+
+import re
+from bs4 import BeautifulSoup
+
+
+def _is_company_table(table):
+    # 最初の行に『企業名』ヘッダーが1列で存在するテーブル
+    ths = table.find_all('th')
+    if len(ths) == 1 and '企業名' in ths[0].get_text(strip=True):
+        return True
+    # 企業名リンクが多数存在し、列が1つだけの行が続く場合
+    rows = table.find_all('tr')
+    if rows:
+        cells_counts = set(len(r.find_all(['td', 'th'])) for r in rows)
+        if cells_counts == {1} and any(r.find('a') for r in rows):
+            return True
+    return False
+
+
+def _is_detail_table(table):
+    # 『申し込み期間』を含むヘッダーがある
+    header = table.find('tr')
+    if not header:
+        return False
+    cells = header.find_all(['th', 'td'])
+    header_text = ''.join(c.get_text(strip=True) for c in cells)
+    return '申し込み期間' in header_text or '申込期間' in header_text
+
+
+def _parse_company_table(table):
+    names = []
+    for row in table.find_all('tr'):
+        cell = row.find(['td', 'th'])
+        if not cell:
+            continue
+        a = cell.find('a')
+        text = (a.get_text(strip=True) if a else cell.get_text(strip=True))
+        if text and text != '企業名':
+            names.append(text)
+    return names
+
+
+def _parse_detail_table(table):
+    # ヘッダー行から列インデックスを特定
+    rows = table.find_all('tr')
+    header_row = None
+    for r in rows:
+        if r.find('th') or '申し込み期間' in r.get_text():
+            header_row = r
+            break
+    if not header_row:
+        return []
+    headers = [c.get_text(strip=True) for c in header_row.find_all(['th', 'td'])]
+
+    def col(name, alt=None):
+        for i, h in enumerate(headers):
+            if name in h or (alt and alt in h):
+                return i
+        return -1
+    idx_period = col('申し込み期間', '申込期間')
+    idx_listing = col('上場日')
+    idx_offering = col('公募価格')
+    idx_rating = col('総合評価')
+    details = []
+    for r in rows[rows.index(header_row) + 1:]:
+        cells = r.find_all('td')
+        if not cells:
+            continue
+
+        def get(i):
+            return cells[i].get_text(strip=True) if 0 <= i < len(cells) else ''
+        period = get(idx_period)
+        listing = get(idx_listing)
+        offering = get(idx_offering)
+        rating = get(idx_rating)
+        if not rating and 0 <= idx_rating < len(cells):
+            img = cells[idx_rating].find('img')
+            if img and img.get('src'):
+                src = img.get('src')
+                rating = 'S' if 's03' in src else 'A' if 'a03' in src else 'B' if 'b03' in src else 'C' if 'c03' in src else 'D' if 'd03' in src else ''
+        details.append({
+            'application_period': period,
+            'listing_date': listing,
+            'offering_price': offering,
+            'rating': rating
+        })
+    return details
+
+
+def parse_ipo_page(content, parser='html.parser'):
+    soup = BeautifulSoup(content, parser)
+    tables = soup.find_all('table')
+    ipo_list = []
+    i = 0
+    while i < len(tables):
+        t = tables[i]
+        if _is_company_table(t) and i + 1 < len(tables) and _is_detail_table(tables[i + 1]):
+            names = _parse_company_table(t)
+            details = _parse_detail_table(tables[i + 1])
+            n = min(len(names), len(details))
+            for k in range(n):
+                d = details[k]
+                if re.search(r'\d{1,2}/\d{1,2}', d.get('application_period', '')):
+                    ipo_list.append({
+                        'company_name': names[k],
+                        'application_period': d['application_period'],
+                        'listing_date': d.get('listing_date', ''),
+                        'offering_price': d.get('offering_price', ''),
+                        'rating': d.get('rating', '')
+                    })
+            i += 2
+        else:
+            i += 1
+    return ipo_list
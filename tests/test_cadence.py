@@ -0,0 +1,73 @@
+"""取得間隔の自動調整（IPO の申し込み開始日・締切日、ゲオの変化頻度）の計算"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+import cadence
+from cadence import next_ipo_poll, geo_interval, change_rate, target_rate, ipo_event_days
+
+WINDOWS = [(datetime(2026, 10, 20), datetime(2026, 10, 23)), (None, None)]
+
+
+def test_event_days_are_start_and_end():
+    assert ipo_event_days(WINDOWS) == {datetime(2026, 10, 20).date(), datetime(2026, 10, 23).date()}
+
+
+@pytest.mark.parametrize('now, expected', [
+    # 前日は1日1回のまま（開始日の朝より先に1日後が来る）
+    (datetime(2026, 10, 18, 12), datetime(2026, 10, 19, 12)),
+    # 開始日の前夜 → 開始日の活動時間の始まり
+    (datetime(2026, 10, 19, 23), datetime(2026, 10, 20, 6)),
+    # 開始日の活動時間中は30分刻み
+    (datetime(2026, 10, 20, 6, 10), datetime(2026, 10, 20, 6, 30)),
+    (datetime(2026, 10, 20, 21, 50), datetime(2026, 10, 20, 22)),
+    # 活動時間が終わったら次の締切日まで1日1回
+    (datetime(2026, 10, 20, 22), datetime(2026, 10, 21, 22)),
+    (datetime(2026, 10, 22, 22), datetime(2026, 10, 23, 6)),
+    # 締切日を過ぎたら1日1回
+    (datetime(2026, 10, 24, 9), datetime(2026, 10, 25, 9)),
+])
+def test_next_ipo_poll(now, expected):
+    assert next_ipo_poll(WINDOWS, now) == expected
+
+
+def test_no_windows_polls_daily():
+    now = datetime(2026, 10, 18, 8)
+    assert next_ipo_poll([], now) == now + timedelta(seconds=cadence.IPO_SLOW_INTERVAL)
+
+
+@pytest.mark.parametrize('rate, seconds', [
+    (None, cadence.GEO_DEFAULT_INTERVAL),
+    (0, cadence.GEO_MAX_INTERVAL),
+    (1, cadence.GEO_BASE_INTERVAL),
+    (0.01, cadence.GEO_BASE_INTERVAL * 10),
+    (100, cadence.GEO_MIN_INTERVAL),
+    (0.0001, cadence.GEO_MAX_INTERVAL),
+])
+def test_geo_interval_is_inverse_sqrt_of_rate_within_bounds(rate, seconds):
+    assert geo_interval(rate) == pytest.approx(seconds)
+
+
+NOW = datetime(2026, 10, 18, 12)
+
+
+def test_change_rate_needs_a_day_of_history():
+    assert change_rate([], NOW - timedelta(hours=23), NOW) is None
+    assert change_rate([], NOW - timedelta(days=2), NOW) == 0
+
+
+def test_change_rate_counts_only_the_lookback_window():
+    first_seen = NOW - timedelta(days=10)
+    times = [NOW - timedelta(days=9), NOW - timedelta(days=3), NOW - timedelta(hours=1)]
+    hours = cadence.GEO_LOOKBACK.total_seconds() / 3600
+    assert change_rate(times, first_seen, NOW) == pytest.approx(2 / hours)
+
+
+def test_target_rate_sums_products_and_skips_first_record():
+    def row(*ages):
+        return {'history': [[(NOW - timedelta(hours=h)).isoformat(), '1円', True] for h in ages]}
+    rows = {'a': row(72, 10, 5), 'b': row(48, 1), 'c': {'history': []}}
+    # a は2回・b は1回変化（履歴の最初の1件は初回の記録）。観測期間は最初に見た 72時間前から
+    assert target_rate(rows, NOW) == pytest.approx(3 / 72)
+    assert target_rate({'c': {}}, NOW) is None
@@ -0,0 +1,100 @@
+"""
+date_window の性質テスト。hypothesis があれば乱数で、無ければ決まった日付の組み合わせで確かめる
+- 基準日の WINDOW_LEAD_DAYS 日後から約300日前までに始まった期間は、実際の年で読める（年またぎを含む）
+- 終了は開始より後（end >= start）
+"""
+
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from date_window import parse_window, parse_month_day_after, WINDOW_LEAD_DAYS
+import metrics
+
+try:
+    from hypothesis import given, strategies as st
+except ImportError:
+    given = None
+
+# 一覧に残っている過去の IPO はせいぜいこの日数前まで
+PAST_DAYS = 300
+
+
+def _raw(start, end):
+    return f"{start.month}/{start.day}～{end.month}/{end.day}"
+
+
+def check_window_round_trip(ref, offset, length):
+    """ref から offset 日ずれた日に始まり length 日続く期間を、年なしの文字列から復元できる"""
+    start = ref + timedelta(days=offset)
+    end = start + timedelta(days=length)
+    parsed_start, parsed_end = parse_window(_raw(start, end), ref)
+    assert parsed_start == datetime(start.year, start.month, start.day)
+    assert parsed_end == datetime(end.year, end.month, end.day)
+    assert parsed_end >= parsed_start
+
+
+# 年末年始・うるう年・夏以降を含む基準日
+REFS = [date(2025, 12, 20), date(2025, 12, 31), date(2026, 1, 1), date(2026, 1, 10),
+        date(2026, 3, 1), date(2026, 9, 1), date(2026, 11, 15), date(2028, 2, 29)]
+OFFSETS = [-PAST_DAYS, -200, -150, -60, -14, -1, 0, 1, 14, 45, WINDOW_LEAD_DAYS]
+LENGTHS = [0, 3, 10]
+
+
+@pytest.mark.parametrize('ref', REFS)
+@pytest.mark.parametrize('offset', OFFSETS)
+@pytest.mark.parametrize('length', LENGTHS)
+def test_window_round_trip(ref, offset, length):
+    check_window_round_trip(ref, offset, length)
+
+
+if given is not None:
+    @given(st.dates(min_value=date(2001, 1, 1), max_value=date(2090, 12, 31)),
+           st.integers(min_value=-PAST_DAYS, max_value=WINDOW_LEAD_DAYS),
+           st.integers(min_value=0, max_value=14))
+    def test_window_round_trip_property(ref, offset, length):
+        check_window_round_trip(ref, offset, length)
+
+
+def test_past_window_stays_in_the_past():
+    # 夏以降に読んでも、同じ年の2月の IPO を翌年にしない
+    assert parse_window('2/10～2/14', date(2026, 9, 1)) == (datetime(2026, 2, 10), datetime(2026, 2, 14))
+    assert parse_window('12/20～12/23', date(2026, 3, 1)) == (datetime(2025, 12, 20), datetime(2025, 12, 23))
+
+
+@pytest.mark.parametrize('ref, expected_year', [
+    (date(2025, 12, 20), 2025),  # 年末に翌年1月まで続く期間
+    (date(2026, 1, 3), 2025),    # 年明けに前年12月から続く期間
+])
+def test_year_boundary(ref, expected_year):
+    start, end = parse_window('12/29～1/5', ref)
+    assert start == datetime(expected_year, 12, 29)
+    assert end == datetime(expected_year + 1, 1, 5)
+
+
+def test_upcoming_january_window_read_in_december():
+    assert parse_window('1/8～1/14', date(2025, 12, 20)) == (datetime(2026, 1, 8), datetime(2026, 1, 14))
+
+
+def test_leap_day_resolves_to_a_leap_year():
+    start, _ = parse_window('2/29～3/4', date(2027, 6, 1))
+    assert start == datetime(2024, 2, 29)
+
+
+@pytest.mark.parametrize('raw', ['', '未定', '12/25', '13/1～13/4', '2/30～3/2'])
+def test_unparseable_windows(raw):
+    assert parse_window(raw, date(2026, 1, 1)) == (None, None)
+
+
+def test_debug_log_follows_log_verbose(monkeypatch, capsys):
+    monkeypatch.setattr(metrics, 'VERBOSE', False)
+    assert parse_window('未定（LOG_VERBOSE=0）', date(2026, 1, 1)) == (None, None)
+    assert capsys.readouterr().out == ''
+    monkeypatch.setattr(metrics, 'VERBOSE', True)
+    parse_window('未定（LOG_VERBOSE=1）', date(2026, 1, 1))
+    assert '[DEBUG]' in capsys.readouterr().out
+
+
+def test_listing_date_follows_window_start():
+    assert parse_month_day_after('1/15(木)', datetime(2025, 12, 24)) == date(2026, 1, 15)
+    assert parse_month_day_after('12/25(木)', datetime(2025, 12, 10)) == date(2025, 12, 25)
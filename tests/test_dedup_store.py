@@ -0,0 +1,45 @@
+"""通知済みストア（file）を複数のインスタンス・プロセスで共有したときの動作"""
+
+import multiprocessing
+from datetime import datetime, timedelta
+
+from dedup_store import FileDedupStore
+
+
+def test_instances_see_each_others_keys(tmp_path):
+    path = str(tmp_path / 'ipo_known.json')
+    worker_a, worker_b = FileDedupStore(path), FileDedupStore(path)
+    later = datetime.now() + timedelta(days=3)
+    worker_a.add_many({'A社_1/5～1/8': later})
+    # 先に作られた別ワーカーのストアからも見える（再送しない）
+    assert worker_b.contains_many(['A社_1/5～1/8', 'B社_1/6～1/9']) == {'A社_1/5～1/8'}
+    worker_b.add_many({'B社_1/6～1/9': later})
+    # A が書き直しても B のキーは消えない
+    worker_a.purge()
+    assert FileDedupStore(path).keys() == {'A社_1/5～1/8', 'B社_1/6～1/9'}
+
+
+def test_purge_only_removes_expired_keys(tmp_path):
+    path = str(tmp_path / 'ipo_known.json')
+    store = FileDedupStore(path)
+    now = datetime.now()
+    store.add_many({'old': now - timedelta(days=1), 'new': now + timedelta(days=1), 'forever': None})
+    assert FileDedupStore(path).purge(now) == ['old']
+    assert store.keys() == {'new', 'forever'}
+
+
+def _add_keys(path, worker, count):
+    store = FileDedupStore(path)
+    for i in range(count):
+        store.add_many({f'w{worker}_{i}': None})
+
+
+def test_concurrent_processes_do_not_lose_keys(tmp_path):
+    path = str(tmp_path / 'ipo_known.json')
+    ctx = multiprocessing.get_context('fork')
+    procs = [ctx.Process(target=_add_keys, args=(path, w, 25)) for w in range(4)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+    assert len(FileDedupStore(path)) == 100
@@ -0,0 +1,174 @@
+"""CachedFetcher を再生サーバー（replay.start_server）に向けて確かめる"""
+
+import time
+
+import pytest
+
+from fetcher import CachedFetcher, decode_html
+from replay import FixtureStore, start_server, local_url
+
+LAST_MODIFIED = 'Wed, 01 Oct 2025 00:00:00 GMT'
+ORIGIN = 'https://site.example'
+
+
+class Site:
+    """再生サーバーにページを置くための薄い包み。パスで指定する"""
+
+    def __init__(self, store, base):
+        self.store = store
+        self.base = base
+
+    def put(self, path, body, content_type=None, validators=True):
+        """validators=False なら ETag / Last-Modified を返さない"""
+        headers = {'Last-Modified': LAST_MODIFIED} if validators else {}
+        if content_type:
+            headers['Content-Type'] = content_type
+        self.store.put(ORIGIN + path, body, headers=headers, etag=validators)
+
+    def url(self, path):
+        return local_url(ORIGIN + path, self.base)
+
+    def etag(self, path):
+        return self.store.get(ORIGIN + path)[0]['headers']['ETag']
+
+    @property
+    def received(self):
+        return [headers for _, headers in self.store.requests]
+
+
+@pytest.fixture
+def site():
+    store = FixtureStore()
+    server, base = start_server(store)
+    yield Site(store, base)
+    server.shutdown()
+
+
+@pytest.fixture
+def fetcher(tmp_path):
+    fetcher = CachedFetcher(cache_dir=str(tmp_path / 'cache'))
+    yield fetcher
+    fetcher.close()
+
+
+class CountingParser:
+    PAUSE = 0.01
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, content):
+        self.calls += 1
+        time.sleep(self.PAUSE)
+        return {'text': content.decode('utf-8')}
+
+
+PAGE = '<html><table><tr><td>A社</td></tr></table></html>'.encode('utf-8')
+
+
+def test_second_fetch_is_conditional_and_reuses_the_parse(site, fetcher):
+    site.put('/index.html', PAGE)
+    url = site.url('/index.html')
+    parse = CountingParser()
+    first = fetcher.fetch_parsed(url, parse, version='t@1')
+    second = fetcher.fetch_parsed(url, parse, version='t@1')
+    assert first == second == {'text': PAGE.decode('utf-8')}
+    assert parse.calls == 1
+    # 2回目は前回の ETag / Last-Modified を送っている
+    assert 'If-None-Match' not in site.received[0]
+    assert site.received[1]['If-None-Match'] == site.etag('/index.html')
+    assert site.received[1]['If-Modified-Since'] == LAST_MODIFIED
+    assert fetcher.stats['requests'] == 2
+    assert fetcher.stats['not_modified'] == 1
+    assert fetcher.stats['bytes_downloaded'] == len(PAGE)
+    assert fetcher.stats['bytes_saved'] == len(PAGE)
+    assert fetcher.stats['parse_seconds_saved'] >= CountingParser.PAUSE
+
+
+def test_changed_page_is_parsed_again(site, fetcher):
+    url = site.url('/index.html')
+    parse = CountingParser()
+    site.put('/index.html', PAGE)
+    fetcher.fetch_parsed(url, parse, version='t@1')
+    site.put('/index.html', PAGE.replace('A社'.encode('utf-8'), 'B社'.encode('utf-8')))
+    assert fetcher.fetch_parsed(url, parse, version='t@1')['text'].count('B社') == 1
+    assert parse.calls == 2
+    assert fetcher.stats['not_modified'] == 0
+
+
+def test_parser_version_change_invalidates_cached_parse(site, fetcher):
+    site.put('/index.html', PAGE)
+    url = site.url('/index.html')
+    old, new = CountingParser(), CountingParser()
+    fetcher.fetch_parsed(url, old, version='t@1')
+    # 本文は 304 のままでも、パーサーが変われば新しいパーサーでパースし直す
+    fetcher.fetch_parsed(url, new, version='t@2')
+    assert (old.calls, new.calls) == (1, 1)
+    assert fetcher.stats['not_modified'] == 1
+    fetcher.fetch_parsed(url, new, version='t@2')
+    assert new.calls == 1
+
+
+def test_same_body_without_validators_reuses_parse_by_fingerprint(site, fetcher):
+    site.put('/index.html', PAGE, validators=False)
+    url = site.url('/index.html')
+    parse = CountingParser()
+    fetcher.fetch_parsed(url, parse, version='t@1')
+    fetcher.fetch_parsed(url, parse, version='t@1')
+    assert parse.calls == 1
+    assert fetcher.stats['not_modified'] == 0
+    assert fetcher.stats['bytes_downloaded'] == 2 * len(PAGE)
+
+
+def test_unloadable_cached_parse_is_a_miss(site, fetcher):
+    site.put('/index.html', PAGE)
+    url = site.url('/index.html')
+    parse = CountingParser()
+    fetcher.fetch_parsed(url, parse, version='t@1')
+
+    def load(stored):
+        raise KeyError('columns')
+    assert fetcher.fetch_parsed(url, parse, version='t@1', load=load, dump=lambda p: p) == {'text': PAGE.decode('utf-8')}
+    assert parse.calls == 2
+
+
+def test_cached_parse_is_read_without_fetching(site, fetcher):
+    site.put('/index.html', PAGE)
+    url = site.url('/index.html')
+    assert fetcher.cached_parsed(url, 't@1') is None
+    fetcher.fetch_parsed(url, CountingParser(), version='t@1')
+    parsed, fetched_at = fetcher.cached_parsed(url, 't@1')
+    assert parsed == {'text': PAGE.decode('utf-8')}
+    assert fetched_at is not None
+    assert fetcher.cached_parsed(url, 't@2') is None
+    assert len(site.received) == 1
+
+
+SJIS_PAGE = '<html><li class="p-item">ｉＰｈｏｎｅ　１５　①</li></html>'
+
+
+@pytest.mark.parametrize('body, content_type', [
+    (SJIS_PAGE.encode('cp932'), 'text/html; charset=Shift_JIS'),
+    (SJIS_PAGE.replace('<html>', '<html><meta charset="shift_jis">').encode('cp932'), 'text/html'),
+    (SJIS_PAGE.encode('euc_jp', 'replace').replace(b'?', b''), 'text/html; charset=EUC-JP'),
+    (SJIS_PAGE.encode('utf-8'), None),
+])
+def test_decode_html_follows_declared_charset(body, content_type):
+    assert 'ｉＰｈｏｎｅ' in decode_html(body, content_type)
+
+
+def test_undeclared_non_utf8_page_is_detected():
+    body = ('<html>' + 'ゲオモバイルの中古スマートフォン一覧です。' * 20 + '</html>').encode('cp932')
+    assert 'ゲオモバイル' in decode_html(body)
+
+
+def test_content_type_survives_304(site, fetcher):
+    body = SJIS_PAGE.encode('cp932')
+    site.put('/sjis.html', body, 'text/html; charset=Shift_JIS')
+    url = site.url('/sjis.html')
+    assert fetcher.fetch(url).text == SJIS_PAGE
+    # 304 には Content-Type を付けない
+    site.put('/sjis.html', body)
+    second = fetcher.fetch(url)
+    assert second.not_modified
+    assert second.text == SJIS_PAGE
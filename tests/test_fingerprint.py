@@ -0,0 +1,60 @@
+"""fingerprint.element_spans（正規表現での要素の切り出し）と、ページの指紋の一致判定"""
+
+import pytest
+
+from fingerprint import element_spans, page_fingerprint, match
+
+
+def _parts(text, tag, cls=None):
+    return [text[s:e] for s, e in element_spans(text, tag, cls)]
+
+
+def test_top_level_elements():
+    html = '<p>前</p><table><tr><td>1</td></tr></table>間<table><tr><td>2</td></tr></table>'
+    assert _parts(html, 'table') == ['<table><tr><td>1</td></tr></table>', '<table><tr><td>2</td></tr></table>']
+
+
+def test_nested_same_tag_is_part_of_the_outer_element():
+    html = '<table><tr><td><table><tr><td>内</td></tr></table></td></tr></table><table>次</table>'
+    assert _parts(html, 'table') == [
+        '<table><tr><td><table><tr><td>内</td></tr></table></td></tr></table>', '<table>次</table>']
+
+
+def test_class_filter_and_nested_cards():
+    html = ('<li>メニュー</li>'
+            '<li class="p-item new"><ul><li>色</li><li class="p-item">付属</li></ul></li>'
+            '<li class=\'p-item\'>B</li><li class=p-item>C</li><li class="p-item__name">名前</li>')
+    assert _parts(html, 'li', 'p-item') == [
+        '<li class="p-item new"><ul><li>色</li><li class="p-item">付属</li></ul></li>',
+        "<li class='p-item'>B</li>", '<li class=p-item>C</li>']
+
+
+def test_self_closing_tags():
+    html = ('<div class="card"><div class="icon"/><p>A</p></div>'
+            '<div class="card" />'
+            '<div class="card"><div/>B</div>')
+    assert _parts(html, 'div', 'card') == [
+        '<div class="card"><div class="icon"/><p>A</p></div>', '<div class="card" />', '<div class="card"><div/>B</div>']
+
+
+def test_unclosed_element_runs_to_the_end():
+    assert _parts('<table><tr><td>途中で切れた', 'table') == ['<table><tr><td>途中で切れた']
+
+
+def test_tag_names_are_case_insensitive_and_exact():
+    html = '<TABLE><tr></tr></TABLE><tablet>x</tablet><link rel="a"><li>1</li>'
+    assert _parts(html, 'table') == ['<TABLE><tr></tr></TABLE>']
+    assert _parts(html, 'li') == ['<li>1</li>']
+
+
+def test_region_ignores_noise_outside_and_inside():
+    before = '<p>広告A</p><table><tr><td>IPO</td></tr></table>'.encode('utf-8')
+    after = '<p>広告B</p><table>\n  <tr><td>IPO</td><!-- x --></tr>\n</table>'.encode('utf-8')
+    assert match(page_fingerprint(before, 'table'), page_fingerprint(after, 'table')) == 'region'
+    changed = before.replace('IPO'.encode(), 'IPO2'.encode())
+    assert match(page_fingerprint(before, 'table'), page_fingerprint(changed, 'table')) is None
+
+
+@pytest.mark.parametrize('previous', [None, {}])
+def test_no_previous_fingerprint(previous):
+    assert match(previous, page_fingerprint(b'<table></table>', 'table')) is None
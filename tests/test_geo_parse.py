@@ -0,0 +1,32 @@
+"""ゲオの一覧ページから商品を取り出すときのセレクタの決め方"""
+
+from geo_monitor import iter_products
+
+
+def _page(cards):
+    return '<ul>' + ''.join(f'<li class="p-item">{c}</li>' for c in cards) + '</ul>'
+
+
+NAMED = '<h2>シリーズ見出し</h2><p class="p-item__name">iPhone {i}</p><p class="p-item__price">{i}0,000円</p>'
+# 1枚だけ .p-item__name が無いカード
+UNNAMED = '<h2>Pixel 8</h2><p class="p-item__price">40,000円</p>'
+
+
+def test_one_card_fallback_does_not_change_the_page_selector():
+    html = _page([NAMED.format(i=1), UNNAMED, NAMED.format(i=2), NAMED.format(i=3)])
+    hint = {}
+    names = [p.name for p in iter_products(html, hint)]
+    assert names == ['iPhone 1', 'Pixel 8', 'iPhone 2', 'iPhone 3']
+    assert hint['name'] == '.p-item__name'
+    assert hint['price'] == '.p-item__price'
+    # 次の実行でも同じ名前（= 同じ商品ID）になる
+    assert [p.name for p in iter_products(html, hint)] == names
+
+
+def test_cached_selector_is_replaced_when_the_page_changes():
+    html = _page(['<h3>Galaxy</h3><span class="price">30,000円</span>'] * 2)
+    hint = {'card': 'li.p-item', 'name': '.p-item__name', 'price': '.p-item__price'}
+    products = list(iter_products(html, hint))
+    assert [(p.name, p.yen) for p in products] == [('Galaxy', 30000)] * 2
+    assert hint['name'] == 'h3'
+    assert hint['price'] == '.price'
@@ -0,0 +1,31 @@
+"""GeoRunner（デーモン用）が1つの BackendPool を同じスレッドで使い回し、最後に閉じることを確かめる"""
+
+import threading
+
+import geo_monitor
+
+
+class FakePool:
+    def __init__(self):
+        self.closed_in = None
+
+    def close(self):
+        self.closed_in = threading.get_ident()
+
+
+def test_pool_is_reused_on_one_thread_and_closed_there(monkeypatch):
+    pools = []
+    runs = []
+    monkeypatch.setattr(geo_monitor, 'BackendPool', lambda: pools.append(FakePool()) or pools[-1])
+    monkeypatch.setattr(geo_monitor, 'main', lambda pool: runs.append((pool, threading.get_ident())))
+    runner = geo_monitor.GeoRunner()
+    runner.run()
+    runner.run()
+    runner.close()
+    assert len(pools) == 1
+    assert [pool for pool, _ in runs] == [pools[0], pools[0]]
+    # Playwright を起動したスレッド（＝実行したスレッド）で閉じる
+    threads = {thread for _, thread in runs}
+    assert len(threads) == 1
+    assert pools[0].closed_in in threads
+    assert pools[0].closed_in != threading.get_ident()
@@ -0,0 +1,86 @@
+"""GeoStateStore（追記専用 JSONL）の再生・差分だけの追記・圧縮"""
+
+import json
+
+import pytest
+
+import geo_store
+from geo_store import GeoStateStore
+from records import Product
+
+
+def _products(*items):
+    return [Product.parse(name, price, in_stock) for name, price, in_stock in items]
+
+
+def _lines(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'geo_state.jsonl')
+
+
+def test_only_changes_are_appended_and_replayed(path):
+    store = GeoStateStore(path)
+    assert store.update('t', _products(('iPhone 15', '49,800円', True), ('Pixel 8', '39,800円', False)),
+                        meta={'backend': 'http'}) == (2, 3)
+    # 表記だけ違う価格・同じ在庫は書かない。値下げ・再入荷・消えた商品だけ追記する
+    assert store.update('t', _products(('iPhone 15', '49800円', True), ('Pixel 8', '39,800円', True),
+                                       ('Galaxy S24', '59,800円', True)), meta={'backend': 'http'}) == (3, 2)
+    assert store.update('t', _products(('iPhone  15', '44,800円', True), ('Galaxy S24', '59,800円', True))) == (2, 2)
+    assert [r['op'] for r in _lines(path)] == ['put', 'put', 'meta', 'put', 'put', 'put', 'del']
+
+    replayed = GeoStateStore(path)
+    assert replayed.meta('t') == {'backend': 'http'}
+    rows = replayed.products('t')
+    assert sorted(rows) == ['Galaxy S24', 'iPhone 15']
+    assert rows['iPhone 15']['price'] == '44,800円'
+    assert [h[1] for h in rows['iPhone 15']['history']] == ['49,800円', '44,800円']
+    assert rows == store.products('t')
+
+
+def test_namespaces_are_separate(path):
+    store = GeoStateStore(path)
+    store.update('a', _products(('iPhone 15', '1円', True)))
+    store.update('b', _products(('iPhone 15', '2円', True)))
+    replayed = GeoStateStore(path)
+    assert replayed.products('a')['iPhone 15']['price'] == '1円'
+    assert replayed.products('b')['iPhone 15']['price'] == '2円'
+
+
+def test_torn_last_line_is_skipped(path):
+    GeoStateStore(path).update('t', _products(('iPhone 15', '1円', True)))
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write('{"op": "put", "ns": "t", "id": "Pix')
+    assert list(GeoStateStore(path).products('t')) == ['iPhone 15']
+
+
+def test_history_is_trimmed(path, monkeypatch):
+    monkeypatch.setattr(geo_store, 'HISTORY_LIMIT', 3)
+    store = GeoStateStore(path)
+    for price in range(1, 6):
+        store.update('t', _products(('iPhone 15', f'{price}円', True)))
+    assert [h[1] for h in GeoStateStore(path).products('t')['iPhone 15']['history']] == ['3円', '4円', '5円']
+
+
+def test_compaction_keeps_state_and_history(path, monkeypatch):
+    monkeypatch.setattr(geo_store, 'COMPACT_MIN_LINES', 3)
+    store = GeoStateStore(path)
+    store.update('t', _products(('iPhone 15', '1円', True), ('Pixel 8', '1円', True)), meta={'backend': 'http'})
+    assert store.compact_if_needed() is False
+    for price in range(2, 6):
+        store.update('t', _products(('iPhone 15', f'{price}円', True)))
+    before = {pid: dict(row) for pid, row in store.products('t').items()}
+    assert store.compact_if_needed() is True
+    # 生きている行（メタ1 + 商品1）だけになる
+    assert [r['op'] for r in _lines(path)] == ['meta', 'put']
+    replayed = GeoStateStore(path)
+    assert replayed.products('t') == before
+    assert [h[1] for h in replayed.products('t')['iPhone 15']['history']] == ['1円', '2円', '3円', '4円', '5円']
+    assert replayed.meta('t') == {'backend': 'http'}
+    # 圧縮後の追記も履歴に続く
+    replayed.update('t', _products(('iPhone 15', '6円', True)))
+    assert [h[1] for h in GeoStateStore(path).products('t')['iPhone 15']['history']][-2:] == ['5円', '6円']
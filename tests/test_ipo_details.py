@@ -0,0 +1,97 @@
+"""DetailCrawler のホストごとの同時接続数の制限と、HTTP キャッシュによる再取得の省略"""
+
+import threading
+import time
+from urllib.parse import urlsplit
+
+import pytest
+
+from fetcher import CachedFetcher
+from ipo_details import DetailCrawler
+from records import IPORecord
+from replay import FixtureStore, start_server, local_url
+
+DETAIL = '<table><tr><th>主幹事</th><td>{}</td></tr><tr><th>公開株数</th><td>1,000,000株</td></tr></table>'
+
+
+class SlowFetcher:
+    """fetch_parsed を少し待たせ、ホストごとの同時実行数の最大を記録する"""
+
+    def __init__(self, fail=()):
+        self.stats = {'not_modified': 0}
+        self.fail = set(fail)
+        self.active = {}
+        self.peak = {}
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def fetch_parsed(self, url, parse):
+        host = urlsplit(url).netloc
+        with self._lock:
+            self.calls.append(url)
+            self.active[host] = self.active.get(host, 0) + 1
+            self.peak[host] = max(self.peak.get(host, 0), self.active[host])
+        try:
+            time.sleep(0.05)
+            if url in self.fail:
+                raise ConnectionError('down')
+            return {'lead_underwriter': url.rsplit('/', 1)[-1]}
+        finally:
+            with self._lock:
+                self.active[host] -= 1
+
+
+def test_per_host_limit_with_more_workers():
+    fetcher = SlowFetcher()
+    crawler = DetailCrawler(fetcher, max_workers=8, per_host=2)
+    urls = [f'https://a.example/{i}' for i in range(6)] + [f'https://b.example/{i}' for i in range(2)]
+    try:
+        details = crawler.fetch_all(urls)
+    finally:
+        crawler.close()
+    assert len(details) == 8
+    assert fetcher.peak == {'a.example': 2, 'b.example': 2}
+
+
+def test_failed_and_duplicate_urls():
+    fetcher = SlowFetcher(fail={'https://a.example/bad'})
+    crawler = DetailCrawler(fetcher, max_workers=2, per_host=2)
+    try:
+        details = crawler.fetch_all(['https://a.example/ok', '', None, 'https://a.example/ok', 'https://a.example/bad'])
+    finally:
+        crawler.close()
+    assert details == {'https://a.example/ok': {'lead_underwriter': 'ok'}}
+    assert sorted(fetcher.calls) == ['https://a.example/bad', 'https://a.example/ok']
+
+
+@pytest.fixture
+def site():
+    store = FixtureStore()
+    server, base = start_server(store)
+    yield store, base
+    server.shutdown()
+
+
+def test_unchanged_pages_are_not_parsed_again(site, tmp_path):
+    store, base = site
+    for name in ('alpha', 'beta'):
+        store.put(f'https://www.ipokiso.com/company/2026/{name}.html', DETAIL.format(f'{name}証券').encode('utf-8'))
+    urls = [local_url(f'https://www.ipokiso.com/company/2026/{name}.html', base) for name in ('alpha', 'beta')]
+    rows = [IPORecord.parse('アルファ', '10/17～10/20', detail_url=urls[0]),
+            IPORecord.parse('ベータ', '10/18～10/22', detail_url=urls[1]),
+            IPORecord.parse('ガンマ', '10/25～10/28')]
+    fetcher = CachedFetcher(cache_dir=str(tmp_path / 'cache'))
+    crawler = DetailCrawler(fetcher, max_workers=2, per_host=1)
+    try:
+        first = crawler.enrich(rows)
+        second = crawler.enrich(rows)
+    finally:
+        crawler.close()
+        fetcher.close()
+    assert [r.lead_underwriter for r in first] == ['alpha証券', 'beta証券', '']
+    assert first[0].shares_offered == '1,000,000株'
+    assert second == first
+    # 2回目は条件付きGETで 304 になり、保存したパース結果を使う
+    assert fetcher.stats['requests'] == 4
+    assert fetcher.stats['not_modified'] == 2
+    assert fetcher.stats['bytes_downloaded'] == sum(len(store.get(u)[1]) for u in store.entries)
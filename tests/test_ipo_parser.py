@@ -0,0 +1,73 @@
+"""
+保存した ipokiso 形式の一覧ページ（tests/fixtures/ipo_index）で、1回走査版の extract_ipo_rows が
+置き換える前の find_all 版（tests/reference_ipo_parser.py）と同じ行を返すことを確かめる。
+実サイトの記録（tests/fixtures/replay）があれば、その一覧ページも同じように比べる:
+    python replay.py --fixtures tests/fixtures/replay record
+"""
+
+import os
+
+import pytest
+
+from ipo_parser import extract_ipo_rows, extract_detail_fields
+from records import Rating
+from replay import FixtureStore, IPO_INDEX_URL
+import reference_ipo_parser
+
+CORPUS = os.path.join(os.path.dirname(__file__), 'fixtures', 'ipo_index')
+RECORDED = FixtureStore(os.path.join(os.path.dirname(__file__), 'fixtures', 'replay'))
+PAGES = sorted(f for f in os.listdir(CORPUS) if f.endswith('.html'))
+# 記録した一覧ページは URL で指定する
+PAGES += [url for url in sorted(RECORDED.entries) if url == IPO_INDEX_URL]
+
+
+def _parsers():
+    parsers = ['html.parser']
+    try:
+        import lxml  # noqa: F401
+        parsers.append('lxml')
+    except ImportError:
+        pass
+    return parsers
+
+
+def _read(name):
+    if name in RECORDED.entries:
+        return RECORDED.get(name)[1]
+    with open(os.path.join(CORPUS, name), 'rb') as f:
+        return f.read()
+
+
+@pytest.mark.parametrize('parser', _parsers())
+@pytest.mark.parametrize('page', PAGES)
+def test_same_rows_as_reference_parser(page, parser):
+    content = _read(page)
+    expected = reference_ipo_parser.parse_ipo_page(content, parser)
+    rows = extract_ipo_rows(content, parser=parser, base_url='https://www.ipokiso.com/company/index.html')
+    assert expected, f'{page} から1行も取れない（コーパスの形が崩れている）'
+    # 評価は IPORecord で Rating に正規化している（全角の『Ｓ』など想定外の表記は未評価になる）
+    assert [{
+        'company_name': r.company_name,
+        'application_period': r.application_period,
+        'listing_date': r.listing_date,
+        'offering_price': r.offering_price,
+        'rating': r.rating,
+    } for r in rows] == [{**d, 'rating': Rating.parse(d['rating'])} for d in expected]
+
+
+def test_detail_urls_are_absolute():
+    rows = extract_ipo_rows(_read('text_ratings_alt_headers.html'),
+                            base_url='https://www.ipokiso.com/company/index.html')
+    assert [r.detail_url for r in rows] == [
+        'https://www.ipokiso.com/company/2026/alpha.html',
+        'https://www.ipokiso.com/company/2026/beta.html',
+        '',
+        'https://www.ipokiso.com/company/2026/delta.html',
+    ]
+
+
+def test_detail_page_fields():
+    html = '''<table><tr><th>主幹事</th><td>SBI証券</td></tr><tr><th>公開株数</th><td>1,000,000株</td></tr></table>
+    <dl><dt>当選本数</dt><dd>10,000本</dd><dt>主幹事</dt><dd>野村證券</dd></dl>'''.encode('utf-8')
+    assert extract_detail_fields(html) == {
+        'lead_underwriter': 'SBI証券', 'shares_offered': '1,000,000株', 'lottery_allocation': '10,000本'}
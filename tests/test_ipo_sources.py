@@ -0,0 +1,119 @@
+"""複数の情報源の統合（merge_sources）と、並行取得の quorum / grace / サイトごとの制限時間"""
+
+import threading
+import time
+from datetime import date
+
+import pytest
+
+from ipo_sources import IPOSource, SourceAggregator, SourceResult, merge_sources, merge_key
+from records import IPORecord, Rating
+
+REF = date(2026, 10, 18)
+
+
+class StubSource(IPOSource):
+    """delay 秒待ってから rows を返す（error を渡すとその例外を投げる）"""
+
+    def __init__(self, name, rows=(), delay=0.0, error=None, timeout=None):
+        super().__init__(timeout)
+        self.name = name
+        self.url = f'https://{name}.example/'
+        self.rows = list(rows)
+        self.delay = delay
+        self.error = error
+        self.release = threading.Event()
+
+    def fetch(self, fetcher):
+        self.release.wait(self.delay)
+        if self.error:
+            raise self.error
+        return self.rows
+
+
+def _ipo(name, period, listing='', price='', rating='', url=None):
+    return IPORecord.parse(name, period, listing, price, rating, url, ref=REF)
+
+
+FIRST = [_ipo('株式会社アルファ', '10/17～10/20', '10/29', '1,000円', 'S'),
+         _ipo('ベータ', '10/18～10/22')]
+SECOND = [_ipo('アルファ', '１０/１７〜１０/２０', '10/30', '1,000', 'A', 'https://second.example/alpha'),
+          _ipo('(株)ベータ', '10/18-10/22', '11/2', '2,000円', 'B'),
+          _ipo('ガンマ', '10/25～10/28', '11/5', '900円', 'C')]
+
+
+def test_abstract_source_needs_fetch():
+    with pytest.raises(TypeError):
+        IPOSource()
+
+
+def test_merge_key_ignores_width_spaces_and_company_suffix():
+    assert merge_key(FIRST[0]) == merge_key(SECOND[0])
+    assert merge_key(FIRST[1]) == merge_key(SECOND[1])
+    assert merge_key(FIRST[0]) != merge_key(SECOND[2])
+
+
+def test_merge_prefers_first_source_and_fills_blanks():
+    rows, _ = merge_sources([SourceResult('first', FIRST, 'ok'), SourceResult('second', SECOND, 'ok')])
+    assert [r.company_name for r in rows] == ['株式会社アルファ', 'ベータ', 'ガンマ']
+    alpha, beta, _ = rows
+    # 先のサイトに値があればそのまま、空なら後のサイトの値で補う（数値の価格も一緒に）
+    assert (alpha.listing_date, alpha.rating, alpha.detail_url) == ('10/29', Rating.S, 'https://second.example/alpha')
+    assert (beta.listing_date, beta.offering_price, beta.price, beta.rating) == ('11/2', '2,000円', 2000, Rating.B)
+
+
+def test_merge_reports_disagreements_only_between_values_present():
+    _, disagreements = merge_sources([SourceResult('first', FIRST, 'ok'), SourceResult('second', SECOND, 'ok')])
+    assert [(d['company_name'], d['field']) for d in disagreements] == [
+        ('株式会社アルファ', 'listing_date'), ('株式会社アルファ', 'rating')]
+    assert disagreements[1]['values'] == {'first': 'S', 'second': 'A'}
+
+
+def test_merge_skips_failed_sources():
+    rows, disagreements = merge_sources([SourceResult('first', [], 'error', 'down'),
+                                         SourceResult('second', SECOND, 'ok')])
+    assert rows == SECOND
+    assert disagreements == []
+
+
+def _collect(sources, **kwargs):
+    aggregator = SourceAggregator(sources, **kwargs)
+    started = time.monotonic()
+    try:
+        report = aggregator.collect(None)
+    finally:
+        for source in sources:
+            source.release.set()
+        aggregator.close()
+    return report, time.monotonic() - started
+
+
+def test_quorum_stops_waiting_after_grace():
+    slow = StubSource('slow', SECOND, delay=10)
+    report, elapsed = _collect([StubSource('fast', FIRST), slow], quorum=1, grace=0.2)
+    assert elapsed < 2
+    assert [(r.name, r.status) for r in report.results] == [('fast', 'ok'), ('slow', 'timeout')]
+    assert '打ち切り' in report.results[1].error
+    assert report.rows == FIRST
+
+
+def test_source_arriving_within_grace_is_merged():
+    report, _ = _collect([StubSource('fast', FIRST), StubSource('late', SECOND, delay=0.1)], quorum=1, grace=2)
+    assert [r.status for r in report.results] == ['ok', 'ok']
+    assert len(report.rows) == 3
+
+
+def test_per_source_timeout_without_quorum():
+    slow = StubSource('slow', SECOND, delay=10, timeout=0.3)
+    report, elapsed = _collect([StubSource('fast', FIRST), slow], quorum=2, grace=5)
+    assert elapsed < 2
+    assert report.results[1].status == 'timeout'
+    assert '0.3秒以内に応答なし' in report.results[1].error
+
+
+def test_errors_and_empty_pages_are_failures():
+    report, _ = _collect([StubSource('down', error=ConnectionError('down')), StubSource('empty'),
+                          StubSource('ok', FIRST)], quorum=1, grace=1)
+    assert [(r.name, r.status) for r in report.failed] == [('down', 'error'), ('empty', 'empty')]
+    assert report.results[0].error == 'ConnectionError: down'
+    assert report.rows == FIRST
@@ -0,0 +1,111 @@
+"""JobQueue の相乗り（single-flight）・落ちたワーカーのジョブの引き継ぎ・失敗の記録"""
+
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+import jobs
+from jobs import JobQueue
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(str(tmp_path / 'jobs.db'), heartbeat=0.05)
+
+
+def _wait(queue, job_id, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = queue.get(job_id)
+        if job['status'] not in ('queued', 'running'):
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f'ジョブ {job_id} が終わらない')
+
+
+def _insert(queue, job_id, host, pid, heartbeat_at, created_at=None):
+    now = time.time()
+    queue._connect().execute(
+        "INSERT INTO jobs (id, kind, status, created_at, owner_host, owner_pid, heartbeat_at) "
+        "VALUES (?, 'ipo-check', 'running', ?, ?, ?, ?)",
+        (job_id, created_at or now, host, pid, heartbeat_at))
+
+
+def _dead_pid():
+    proc = subprocess.Popen([sys.executable, '-c', 'pass'])
+    proc.wait()
+    return proc.pid
+
+
+def test_second_submit_joins_the_running_job(queue):
+    release = threading.Event()
+    first, coalesced = queue.submit('ipo-check', lambda: release.wait(5) and {'notified': []})
+    assert coalesced is False
+    second, coalesced = queue.submit('ipo-check', lambda: pytest.fail('二重に実行された'))
+    assert (second, coalesced) == (first, True)
+    # 別の種類のジョブは相乗りしない
+    assert queue.submit('geo-check', lambda: None)[1] is False
+    release.set()
+    assert _wait(queue, first)['result'] == {'notified': []}
+    assert queue.submit('ipo-check', lambda: None) != (first, True)
+
+
+def test_failure_is_recorded(queue):
+    def boom():
+        raise RuntimeError('取得できません')
+    job_id, _ = queue.submit('ipo-check', boom)
+    job = _wait(queue, job_id)
+    assert job['status'] == 'failed'
+    assert job['error'] == '取得できません'
+    assert job['finished_at'] is not None
+
+
+def test_job_of_exited_process_is_taken_over_immediately(queue):
+    # ハートビートは新しくても、同じホストで登録元の pid がもう無ければすぐ引き継ぐ
+    _insert(queue, 'orphan', queue.host, _dead_pid(), time.time())
+    job_id, coalesced = queue.submit('ipo-check', lambda: 'ok')
+    assert coalesced is False
+    orphan = queue.get('orphan')
+    assert orphan['status'] == 'failed'
+    assert orphan['error'].startswith('stale: owner pid')
+    assert _wait(queue, job_id)['status'] == 'succeeded'
+
+
+def test_job_without_heartbeat_is_taken_over(queue):
+    old = time.time() - jobs.JOB_STALE_SECONDS - 1
+    _insert(queue, 'silent', 'other-host', 1, old, created_at=old)
+    _insert(queue, 'alive', 'other-host', 1, time.time())
+    # 別ホストで生きているジョブ（ハートビートが新しい）には相乗りする
+    assert queue.submit('ipo-check', lambda: None) == ('alive', True)
+    assert queue.get('silent')['error'] == 'stale: no heartbeat'
+
+
+def test_running_job_keeps_its_heartbeat_fresh(queue):
+    release = threading.Event()
+    job_id, _ = queue.submit('ipo-check', lambda: release.wait(5))
+    first = queue._connect().execute('SELECT heartbeat_at FROM jobs WHERE id = ?', (job_id,)).fetchone()[0]
+    time.sleep(0.2)
+    later = queue._connect().execute('SELECT heartbeat_at FROM jobs WHERE id = ?', (job_id,)).fetchone()[0]
+    release.set()
+    _wait(queue, job_id)
+    assert later > first
+
+
+def test_old_database_gets_owner_columns(tmp_path):
+    import sqlite3
+    path = str(tmp_path / 'old.db')
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE jobs (id TEXT PRIMARY KEY, kind TEXT NOT NULL, status TEXT NOT NULL, '
+                 'created_at REAL NOT NULL, started_at REAL, finished_at REAL, result TEXT, error TEXT)')
+    conn.execute("INSERT INTO jobs (id, kind, status, created_at) VALUES ('legacy', 'ipo-check', 'running', ?)",
+                 (time.time() - jobs.JOB_STALE_SECONDS - 1,))
+    conn.commit()
+    conn.close()
+    queue = JobQueue(path)
+    job_id, coalesced = queue.submit('ipo-check', lambda: None)
+    assert coalesced is False
+    assert queue.get('legacy')['error'] == 'stale: no heartbeat'
+    _wait(queue, job_id)
@@ -0,0 +1,129 @@
+"""LINE 送信エンジンをローカルのモック LINE API（LINE_API_ENDPOINT の代わり）に向けて確かめる"""
+
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from line_dispatcher import LineDispatcher, MAX_MESSAGES_PER_PUSH
+
+
+class MockLine:
+    """push / multicast を受けて記録する。本文に 'NG' を含むメッセージは 400、'RETRY' は最初の1回だけ 500"""
+
+    def __init__(self):
+        self.requests = []
+        self.retried = set()
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                texts = [m['text'] for m in body['messages']]
+                mock.requests.append({'path': self.path, 'to': body['to'], 'texts': texts,
+                                      'retry_key': self.headers.get('X-Line-Retry-Key')})
+                status = 200
+                if any('NG' in t for t in texts):
+                    status = 400
+                elif any('RETRY' in t for t in texts) and self.headers.get('X-Line-Retry-Key') not in mock.retried:
+                    mock.retried.add(self.headers.get('X-Line-Retry-Key'))
+                    status = 500
+                payload = b'{}' if status == 200 else b'{"message":"error"}'
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.endpoint = f'http://127.0.0.1:{self.server.server_address[1]}'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def sent_texts(self):
+        return [t for r in self.requests for t in r['texts']]
+
+
+@pytest.fixture
+def line():
+    mock = MockLine()
+    yield mock
+    mock.server.shutdown()
+
+
+@pytest.fixture
+def dispatcher(line):
+    return LineDispatcher(token='test', endpoint=line.endpoint, rate=1000, burst=1000,
+                          max_retries=2, backoff=0, sleep=lambda s: None)
+
+
+def test_batches_only_send_their_own_messages(line, dispatcher):
+    ipo = dispatcher.batch()
+    ipo.enqueue('U_ipo', 'ipo NG')
+    # 別の処理（ゲオ監視）の送信は ipo の積み残しを送らず、ipo の失敗も受け取らない
+    assert dispatcher.send('U_geo', 'geo') is True
+    assert line.sent_texts() == ['geo']
+    assert ipo.flush() == {'ipo NG'}
+    assert line.requests[-1]['to'] == 'U_ipo'
+
+
+def test_batch_flushes_leftovers_when_block_raises(line, dispatcher):
+    with pytest.raises(RuntimeError):
+        with dispatcher.batch() as batch:
+            batch.enqueue('U1', 'summary')
+            raise RuntimeError('check failed')
+    assert line.sent_texts() == ['summary']
+    # 後から別の送信をしてもサマリーが再び送られることはない
+    dispatcher.send('U1', 'later')
+    assert line.sent_texts() == ['summary', 'later']
+
+
+def test_batch_remembers_failures_across_flushes(line, dispatcher):
+    with dispatcher.batch() as batch:
+        batch.enqueue('U1', 'summary NG')
+        batch.flush()
+        batch.enqueue('U1', 'late NG')
+    # with を抜けるときの送信の失敗も含めて、このバッチの分だけ残る
+    assert batch.failed == {'summary NG', 'late NG'}
+
+
+def test_packs_five_messages_per_push_and_splits_long_text(line, dispatcher):
+    with dispatcher.batch() as batch:
+        for i in range(6):
+            batch.enqueue('U1', f'm{i}')
+        batch.enqueue('U1', 'a' * 4000 + '\n' + 'b' * 4000)
+        assert batch.flush() == set()
+    assert [len(r['texts']) for r in line.requests] == [MAX_MESSAGES_PER_PUSH, 3]
+    assert line.requests[1]['texts'][1:] == ['a' * 4000, 'b' * 4000]
+
+
+def test_multicast_for_several_recipients(line, dispatcher):
+    assert dispatcher.send(['U1', 'U2', 'U1'], 'hello') is True
+    assert line.requests[0]['path'].endswith('/multicast')
+    assert line.requests[0]['to'] == ['U1', 'U2']
+
+
+def test_retries_server_errors_with_the_same_retry_key(line, dispatcher):
+    assert dispatcher.send('U1', 'RETRY') is True
+    assert len(line.requests) == 2
+    assert line.requests[0]['retry_key'] == line.requests[1]['retry_key']
+    assert dispatcher.stats['retries'] == 1
+
+
+def test_morning_summary_is_sent_even_if_check_fails(line, dispatcher, monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('LINE_USER_ID', 'U1')
+    from ipo_monitor import IPOMonitor, IPOSnapshot
+    monitor = IPOMonitor()
+    monitor.line = dispatcher
+    monkeypatch.setattr(monitor, 'get_snapshot', lambda max_age=None: IPOSnapshot([]))
+
+    def broken(snapshot=None, batch=None):
+        raise RuntimeError('store unavailable')
+    monkeypatch.setattr(monitor, 'run_check', broken)
+    monitor.daily_morning_check()
+    assert len(line.requests) == 1
+    assert 'おはようございます' in line.requests[0]['texts'][0]
@@ -0,0 +1,62 @@
+"""metrics の集計と Prometheus テキスト形式の出力（ラベル付きカウンター・タイマー）"""
+
+import pytest
+
+from metrics import Metrics
+
+
+@pytest.fixture
+def m():
+    return Metrics()
+
+
+def test_labeled_counters(m):
+    m.incr('rows', 3, source='ipo')
+    m.incr('rows', 2, source='ipo')
+    m.incr('rows', 7, source='geo')
+    m.incr('http_requests', source='ipo')
+    assert m.render_prometheus() == (
+        '# TYPE ipobot_http_requests_total counter\n'
+        'ipobot_http_requests_total{source="ipo"} 1\n'
+        '# TYPE ipobot_rows_total counter\n'
+        'ipobot_rows_total{source="geo"} 7\n'
+        'ipobot_rows_total{source="ipo"} 5\n')
+    assert m.total('rows') == 12
+    assert m.total('rows', source='ipo') == 5
+
+
+def test_labels_are_sorted_and_escaped(m):
+    m.incr('source_errors', site='a"b\\c\nd', status='error', source='ipo')
+    m.incr('unlabeled')
+    assert m.render_prometheus().splitlines()[1] == (
+        'ipobot_source_errors_total{site="a\\"b\\\\c\\nd",source="ipo",status="error"} 1')
+    assert 'ipobot_unlabeled_total 1' in m.render_prometheus().splitlines()
+
+
+def test_timers_render_as_summary_and_max(m):
+    m.observe('fetch', 0.5, source='ipo')
+    m.observe('fetch', 1.5, source='ipo')
+    m.observe('parse', 0.25, source='geo')
+    assert m.render_prometheus() == (
+        '# TYPE ipobot_stage_seconds summary\n'
+        'ipobot_stage_seconds_count{source="geo",stage="parse"} 1\n'
+        'ipobot_stage_seconds_sum{source="geo",stage="parse"} 0.250000\n'
+        'ipobot_stage_seconds_count{source="ipo",stage="fetch"} 2\n'
+        'ipobot_stage_seconds_sum{source="ipo",stage="fetch"} 2.000000\n'
+        '# TYPE ipobot_stage_seconds_max gauge\n'
+        'ipobot_stage_seconds_max{source="geo",stage="parse"} 0.250000\n'
+        'ipobot_stage_seconds_max{source="ipo",stage="fetch"} 1.500000\n')
+
+
+def test_timer_records_even_when_the_block_raises(m):
+    with pytest.raises(ValueError):
+        with m.timer('diff', source='ipo'):
+            raise ValueError
+    assert m.timers[(('source', 'ipo'), ('stage', 'diff'))][0] == 1
+
+
+def test_reset(m):
+    m.incr('rows')
+    m.observe('fetch', 1.0)
+    m.reset()
+    assert 'ipobot_' not in m.render_prometheus()
@@ -0,0 +1,80 @@
+"""CronTrigger.next_after（リスト・範囲・間隔）とジョブの揺らぎ（jitter）"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+import scheduler
+from scheduler import CronTrigger, IntervalTrigger, Job, _parse_cron_field
+
+
+@pytest.mark.parametrize('field, expected', [
+    ('*/15', {0, 15, 30, 45}),
+    ('5/15', {5, 20, 35, 50}),
+    ('10-30/10', {10, 20, 30}),
+    ('1,3,5', {1, 3, 5}),
+    ('1-3,50-59/5', {1, 2, 3, 50, 55}),
+    ('7', {7}),
+])
+def test_minute_field(field, expected):
+    assert _parse_cron_field(field, 0, 59) == expected
+
+
+@pytest.mark.parametrize('field', ['60', '5-1', '*/0', '-1'])
+def test_invalid_field(field):
+    with pytest.raises(ValueError):
+        _parse_cron_field(field, 0, 59)
+
+
+def _runs(expr, now, count=4):
+    trigger = CronTrigger(expr)
+    runs = []
+    for _ in range(count):
+        now = trigger.next_after(now)
+        runs.append(now)
+    return runs
+
+
+NOW = datetime(2026, 10, 16, 8, 7, 30)  # 金曜日
+
+
+def test_next_after_list():
+    assert _runs('0,30 8,20 * * *', NOW) == [
+        datetime(2026, 10, 16, 8, 30), datetime(2026, 10, 16, 20, 0),
+        datetime(2026, 10, 16, 20, 30), datetime(2026, 10, 17, 8, 0)]
+
+
+def test_next_after_range_of_weekdays():
+    # 平日の朝8時だけ（金曜の次は月曜）
+    assert _runs('0 8 * * 1-5', NOW, 2) == [datetime(2026, 10, 19, 8, 0), datetime(2026, 10, 20, 8, 0)]
+
+
+def test_next_after_step_from_offset():
+    assert _runs('5/15 * * * *', NOW) == [
+        datetime(2026, 10, 16, 8, 20), datetime(2026, 10, 16, 8, 35),
+        datetime(2026, 10, 16, 8, 50), datetime(2026, 10, 16, 9, 5)]
+
+
+def test_next_after_crosses_month_and_year():
+    assert _runs('0 0 1 */6 *', datetime(2026, 12, 31, 23, 59), 2) == [
+        datetime(2027, 1, 1), datetime(2027, 7, 1)]
+
+
+def test_day_or_weekday_when_both_given():
+    # 日と曜日の両方を指定すると、どちらかに合えば実行する（13日または金曜）
+    assert _runs('0 9 13 * 5', datetime(2026, 10, 10), 3) == [
+        datetime(2026, 10, 13, 9), datetime(2026, 10, 16, 9), datetime(2026, 10, 23, 9)]
+
+
+def test_jitter_stays_within_bound(monkeypatch):
+    job = Job('geo', lambda: None, IntervalTrigger(3600), jitter=120)
+    for fraction in (0.0, 0.5, 1.0):
+        monkeypatch.setattr(scheduler.random, 'uniform', lambda lo, hi: lo + (hi - lo) * fraction)
+        job.schedule_next(NOW)
+        assert job.next_run == NOW + timedelta(seconds=3600 + 120 * fraction)
+
+
+def test_no_jitter_is_exact():
+    job = Job('ipo', lambda: None, CronTrigger('0 8 * * *'))
+    job.schedule_next(NOW)
+    assert job.next_run == datetime(2026, 10, 17, 8, 0)